@@ -0,0 +1,217 @@
+"""Circulation statistics served from daily rollups.
+
+`loan_stats_daily` holds, per day and book, the loans opened, the loans returned and the
+total duration of those returned loans; `loan_stats_totals` holds the same figures per
+day for all books. The CRUD layer updates both in the same transaction as every borrow,
+return and history deletion, so the reports below read the rows of the requested
+window instead of scanning the whole history. `rebuild_loan_stats` recomputes them from
+`borrowings` and the archive in one grouped pass, to backfill existing history or
+repair drift.
+
+Run from the backend folder:
+    python -m app.analytics --rebuild
+"""
+import argparse
+import json
+import time
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, func, insert, delete, literal, union_all, desc, text, bindparam, Date
+from sqlalchemy.orm import Session
+from app.models import Book, Borrowing, ArchivedBorrowing, LoanStatsDaily, LoanStatsTotal
+from config import Config
+
+stats_table = LoanStatsDaily.__table__
+totals_table = LoanStatsTotal.__table__
+FIGURES = ('loans', 'returns', 'loan_seconds')
+
+def _upsert(table):
+    """Adds the given figures to a rollup row, creating it on the first event of its key.
+
+    Written as text because SQLAlchemy does not cache the compiled form of its
+    ON CONFLICT construct, and compiling it would cost more than running it."""
+    keys = [column.name for column in table.primary_key]
+    columns = ', '.join(keys + list(FIGURES))
+    values = ', '.join(f':{name}' for name in keys + list(FIGURES))
+    updates = ', '.join(f'{name} = {name} + excluded.{name}' for name in FIGURES)
+    return text(
+        f"INSERT INTO {table.name} ({columns}) VALUES ({values}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    ).bindparams(bindparam('day', type_=Date))
+
+_ADD_STATS = _upsert(stats_table)
+_ADD_TOTALS = _upsert(totals_table)
+
+### --- Incremental Updates --- ###
+
+def _add_stats(db: Session, rows: list[dict]):
+    """Adds per-book figures to the rollups, and their sums to the day totals."""
+    if not rows:
+        return
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['day'], {'day': row['day'], 'loans': 0, 'returns': 0, 'loan_seconds': 0.0})
+        for name in FIGURES:
+            total[name] += row[name]
+    db.execute(_ADD_STATS, rows)
+    db.execute(_ADD_TOTALS, list(totals.values()))
+
+def record_loans(db: Session, book_ids, when: datetime):
+    """Counts one new loan of each of `book_ids`, in the caller's transaction."""
+    _add_stats(db, [
+        {'day': when.date(), 'book_id': book_id, 'loans': 1, 'returns': 0, 'loan_seconds': 0.0}
+        for book_id in book_ids
+    ])
+
+def record_returns(db: Session, returned, when: datetime):
+    """Counts the loans closed at `when`, given as (book_id, borrow_date) pairs, in the
+    caller's transaction."""
+    _add_stats(db, [
+        {'day': when.date(), 'book_id': book_id, 'loans': 0, 'returns': 1,
+         'loan_seconds': (when - borrow_date).total_seconds() if borrow_date else 0.0}
+        for book_id, borrow_date in returned
+    ])
+
+def _history_rollup(live_condition=None, archive_condition=None):
+    """Groups borrowings and archived borrowings into rollup rows, in the database.
+
+    Each loan contributes to the day it was opened and, once returned, to the day it
+    was closed. Without conditions this covers the whole history; with them, only the
+    matching rows of each table (None for a condition skips that table)."""
+    parts = []
+    for model, condition in ((Borrowing, live_condition), (ArchivedBorrowing, archive_condition)):
+        if condition is None:
+            continue
+        seconds = (func.julianday(model.return_date) - func.julianday(model.borrow_date)) * 86400
+        parts.append(select(
+            func.date(model.borrow_date).label('day'), model.book_id,
+            literal(1).label('loans'), literal(0).label('returns'), literal(0.0).label('loan_seconds')
+        ).where(condition, model.borrow_date.is_not(None)))
+        parts.append(select(
+            func.date(model.return_date), model.book_id, literal(0), literal(1), func.coalesce(seconds, 0.0)
+        ).where(condition, model.return_date.is_not(None)))
+    events = union_all(*parts).subquery()
+    return select(
+        events.c.day, events.c.book_id,
+        func.sum(events.c.loans), func.sum(events.c.returns), func.sum(events.c.loan_seconds)
+    ).group_by(events.c.day, events.c.book_id)
+
+def discount_loan_stats(db: Session, live_condition=None, archive_condition=None):
+    """Removes the history rows matching the conditions (see `_history_rollup`) from the
+    rollups before they are deleted, in the caller's transaction."""
+    _add_stats(db, [
+        {'day': date.fromisoformat(day), 'book_id': book_id, 'loans': -loans, 'returns': -returns,
+         'loan_seconds': -seconds}
+        for day, book_id, loans, returns, seconds in db.execute(_history_rollup(live_condition, archive_condition))
+    ])
+
+def rebuild_loan_stats(db: Session) -> dict:
+    """Recomputes every rollup row from the full history in one transaction.
+
+    The aggregation is a single grouped pass inside SQLite, but writers wait for it, so
+    run it off-peak on large histories (or as a `rebuild_loan_stats` job)."""
+    start = time.perf_counter()
+    db.execute(delete(LoanStatsDaily), execution_options={'synchronize_session': False})
+    db.execute(delete(LoanStatsTotal), execution_options={'synchronize_session': False})
+    rows = db.execute(insert(stats_table).from_select(
+        ['day', 'book_id', *FIGURES], _history_rollup(True, True)
+    )).rowcount
+    db.execute(insert(totals_table).from_select(
+        ['day', *FIGURES],
+        select(stats_table.c.day, *(func.sum(stats_table.c[name]) for name in FIGURES)).group_by(stats_table.c.day)
+    ))
+    db.commit()
+    return {'rows': rows, 'elapsed': round(time.perf_counter() - start, 3)}
+
+### --- Reports --- ###
+
+def stats_window(days: int, end: date | None = None) -> tuple[date, date]:
+    """The `days` (at most STATS_MAX_DAYS) UTC days ending with `end`, by default today."""
+    end = end or datetime.utcnow().date()
+    days = max(1, min(days, Config.STATS_MAX_DAYS))
+    return end - timedelta(days=days - 1), end
+
+def _in_window(model, start: date, end: date):
+    return model.day.between(start, end)
+
+def _average_days(seconds, returns) -> float | None:
+    return round(seconds / returns / 86400, 2) if returns else None
+
+def get_circulation_summary(db: Session, start: date, end: date) -> dict:
+    """Loans opened and returned in the window, and the average duration of the returned ones."""
+    loans, returns, seconds = db.execute(
+        select(
+            func.coalesce(func.sum(LoanStatsTotal.loans), 0),
+            func.coalesce(func.sum(LoanStatsTotal.returns), 0),
+            func.coalesce(func.sum(LoanStatsTotal.loan_seconds), 0.0)
+        ).where(_in_window(LoanStatsTotal, start, end))
+    ).one()
+    return {
+        'start': start.isoformat(), 'end': end.isoformat(),
+        'loans': loans, 'returns': returns, 'average_loan_days': _average_days(seconds, returns)
+    }
+
+def get_daily_loans(db: Session, start: date, end: date) -> list[dict]:
+    """Loans opened and returned per day, including days without any."""
+    rows = {
+        day: (loans, returns, seconds) for day, loans, returns, seconds in db.execute(
+            select(LoanStatsTotal.day, LoanStatsTotal.loans, LoanStatsTotal.returns, LoanStatsTotal.loan_seconds)
+            .where(_in_window(LoanStatsTotal, start, end))
+        )
+    }
+    daily = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        loans, returns, seconds = rows.get(day, (0, 0, 0.0))
+        daily.append({'day': day.isoformat(), 'loans': loans, 'returns': returns,
+                      'average_loan_days': _average_days(seconds, returns)})
+    return daily
+
+def get_top_books(db: Session, start: date, end: date, limit: int = 10) -> list[dict]:
+    """The books lent most often in the window; deleted books are left out."""
+    loans = func.sum(LoanStatsDaily.loans).label('loans')
+    totals = select(LoanStatsDaily.book_id, loans) \
+        .where(_in_window(LoanStatsDaily, start, end), LoanStatsDaily.loans > 0) \
+        .group_by(LoanStatsDaily.book_id).subquery()
+    rows = db.execute(
+        select(Book.id, Book.title, Book.author, Book.genre, totals.c.loans)
+        .join(totals, totals.c.book_id == Book.id)
+        .order_by(desc(totals.c.loans), Book.id)
+        .limit(limit)
+    )
+    return [row._asdict() for row in rows]
+
+def get_genre_demand(db: Session, start: date, end: date) -> list[dict]:
+    """Loans opened per genre in the window, busiest first; deleted books are left out."""
+    # Summed per book first, so each book is looked up once rather than once per day
+    totals = select(LoanStatsDaily.book_id, func.sum(LoanStatsDaily.loans).label('loans')) \
+        .where(_in_window(LoanStatsDaily, start, end), LoanStatsDaily.loans > 0) \
+        .group_by(LoanStatsDaily.book_id).subquery()
+    loans = func.sum(totals.c.loans).label('loans')
+    rows = db.execute(
+        select(Book.genre, loans, func.count().label('books'))
+        .join(totals, totals.c.book_id == Book.id)
+        .group_by(Book.genre)
+        .order_by(desc(loans), Book.genre)
+    )
+    return [row._asdict() for row in rows]
+
+if __name__ == '__main__':
+    from db.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from the history first")
+    parser.add_argument("--days", type=int, default=Config.STATS_DEFAULT_DAYS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.rebuild:
+            print(json.dumps(rebuild_loan_stats(db)))
+        start, end = stats_window(args.days)
+        print(json.dumps({
+            'summary': get_circulation_summary(db, start, end),
+            'top_books': get_top_books(db, start, end),
+            'genres': get_genre_demand(db, start, end),
+        }, indent=2))
+    finally:
+        db.close()
@@ -1,53 +1,101 @@
-from flask import Blueprint, request, jsonify
+import io
+from datetime import date
+from functools import partial
+from flask import Blueprint, request, jsonify, session
 from app.crud import (
-    get_all_books, get_book_by_id, create_book, update_book, delete_book,
+    get_books_page, get_book_row, create_book, update_book, get_book_by_id,
     get_all_users_with_borrowing_status, get_user_borrowings, borrow_book, return_book,
-    delete_user
+    borrow_books, return_books, MAX_BATCH_ITEMS,
+    place_hold, cancel_hold, get_hold_position, get_user_holds,
+    delete_user, get_user_by_id, DEFAULT_PAGE_SIZE, USER_BORROWING, iter_books, iter_users, iter_borrowing_history
 )
-from app.utils import login_required, role_required
-from db.database import get_db
+from app.analytics import (
+    stats_window, get_circulation_summary, get_daily_loans, get_top_books, get_genre_demand
+)
+from app.archive import archive_borrowings
+from app.export import EXPORT_FORMATS, export_response
+from app.jobs import submit_job, get_job, list_jobs, cancel_job, retry_job, save_upload, job_to_dict
+from app.importer import IMPORT_FORMATS, DEFAULT_BATCH_SIZE, detect_format, iter_records, import_books
+from app.utils import login_required, role_required, get_page_args
+from app.cache import catalog_cache
+from app.fragments import user_stamps
+from app.responses import conditional
+from app.serialization import BOOK
+from db.database import get_request_db, get_request_report_db, get_report_stamp, get_pool_metrics, get_report_metrics
+from config import Config
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
 # --- Book Endpoints ---
+def _page_to_dict(page: dict) -> dict:
+    return {
+        'books': BOOK.dump_all(page['books']),
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor']
+    }
+
 @api.route('/books', methods=['GET'])
 @login_required
 @role_required('admin')
+@conditional(lambda: catalog_cache.version)
 def api_get_books():
-    db = next(get_db())
-    books = get_all_books(db)
-    return jsonify([{
-        'id': b.id, 'title': b.title, 'author': b.author, 'genre': b.genre,
-        'total_copies': b.total_copies, 'available_copies': b.available_copies
-    } for b in books])
+    db = get_request_db()
+    try:
+        page = get_books_page(db, **get_page_args(DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_page_to_dict(page))
 
 @api.route('/books/<int:book_id>', methods=['GET'])
 @login_required
 @role_required('admin')
+@conditional(lambda book_id: catalog_cache.version)
 def api_get_book(book_id):
-    db = next(get_db())
-    book = get_book_by_id(db, book_id)
+    db = get_request_db()
+    book = get_book_row(db, book_id)
     if not book:
         return jsonify({'error': 'Book not found'}), 404
-    return jsonify({
-        'id': book.id, 'title': book.title, 'author': book.author, 'genre': book.genre,
-        'total_copies': book.total_copies, 'available_copies': book.available_copies
-    })
+    return jsonify(BOOK.dump(book))
 
 @api.route('/books', methods=['POST'])
 @login_required
 @role_required('admin')
 def api_create_book():
-    db = next(get_db())
+    db = get_request_db()
     data = request.get_json()
     book = create_book(db, data['title'], data['author'], data['genre'], data['copies'])
     return jsonify({'id': book.id}), 201
 
+@api.route('/books/import', methods=['POST'])
+@login_required
+@role_required('admin')
+def api_import_books():
+    # Accepts a multipart 'file' upload or a raw CSV/JSONL request body
+    upload = request.files.get('file')
+    fmt = detect_format(upload.filename if upload else None, request.args.get('format'))
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format, use one of: {', '.join(IMPORT_FORMATS)}"}), 400
+    try:
+        batch_size = max(1, int(request.args.get('batch_size', DEFAULT_BATCH_SIZE)))
+    except ValueError:
+        return jsonify({'error': 'Invalid batch_size'}), 400
+
+    if request.args.get('async') == '1':
+        # Large files: store the upload and import it on the job runner
+        path = save_upload(upload.stream if upload else request.stream, fmt)
+        job = submit_job(get_request_db(), 'import_books',
+                         {'path': path, 'format': fmt, 'batch_size': batch_size}, session.get('user_id'))
+        return jsonify(job_to_dict(job)), 202
+
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8', newline='')
+    report = import_books(get_request_db(), iter_records(stream, fmt), batch_size)
+    return jsonify(report)
+
 @api.route('/books/<int:book_id>', methods=['PUT'])
 @login_required
 @role_required('admin')
 def api_update_book(book_id):
-    db = next(get_db())
+    db = get_request_db()
     data = request.get_json()
     book = update_book(db, book_id, data['title'], data['author'], data['genre'], data['copies'])
     if not book:
@@ -58,38 +106,184 @@ def api_update_book(book_id):
 @login_required
 @role_required('admin')
 def api_delete_book(book_id):
-    db = next(get_db())
-    if delete_book(db, book_id):
-        return jsonify({'result': 'success'})
-    return jsonify({'error': 'Book not found'}), 404
+    db = get_request_db()
+    if not get_book_by_id(db, book_id):
+        return jsonify({'error': 'Book not found'}), 404
+    # Deleting a book rewrites its loan history, so it runs on the job runner
+    job = submit_job(db, 'delete_book', {'book_id': book_id}, session.get('user_id'))
+    return jsonify(job_to_dict(job)), 202
 
 # --- User Endpoints ---
 @api.route('/users', methods=['GET'])
 @login_required
 @role_required('admin')
+@conditional(lambda: get_report_stamp(get_request_report_db()))
 def api_get_users():
-    db = next(get_db())
-    users = get_all_users_with_borrowing_status(db)
+    # Reporting read: served from the report database (see get_report_session), and
+    # tagged with the stamp of its data, which may lag the live one
+    db = get_request_report_db()
+    # ?include_titles=1 adds the titles each user has on loan (joins every active loan)
+    users = get_all_users_with_borrowing_status(db, include_titles=request.args.get('include_titles') == '1')
     return jsonify(users)
 
 @api.route('/users/<int:user_id>/borrowings', methods=['GET'])
 @login_required
 @role_required('admin')
+@conditional(lambda user_id: user_stamps.user_stamp(user_id))
 def api_get_user_borrowings(user_id):
-    db = next(get_db())
-    borrowings = get_user_borrowings(db, user_id)
-    return jsonify([
-        {'id': b.id, 'book_id': b.book_id, 'borrow_date': b.borrow_date.isoformat(),
-         'return_date': b.return_date.isoformat() if b.return_date else None, 'status': b.status}
-        for b in borrowings
-    ])
+    db = get_request_db()
+    # ?include_archived=1 merges in history moved to the archive
+    include_archived = request.args.get('include_archived') == '1'
+    schema = USER_BORROWING.extend('archived') if include_archived else USER_BORROWING
+    return jsonify(schema.dump_all(get_user_borrowings(db, user_id, include_archived)))
+
+# --- Export Endpoints ---
+EXPORTS = {
+    'books': iter_books,
+    'users': iter_users,
+    'borrowings': iter_borrowing_history,
+    'history': partial(iter_borrowing_history, include_archived=True),
+}
+
+@api.route('/export/<string:resource>', methods=['GET'])
+@login_required
+@role_required('admin')
+def api_export(resource):
+    # Streams the whole table as NDJSON (default), CSV or a JSON array
+    fmt = request.args.get('format', 'ndjson')
+    if resource not in EXPORTS:
+        return jsonify({'error': 'Unknown export resource'}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    return export_response(EXPORTS[resource], fmt, resource)
+
+# --- Statistics Endpoints ---
+STATS_REPORTS = {
+    'summary': get_circulation_summary,
+    'daily': get_daily_loans,
+    'top-books': get_top_books,
+    'genres': get_genre_demand,
+}
+
+@api.route('/stats', methods=['GET'], defaults={'report': 'summary'})
+@api.route('/stats/<string:report>', methods=['GET'])
+@login_required
+@role_required('admin')
+def api_get_stats(report):
+    # Reads the daily rollups over ?days (default from Config) ending today or ?end=YYYY-MM-DD
+    if report not in STATS_REPORTS:
+        return jsonify({'error': 'Unknown report'}), 404
+    try:
+        days = int(request.args.get('days', Config.STATS_DEFAULT_DAYS))
+        end = request.args.get('end')
+        start, end = stats_window(days, date.fromisoformat(end) if end else None)
+        options = {'limit': min(max(1, int(request.args.get('limit', 10))), 100)} if report == 'top-books' else {}
+    except ValueError:
+        return jsonify({'error': 'days and limit must be integers and end a YYYY-MM-DD date'}), 400
+    return jsonify(STATS_REPORTS[report](get_request_db(), start, end, **options))
+
+# --- Database Endpoints ---
+@api.route('/db/pool', methods=['GET'])
+@login_required
+@role_required('admin')
+def api_get_pool_metrics():
+    return jsonify({**get_pool_metrics(), 'report': get_report_metrics()})
+
+@api.route('/db/archive', methods=['POST'])
+@login_required
+@role_required('admin')
+def api_archive_borrowings():
+    # Moves old returned loans to the archive table; defaults come from Config
+    try:
+        older_than_days = int(request.args.get('older_than_days', Config.ARCHIVE_AFTER_DAYS))
+        batch_size = max(1, int(request.args.get('batch_size', Config.ARCHIVE_BATCH_SIZE)))
+    except ValueError:
+        return jsonify({'error': 'older_than_days and batch_size must be integers'}), 400
+    return jsonify(archive_borrowings(get_request_db(), older_than_days, batch_size))
+
+@api.route('/cache', methods=['GET'])
+@login_required
+@role_required('admin')
+def api_get_cache_stats():
+    return jsonify(catalog_cache.stats())
+
+# --- Job Endpoints ---
+@api.route('/jobs', methods=['POST'])
+@login_required
+@role_required('admin')
+def api_submit_job():
+    # JSON: {kind, params}; the job runs in the background, poll /api/jobs/<id> for status
+    data = request.get_json(silent=True) or {}
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'error': 'params must be an object'}), 400
+    try:
+        job = submit_job(get_request_db(), data.get('kind'), params, session.get('user_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(job_to_dict(job)), 202
+
+@api.route('/jobs', methods=['GET'])
+@login_required
+@role_required('admin')
+def api_list_jobs():
+    try:
+        limit = min(max(1, int(request.args.get('limit', 50))), 500)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    jobs = list_jobs(get_request_db(), request.args.get('status'), limit)
+    return jsonify([job_to_dict(job) for job in jobs])
+
+@api.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+@role_required('admin')
+def api_get_job(job_id):
+    job = get_job(get_request_db(), job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_dict(job))
+
+@api.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+@role_required('admin')
+def api_cancel_job(job_id):
+    result = cancel_job(get_request_db(), job_id)
+    if isinstance(result, str):
+        return jsonify({'error': result}), 404 if result == "Job not found." else 409
+    return jsonify(job_to_dict(result))
+
+@api.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+@role_required('admin')
+def api_retry_job(job_id):
+    result = retry_job(get_request_db(), job_id)
+    if isinstance(result, str):
+        return jsonify({'error': result}), 404 if result == "Job not found." else 409
+    return jsonify(job_to_dict(result))
 
 # --- Borrowing Endpoints (for users) ---
+INVALID_USER_ID = {'error': 'user_id must be the id of an existing user'}
+LOANS_FORBIDDEN = {'error': 'Only admins can borrow or return books for other users'}
+
+def _circulation_user_id(db, data: dict):
+    # The caller's own loans; admins may name another existing user with user_id (as for
+    # holds). Returns (user_id, None), or (None, error response).
+    requested = data.get('user_id')
+    if requested is None or requested == session.get('user_id'):
+        return session.get('user_id'), None
+    if session.get('user_role') != 'admin':
+        return None, (jsonify(LOANS_FORBIDDEN), 403)
+    if not isinstance(requested, int) or isinstance(requested, bool) or not get_user_by_id(db, requested):
+        return None, (jsonify(INVALID_USER_ID), 400)
+    return requested, None
+
 @api.route('/borrow/<int:book_id>', methods=['POST'])
 @login_required
 def api_borrow_book(book_id):
-    db = next(get_db())
-    user_id = request.json.get('user_id')
+    db = get_request_db()
+    user_id, error = _circulation_user_id(db, request.get_json(silent=True) or {})
+    if error:
+        return error
     result = borrow_book(db, user_id, book_id)
     if isinstance(result, str):
         return jsonify({'error': result}), 400
@@ -98,17 +292,111 @@ def api_borrow_book(book_id):
 @api.route('/return/<int:book_id>', methods=['POST'])
 @login_required
 def api_return_book(book_id):
-    db = next(get_db())
-    user_id = request.json.get('user_id')
+    db = get_request_db()
+    user_id, error = _circulation_user_id(db, request.get_json(silent=True) or {})
+    if error:
+        return error
     result = return_book(db, user_id, book_id)
     if isinstance(result, str):
         return jsonify({'error': result}), 400
     return jsonify({'id': result.id})
 
+def _run_batch(operation):
+    # Shared request parsing for the batch circulation endpoints
+    data = request.get_json(silent=True) or {}
+    book_ids = data.get('book_ids')
+    if (not isinstance(book_ids, list) or not book_ids
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in book_ids)):
+        return jsonify({'error': 'book_ids must be a non-empty list of integers'}), 400
+    if len(book_ids) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'At most {MAX_BATCH_ITEMS} books per request'}), 400
+    db = get_request_db()
+    user_id, error = _circulation_user_id(db, data)
+    if error:
+        return error
+    atomic = bool(data.get('atomic', True))
+    results = operation(db, user_id, book_ids, atomic=atomic)
+    succeeded = sum(1 for item in results if item['ok'])
+    body = {'atomic': atomic, 'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results}
+    # All-or-nothing batches that did not go through changed nothing
+    return jsonify(body), 400 if atomic and succeeded < len(results) else 200
+
+@api.route('/borrow/batch', methods=['POST'])
+@login_required
+def api_borrow_books():
+    return _run_batch(borrow_books)
+
+@api.route('/return/batch', methods=['POST'])
+@login_required
+def api_return_books():
+    return _run_batch(return_books)
+
+# --- Hold Endpoints ---
+HOLDS_FORBIDDEN = {'error': "Only admins can manage other users' holds"}
+
+def _hold_user_id():
+    # The caller's own holds; admins may name another user with an explicit user_id.
+    # None when the caller may not act for the requested user.
+    data = request.get_json(silent=True) or {}
+    requested = data.get('user_id') or request.args.get('user_id', type=int)
+    if not requested or requested == session.get('user_id'):
+        return session.get('user_id')
+    if session.get('user_role') != 'admin' or not isinstance(requested, int) or isinstance(requested, bool):
+        return None
+    return requested
+
+def _hold_to_dict(item: dict) -> dict:
+    return {**item, 'created_at': item['created_at'].isoformat()}
+
+@api.route('/holds', methods=['GET'])
+@login_required
+def api_get_holds():
+    db = get_request_db()
+    user_id = _hold_user_id()
+    if user_id is None:
+        return jsonify(HOLDS_FORBIDDEN), 403
+    return jsonify([_hold_to_dict(item) for item in get_user_holds(db, user_id)])
+
+@api.route('/holds/<int:book_id>', methods=['POST'])
+@login_required
+def api_place_hold(book_id):
+    db = get_request_db()
+    user_id = _hold_user_id()
+    if user_id is None:
+        return jsonify(HOLDS_FORBIDDEN), 403
+    result = place_hold(db, user_id, book_id)
+    if isinstance(result, str):
+        return jsonify({'error': result}), 404 if result == "Book not found." else 400
+    return jsonify(_hold_to_dict(result)), 201
+
+@api.route('/holds/<int:book_id>', methods=['GET'])
+@login_required
+def api_get_hold_position(book_id):
+    # Cheap enough to poll: two counts on the (book_id, created_at, id) index
+    db = get_request_db()
+    user_id = _hold_user_id()
+    if user_id is None:
+        return jsonify(HOLDS_FORBIDDEN), 403
+    result = get_hold_position(db, user_id, book_id)
+    if result is None:
+        return jsonify({'error': 'Not on the waitlist for this book'}), 404
+    return jsonify(_hold_to_dict(result))
+
+@api.route('/holds/<int:book_id>', methods=['DELETE'])
+@login_required
+def api_cancel_hold(book_id):
+    db = get_request_db()
+    user_id = _hold_user_id()
+    if user_id is None:
+        return jsonify(HOLDS_FORBIDDEN), 403
+    if cancel_hold(db, user_id, book_id):
+        return jsonify({'result': 'Hold cancelled'})
+    return jsonify({'error': 'Not on the waitlist for this book'}), 404
+
 @api.route('/users/me', methods=['DELETE'])
 @login_required
 def api_delete_own_account():
-    db = next(get_db())
+    db = get_request_db()
     user_id = getattr(request, 'user_id', None) or (getattr(request, 'user', None) and request.user.id) or None
     # Fallback: try session if using Flask-Login or session
     from flask import session
@@ -121,8 +409,7 @@ def api_delete_own_account():
         session.clear()
         return jsonify({'result': 'Account deleted'})
     # Check if user exists and has active borrowings
-    from app.models import Borrowing
-    active_borrowings = db.query(Borrowing).filter(Borrowing.user_id == user_id, Borrowing.status == 'borrowed').count()
-    if active_borrowings > 0:
+    user = get_user_by_id(db, user_id)
+    if user and user.active_loans > 0:
         return jsonify({'error': 'You cannot delete your account while you have borrowed books. Please return all books first.'}), 400
     return jsonify({'error': 'User not found'}), 404
@@ -0,0 +1,91 @@
+"""Moves old returned loans from `borrowings` into `borrowings_archive`.
+
+Each batch is copied and deleted in its own short transaction, so archiving can run
+while the app is serving requests. Run from the backend folder:
+    python -m app.archive --older-than-days 365 --batch-size 1000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, literal, text
+from sqlalchemy.orm import Session
+from app.models import Book, Borrowing, ArchivedBorrowing
+from app.fragments import touch_users
+from config import Config
+
+def move_to_archive(db: Session, condition, limit: int | None = None) -> int:
+    """Moves returned borrowings matching `condition` to the archive in the caller's transaction.
+
+    Returns the number of rows moved; at most `limit` if given (oldest returns first)."""
+    # Literal status so SQLite can match the partial index on returned loans
+    ids_query = select(Borrowing.id).where(text("borrowings.status = 'returned'"), condition).order_by(Borrowing.return_date)
+    if limit is not None:
+        ids_query = ids_query.limit(limit)
+    ids = db.execute(ids_query).scalars().all()
+    if not ids:
+        return 0
+
+    archived_at = datetime.utcnow()
+    db.execute(insert(ArchivedBorrowing).from_select(
+        ['id', 'user_id', 'book_id', 'book_title', 'borrow_date', 'return_date', 'status', 'archived_at'],
+        select(
+            Borrowing.id, Borrowing.user_id, Borrowing.book_id, Book.title,
+            Borrowing.borrow_date, Borrowing.return_date, Borrowing.status, literal(archived_at)
+        ).outerjoin(Book, Book.id == Borrowing.book_id).where(Borrowing.id.in_(ids))
+    ))
+    db.execute(
+        delete(Borrowing).where(Borrowing.id.in_(ids)),
+        execution_options={'synchronize_session': False}
+    )
+    touch_users(db)
+    return len(ids)
+
+def archive_borrowings(
+    db: Session,
+    older_than_days: int = Config.ARCHIVE_AFTER_DAYS,
+    batch_size: int = Config.ARCHIVE_BATCH_SIZE,
+    pause_ms: int = Config.ARCHIVE_BATCH_PAUSE_MS,
+    max_batches: int | None = None,
+    progress=None,
+) -> dict:
+    """Archives loans returned more than `older_than_days` ago, committing after every batch.
+
+    The loan counters are unaffected because they count archived rows too.
+    `progress(report)` is called after every committed batch."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    start = time.perf_counter()
+    report = {'cutoff': cutoff.isoformat(), 'archived': 0, 'batches': 0, 'elapsed': 0.0}
+    while max_batches is None or report['batches'] < max_batches:
+        count = move_to_archive(db, Borrowing.return_date < cutoff, limit=batch_size)
+        db.commit()
+        if not count:
+            break
+        report['archived'] += count
+        report['batches'] += 1
+        report['elapsed'] = round(time.perf_counter() - start, 3)
+        if progress:
+            progress(report)
+        if count < batch_size:
+            break
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+    report['elapsed'] = round(time.perf_counter() - start, 3)
+    return report
+
+if __name__ == '__main__':
+    from db.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--older-than-days", type=int, default=Config.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=Config.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=int, default=Config.ARCHIVE_BATCH_PAUSE_MS)
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = archive_borrowings(db, args.older_than_days, args.batch_size, args.pause_ms, args.max_batches)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,245 @@
+"""ASGI adapter for the Flask app, used by the `asgi.py` entry point.
+
+Concurrency model, per worker process:
+- The event loop accepts connections and serves the hot read endpoints natively
+  (`NATIVE_ROUTES`) through the async engine, so polling clients never wait for a thread.
+- Every other request runs the Flask app (all blueprints, unchanged) on a pool of
+  Config.ASGI_THREADS threads. Availability streams get a separate pool of
+  Config.EVENTS_MAX_SUBSCRIBERS + 1 threads, so open streams cannot starve normal views.
+- A native route hands the request to Flask whenever it would not answer with JSON
+  (not logged in, wrong role, a request body), so redirects and flashed messages stay
+  exactly as they are.
+"""
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from itsdangerous import BadSignature
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie
+from app import crud_async
+from app.api import _page_to_dict, _hold_to_dict, HOLDS_FORBIDDEN
+from app.cache import catalog_cache
+from app.crud import DEFAULT_PAGE_SIZE
+from app.responses import make_etag, etag_matches, compress
+from app.serialization import BOOK, dumps
+from app.utils import get_page_args
+from db.database import get_async_sessionmaker, dispose_async_engine
+from config import Config
+
+# Long-lived responses, run on the stream pool
+STREAM_PATHS = ('/events/availability',)
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    """Runs one request through the WSGI app on `executor`.
+
+    asgiref's own adapter runs every request on a single shared thread and never closes
+    the response, which would serialize the app and leak availability subscriptions."""
+
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+        self.disconnected = False
+
+    async def __call__(self, scope, receive, send):
+        self.receive = receive
+        await super().__call__(scope, receive, send)
+
+    async def run_wsgi_app(self, body):
+        watcher = asyncio.create_task(self._watch_disconnect())
+        try:
+            await sync_to_async(self._run, thread_sensitive=False, executor=self.executor)(body)
+        finally:
+            watcher.cancel()
+
+    async def _watch_disconnect(self):
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+        self.disconnected = True
+
+    def _run(self, body):
+        iterable = self.wsgi_application(self.build_environ(self.scope, body), self.start_response)
+        try:
+            for output in iterable:
+                # Streams notice a client that went away at their next keepalive
+                if self.disconnected:
+                    return
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if output:
+                    self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+            if not self.response_started:
+                self.response_started = True
+                self.sync_send(self.response_start)
+            self.sync_send({'type': 'http.response.body'})
+        finally:
+            # Runs the response's close callbacks (the availability stream unsubscribes here)
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+class NativeRequest:
+    """The parts of an ASGI request the native routes need."""
+
+    def __init__(self, scope, headers: dict, session: dict):
+        self.path = scope['path']
+        self.query_string = scope['query_string']
+        self.args = MultiDict(parse_qsl(self.query_string.decode('latin1'), keep_blank_values=True))
+        self.headers = headers
+        self.session = session
+        self.etag = None
+
+    def not_modified(self, stamp) -> bool:
+        """Like the `conditional` decorator: tags the response and tells whether the
+        client's copy is current."""
+        if not Config.ETAG_ENABLED:
+            return False
+        self.etag = make_etag(self.path, self.query_string, stamp)
+        return etag_matches(self.headers.get(b'if-none-match', b'').decode('latin1'), self.etag)
+
+# --- Native Routes ---
+# Each returns (status, body) or None to let Flask answer instead. They mirror the
+# handlers in app/api.py, including the decorators' checks.
+
+def _is_admin(request: NativeRequest) -> bool:
+    return 'user_id' in request.session and request.session.get('user_role') == 'admin'
+
+def _hold_user_id(request: NativeRequest):
+    # As in app/api.py: another user's holds only for admins, None otherwise
+    requested = request.args.get('user_id', type=int)
+    if not requested or requested == request.session.get('user_id'):
+        return request.session.get('user_id')
+    return requested if _is_admin(request) else None
+
+async def _get_books(db, request: NativeRequest):
+    if not _is_admin(request):
+        return None
+    if request.not_modified(catalog_cache.version):
+        return 304, None
+    try:
+        page = await crud_async.get_books_page(db, **get_page_args(DEFAULT_PAGE_SIZE, request.args))
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    return 200, _page_to_dict(page)
+
+async def _get_book(db, request: NativeRequest, book_id: int):
+    if not _is_admin(request):
+        return None
+    if request.not_modified(catalog_cache.version):
+        return 304, None
+    book = await crud_async.get_book_row(db, book_id)
+    if not book:
+        return 404, {'error': 'Book not found'}
+    return 200, BOOK.dump(book)
+
+async def _get_holds(db, request: NativeRequest):
+    if 'user_id' not in request.session:
+        return None
+    user_id = _hold_user_id(request)
+    if user_id is None:
+        return 403, HOLDS_FORBIDDEN
+    return 200, [_hold_to_dict(item) for item in await crud_async.get_user_holds(db, user_id)]
+
+async def _get_hold_position(db, request: NativeRequest, book_id: int):
+    if 'user_id' not in request.session:
+        return None
+    user_id = _hold_user_id(request)
+    if user_id is None:
+        return 403, HOLDS_FORBIDDEN
+    result = await crud_async.get_hold_position(db, user_id, book_id)
+    if result is None:
+        return 404, {'error': 'Not on the waitlist for this book'}
+    return 200, _hold_to_dict(result)
+
+NATIVE_ROUTES = [
+    (re.compile(r'/api/books'), _get_books),
+    (re.compile(r'/api/books/(\d+)'), _get_book),
+    (re.compile(r'/api/holds'), _get_holds),
+    (re.compile(r'/api/holds/(\d+)'), _get_hold_position),
+]
+
+class LibraryASGI:
+    """ASGI application serving `flask_app`, with the native read routes in front of it."""
+
+    def __init__(self, flask_app, threads: int = Config.ASGI_THREADS, async_reads: bool = Config.ASGI_ASYNC_READS):
+        self.flask_app = flask_app
+        self.async_reads = async_reads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        # One spare thread, so the request over the limit still gets its 503
+        self.stream_executor = ThreadPoolExecutor(
+            max_workers=Config.EVENTS_MAX_SUBSCRIBERS + 1, thread_name_prefix='asgi-stream'
+        )
+        self.session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.session_cookie = flask_app.config['SESSION_COOKIE_NAME']
+        self.session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        path = scope['path']
+        if self.async_reads and scope['method'] == 'GET' and await self._native(scope, path, send):
+            return
+        executor = self.stream_executor if path in STREAM_PATHS else self.executor
+        await PooledWsgiInstance(self.flask_app, executor)(scope, receive, send)
+
+    def _session(self, headers: dict) -> dict:
+        """Decodes Flask's signed session cookie; an invalid or missing one is an empty session."""
+        value = parse_cookie(headers.get(b'cookie', b'').decode('latin1')).get(self.session_cookie)
+        if not value:
+            return {}
+        try:
+            return self.session_serializer.loads(value, max_age=self.session_max_age)
+        except BadSignature:
+            return {}
+
+    async def _native(self, scope, path: str, send) -> bool:
+        """Answers the request on the event loop if a native route takes it."""
+        for pattern, handler in NATIVE_ROUTES:
+            match = pattern.fullmatch(path)
+            if match:
+                break
+        else:
+            return False
+        headers = dict(scope['headers'])
+        # A body can carry a user_id (see _hold_user_id in app/api.py): leave it to Flask
+        if headers.get(b'content-length', b'0') != b'0' or b'transfer-encoding' in headers:
+            return False
+        request = NativeRequest(scope, headers, self._session(headers))
+        async with get_async_sessionmaker()() as db:
+            result = await handler(db, request, *(int(arg) for arg in match.groups()))
+        if result is None:
+            return False
+        status, data = result
+        # Flask adds Vary: Cookie whenever a view reads the session
+        response_headers = [(b'vary', b'Cookie')]
+        if request.etag is not None and status in (200, 304):
+            response_headers += [(b'etag', f'W/"{request.etag}"'.encode()), (b'cache-control', b'private, no-cache')]
+        body = b''
+        if status != 304:
+            body = dumps(data) + b'\n'
+            response_headers.append((b'content-type', b'application/json'))
+            if status == 200 and Config.COMPRESSION_ENABLED:
+                response_headers[0] = (b'vary', b'Cookie, Accept-Encoding')
+                compressed = compress(body, headers.get(b'accept-encoding', b'').decode('latin1'))
+                if compressed is not None:
+                    body, encoding = compressed
+                    response_headers.append((b'content-encoding', encoding.encode()))
+            response_headers.append((b'content-length', str(len(body)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return True
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await dispose_async_engine()
+                self.executor.shutdown(wait=False)
+                self.stream_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
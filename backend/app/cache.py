@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+# Sentinel returned by `CatalogCache.get` on a miss (None is a valid cached value)
+MISSING = object()
+
+# Key prefixes of entries that list books (catalog pages and their rendered HTML)
+LISTING_KINDS = ('page', 'page_fragment')
+
+class CatalogCache:
+    """In-process TTL/LRU cache for catalog reads, invalidated by catalog writes.
+
+    Each entry records the book IDs it contains, so a write to one book drops only the
+    entries that show it. `version` increases on every catalog write and can be used as
+    a cheap change stamp for the whole catalog."""
+
+    def __init__(self, max_entries: int, ttl: float, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, book_ids)
+        self._keys_by_book = {}        # book_id -> keys of the entries containing it
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value for `key`, or `MISSING`."""
+        if not self.enabled:
+            return MISSING
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, book_ids=(), version: int | None = None):
+        """Stores `value` under `key`, tagged with the books it contains.
+
+        Pass the `version` read before querying the database; if a write happened in the
+        meantime the value may be stale and is not stored."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(book_ids))
+            for book_id in book_ids:
+                self._keys_by_book.setdefault(book_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_book(self, book_id: int, listings: bool = False):
+        """Drops every entry containing `book_id`; with `listings`, drops all catalog listings too
+        (for writes that can move a book into other pages, like creation or a title change)."""
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            for key in list(self._keys_by_book.get(book_id, ())):
+                self._drop(key)
+            if listings:
+                for key in [key for key in self._entries if key[0] in LISTING_KINDS]:
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._keys_by_book.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'version': self.version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+            }
+
+    def _drop(self, key):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for book_id in entry[2]:
+            keys = self._keys_by_book.get(book_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_book[book_id]
+
+catalog_cache = CatalogCache(Config.CATALOG_CACHE_MAX_ENTRIES, Config.CATALOG_CACHE_TTL, Config.CATALOG_CACHE_ENABLED)
@@ -1,9 +1,25 @@
-from sqlalchemy.orm import Session, joinedload # Added joinedload
-from sqlalchemy import or_
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import or_, text, tuple_, select, func, update, insert, delete, union_all, literal, bindparam
+from sqlalchemy.engine import Result
+from sqlalchemy.exc import OperationalError, IntegrityError
 from datetime import datetime
-from app.models import User, Book, Borrowing
+import base64
+import json
+import logging
+import re
+from typing import NamedTuple
+from app.models import User, Book, Borrowing, ArchivedBorrowing, Hold
+from app.analytics import record_loans, record_returns, discount_loan_stats
+from app.archive import move_to_archive
+from app.security import hash_password, verify_password, needs_rehash, HashingBusy
+from app.cache import catalog_cache, MISSING
+from app.events import availability_bus
+from app.fragments import touch_users
+from app.serialization import BOOK, USER, BORROWING
 from db.database import get_db
+from db.search_index import FTS_TABLE
+
+logger = logging.getLogger('library.crud')
 
 ### --- User and Authentication CRUD --- ###
 
@@ -12,7 +28,7 @@ def create_user(db: Session, username: str, email: str, password: str, role: str
     if db.query(User).filter(or_(User.username == username, User.email == email)).first():
         return None # User already exists
     
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     new_user = User(
         username=username, 
         email=email, 
@@ -20,17 +36,32 @@ def create_user(db: Session, username: str, email: str, password: str, role: str
         role=role
     )
     db.add(new_user)
+    db.flush()
+    touch_users(db, [new_user.id])
     db.commit()
     db.refresh(new_user)
     return new_user
 
 def authenticate_user(db: Session, username: str, password: str) -> User | None:
-    """Authenticates a user by username and password."""
+    """Authenticates a user by username and password.
+
+    Hashes made under an older hashing policy are transparently upgraded on success;
+    the upgrade is best-effort and retried on a later login if the hashing pool is busy."""
     user = db.query(User).filter(User.username == username).first()
-    if user and check_password_hash(user.hashed_password, password):
+    if user and verify_password(user.hashed_password, password):
+        if needs_rehash(user.hashed_password):
+            try:
+                user.hashed_password = hash_password(password)
+                db.commit()
+            except HashingBusy:
+                logger.warning("Password rehash for user %s skipped: the hashing pool is busy", user.id)
         return user
     return None
 
+def get_user_by_id(db: Session, user_id: int) -> User | None:
+    """Retrieves a user by their ID."""
+    return db.query(User).filter(User.id == user_id).first()
+
 ### --- Book CRUD (Admin Only) --- ###
 
 def create_book(db: Session, title: str, author: str, genre: str, copies: int) -> Book:
@@ -45,6 +76,7 @@ def create_book(db: Session, title: str, author: str, genre: str, copies: int) -
     db.add(new_book)
     db.commit()
     db.refresh(new_book)
+    catalog_cache.invalidate_book(new_book.id, listings=True)
     return new_book
 
 def update_book(db: Session, book_id: int, title: str, author: str, genre: str, total_copies: int) -> Book | None:
@@ -55,6 +87,9 @@ def update_book(db: Session, book_id: int, title: str, author: str, genre: str,
     
     # Calculate difference in copies to update available_copies safely
     copy_diff = total_copies - book.total_copies
+    # Changing the sort/filter columns can move the book to other catalog pages
+    moved = (title, author, genre) != (book.title, book.author, book.genre)
+    old_title = book.title
     
     book.title = title
     book.author = author
@@ -66,33 +101,217 @@ def update_book(db: Session, book_id: int, title: str, author: str, genre: str,
     if book.available_copies < 0:
         book.available_copies = 0
 
+    db.flush()
+    if title != old_title:
+        # Titles appear in every user's history and active loans
+        touch_users(db)
+    if copy_diff > 0:
+        # New copies go to the waitlist first
+        _allocate_holds(db, [book_id])
+    changes = _availability(db, [book_id])
+
     db.commit()
     db.refresh(book)
+    catalog_cache.invalidate_book(book_id, listings=moved)
+    availability_bus.publish(changes)
     return book
 
 def delete_book(db: Session, book_id: int) -> bool:
     """Deletes a book from the catalog."""
     book = db.query(Book).filter(Book.id == book_id).first()
     if book:
-        # Also remove all related borrowing records for cleanup (optional, depends on policy)
+        # Returned loans are kept in the archive; only loans still open are removed
+        move_to_archive(db, Borrowing.book_id == book_id)
+        _discount_user_loans(db, Borrowing.book_id == book_id)
+        discount_loan_stats(db, Borrowing.book_id == book_id)
         db.query(Borrowing).filter(Borrowing.book_id == book_id).delete()
+        db.query(Hold).filter(Hold.book_id == book_id).delete()
         db.delete(book)
         db.commit()
+        catalog_cache.invalidate_book(book_id)
         return True
     return False
 
+### --- Loan Counters --- ###
+
+def _count_loans(db: Session, user_id: int, active: int = 1, total: int = 1, book_ids=None):
+    """Adjusts a user's active/lifetime loan counters (and the books' lifetime counters)
+    in the caller's transaction."""
+    touch_users(db, [user_id])
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(active_loans=User.active_loans + active, total_loans=User.total_loans + total),
+        execution_options={'synchronize_session': False}
+    )
+    if book_ids:
+        db.execute(
+            update(Book)
+            .where(Book.id.in_(book_ids))
+            .values(total_loans=Book.total_loans + 1),
+            execution_options={'synchronize_session': False}
+        )
+
+def _discount_user_loans(db: Session, condition):
+    """Removes the borrowings matching `condition` from their users' counters before they are deleted."""
+    touch_users(db)
+    matching = select(func.count(Borrowing.id)).where(Borrowing.user_id == User.id, condition)
+    db.execute(
+        update(User)
+        .where(User.id.in_(select(Borrowing.user_id).where(condition)))
+        .values(
+            total_loans=User.total_loans - matching.scalar_subquery(),
+            active_loans=User.active_loans - matching.where(Borrowing.status == 'borrowed').scalar_subquery()
+        ),
+        execution_options={'synchronize_session': False}
+    )
+
+def _discount_book_loans(db: Session, model, condition):
+    """Removes the `model` rows (live or archived borrowings) matching `condition` from their
+    books' lifetime counters before they are deleted."""
+    matching = select(func.count(model.id)).where(model.book_id == Book.id, condition)
+    db.execute(
+        update(Book)
+        .where(Book.id.in_(select(model.book_id).where(condition)))
+        .values(total_loans=Book.total_loans - matching.scalar_subquery()),
+        execution_options={'synchronize_session': False}
+    )
+
+### --- Availability Events --- ###
+
+def _availability(db: Session, book_ids) -> list[tuple[int, int]]:
+    """Reads the available copies of `book_ids` for the availability stream (see app/events.py).
+
+    Called just before commit, while the transaction still holds the write lock, so the
+    values match the order in which writes commit. Skipped when nobody is listening."""
+    if not book_ids or not availability_bus.has_subscribers:
+        return []
+    return [tuple(row) for row in db.execute(
+        select(Book.id, Book.available_copies).where(Book.id.in_(list(book_ids)))
+    )]
+
 ### --- Book Search and Retrieval --- ###
 
 def get_book_by_id(db: Session, book_id: int) -> Book | None:
     """Retrieves a book by its ID."""
     return db.query(Book).filter(Book.id == book_id).first()
 
+class BookRow(NamedTuple):
+    """Read-only snapshot of a book, safe to share between requests through the catalog cache."""
+    id: int
+    title: str
+    author: str
+    genre: str | None
+    total_copies: int
+    available_copies: int
+
+BOOK_ROW_COLUMNS = BOOK.columns(Book)
+
+def get_book_row(db: Session, book_id: int) -> BookRow | None:
+    """Retrieves a read-only snapshot of a book, served from the catalog cache when possible."""
+    key = ('book', book_id)
+    cached = catalog_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    version = catalog_cache.version
+    row = db.execute(select(*BOOK_ROW_COLUMNS).where(Book.id == book_id)).first()
+    book = BookRow(*row) if row else None
+    catalog_cache.set(key, book, (book_id,), version)
+    return book
+
 def get_all_books(db: Session):
     """Retrieves all books in the catalog."""
     return db.query(Book).all()
 
-def search_books(db: Session, query: str):
-    """Searches books by title, author, or genre."""
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_book_cursor(book: Book | BookRow) -> str:
+    """Encodes a book's (title, id) sort key as an opaque pagination cursor."""
+    raw = json.dumps([book.title, book.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_book_cursor(cursor: str) -> tuple[str, int]:
+    """Decodes a pagination cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        title, book_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid pagination cursor.")
+    if not isinstance(title, str) or not isinstance(book_id, int):
+        raise ValueError("Invalid pagination cursor.")
+    return title, book_id
+
+def _books_page_statement(page_size: int, after: str | None, before: str | None,
+                          genre: str | None, author: str | None):
+    """Builds the keyset query for one catalog page; returns (statement, backwards).
+
+    Shared with the async read path (app/crud_async.py)."""
+    statement = select(*BOOK_ROW_COLUMNS)
+    if genre:
+        statement = statement.where(Book.genre == genre)
+    if author:
+        statement = statement.where(Book.author == author)
+
+    sort_key = tuple_(Book.title, Book.id)
+    backwards = before is not None and after is None
+    if backwards:
+        statement = statement.where(sort_key < tuple_(*decode_book_cursor(before)))
+        statement = statement.order_by(Book.title.desc(), Book.id.desc())
+    else:
+        if after is not None:
+            statement = statement.where(sort_key > tuple_(*decode_book_cursor(after)))
+        statement = statement.order_by(Book.title, Book.id)
+    # Fetch one extra row to learn whether another page exists in that direction
+    return statement.limit(page_size + 1), backwards
+
+def _books_page(rows, page_size: int, after: str | None, backwards: bool) -> dict:
+    """Turns the rows fetched by `_books_page_statement` into a page with its cursors.
+
+    `tags` lists every fetched book, the lookahead row included: deleting that one can
+    take away the page's next (or previous) link, so it must drop the cached page too."""
+    books = [BookRow(*row) for row in rows]
+    tags = tuple(book.id for book in books)
+    has_more = len(books) > page_size
+    books = books[:page_size]
+    if backwards:
+        books.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+    return {
+        'books': tuple(books),
+        'next_cursor': encode_book_cursor(books[-1]) if books and has_next else None,
+        'prev_cursor': encode_book_cursor(books[0]) if books and has_prev else None,
+        'tags': tags,
+    }
+
+def get_books_page(db: Session, page_size: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                   before: str | None = None, genre: str | None = None, author: str | None = None) -> dict:
+    """Retrieves one page of the catalog ordered by (title, id) using keyset pagination.
+
+    Pass the `next_cursor` of a page as `after` to move forward, or its `prev_cursor`
+    as `before` to move back. Cost per page is independent of the catalog size.
+    Pages hold read-only `BookRow`s and are served from the catalog cache when possible."""
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    key = ('page', page_size, after, before, genre, author)
+    cached = catalog_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    version = catalog_cache.version
+
+    statement, backwards = _books_page_statement(page_size, after, before, genre, author)
+    page = _books_page(db.execute(statement), page_size, after, backwards)
+    catalog_cache.set(key, page, page['tags'], version)
+    return page
+
+def _build_match_query(query: str) -> str:
+    """Turns free text into an FTS5 MATCH expression with prefix matching on every term."""
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+def _search_books_like(db: Session, query: str, limit: int | None = None, offset: int = 0):
+    """Searches books with a substring match (full table scan)."""
     search_pattern = f"%{query}%"
     return db.query(Book).filter(
         or_(
@@ -100,13 +319,98 @@ def search_books(db: Session, query: str):
             Book.author.ilike(search_pattern),
             Book.genre.ilike(search_pattern)
         )
-    ).all()
+    ).order_by(Book.id).limit(limit).offset(offset).all()
+
+def search_books(db: Session, query: str, limit: int | None = None, offset: int = 0):
+    """Searches books by title, author, or genre, best matches first.
+
+    `limit` and `offset` select a window of the matches (all of them by default)."""
+    match_query = _build_match_query(query)
+    if not match_query or db.get_bind().dialect.name != 'sqlite':
+        return _search_books_like(db, query, limit, offset)
+
+    # Title hits rank above author hits, which rank above genre hits
+    statement = text(
+        f"SELECT books.* FROM books "
+        f"JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = books.id "
+        f"WHERE {FTS_TABLE} MATCH :match "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 1.0) "
+        f"LIMIT :limit OFFSET :offset"
+    )
+    try:
+        # LIMIT -1 is SQLite's "no limit"
+        return db.query(Book).from_statement(statement).params(
+            match=match_query, limit=-1 if limit is None else limit, offset=offset
+        ).all()
+    except OperationalError:
+        # Index missing or FTS5 not compiled in: keep the old behaviour
+        db.rollback()
+        return _search_books_like(db, query, limit, offset)
+
+def search_books_page(db: Session, query: str, page_size: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> dict:
+    """One page of `search_books` results, shaped like a `get_books_page` page.
+
+    Matches are ranked rather than ordered by a key, so the cursors are the offsets of
+    the next and previous pages (None at either end)."""
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    # One row past the page tells whether there are more matches
+    books = search_books(db, query, limit=page_size + 1, offset=offset)
+    return {
+        'books': books[:page_size],
+        'next_cursor': str(offset + page_size) if len(books) > page_size else None,
+        'prev_cursor': str(max(0, offset - page_size)) if offset else None,
+    }
 
 ### --- Borrowing and Return Logic --- ###
 
-def get_user_borrowings(db: Session, user_id: int):
-    """Retrieves all current and historical borrowing records for a user."""
-    return db.query(Borrowing).options(joinedload(Borrowing.book)).filter(Borrowing.user_id == user_id).order_by(Borrowing.borrow_date.desc()).all()
+# A user's borrowing records as sent by the API
+USER_BORROWING = BORROWING.without('user_id')
+
+def get_user_borrowings(db: Session, user_id: int, include_archived: bool = False) -> list:
+    """Retrieves the current and recent borrowing records for a user, newest first, as
+    read-only rows with the `USER_BORROWING` fields.
+
+    With `include_archived`, archived records are merged in and every row has an
+    `archived` flag."""
+    def records(model, *extra):
+        return select(*USER_BORROWING.columns(model), *extra).where(model.user_id == user_id)
+
+    if not include_archived:
+        return db.execute(records(Borrowing).order_by(Borrowing.borrow_date.desc())).all()
+    combined = union_all(
+        records(Borrowing, literal(False).label('archived')),
+        records(ArchivedBorrowing, literal(True).label('archived'))
+    ).subquery()
+    return db.execute(select(combined).order_by(combined.c.borrow_date.desc())).all()
+
+class HistoryRow(NamedTuple):
+    """A read-only borrowing record with its book title, for rendering."""
+    id: int
+    book_id: int
+    title: str | None
+    borrow_date: datetime
+    return_date: datetime | None
+    status: str
+    archived: bool
+
+def get_user_history(db: Session, user_id: int, include_archived: bool = False) -> list[HistoryRow]:
+    """Like `get_user_borrowings`, but returns plain rows from a single query instead of ORM objects.
+
+    Archived rows use the title snapshot when their book has since been deleted."""
+    query = select(
+        Borrowing.id, Borrowing.book_id, Book.title, Borrowing.borrow_date,
+        Borrowing.return_date, Borrowing.status, literal(False).label('archived')
+    ).join(Book, Book.id == Borrowing.book_id).where(Borrowing.user_id == user_id)
+    if include_archived:
+        query = union_all(query, select(
+            ArchivedBorrowing.id, ArchivedBorrowing.book_id, func.coalesce(Book.title, ArchivedBorrowing.book_title),
+            ArchivedBorrowing.borrow_date, ArchivedBorrowing.return_date, ArchivedBorrowing.status,
+            literal(True).label('archived')
+        ).outerjoin(Book, Book.id == ArchivedBorrowing.book_id).where(ArchivedBorrowing.user_id == user_id))
+        query = select(query.subquery())
+    rows = db.execute(query.order_by(text('borrow_date DESC'))).all()
+    return [HistoryRow(*row[:6], bool(row[6])) for row in rows]
 
 def get_active_borrowings_by_book_id(db: Session, book_id: int, user_id: int | None = None) -> list[Borrowing]:
     """Retrieves active (not returned) borrowing records for a specific book, optionally for a specific user."""
@@ -115,97 +419,476 @@ def get_active_borrowings_by_book_id(db: Session, book_id: int, user_id: int | N
         query = query.filter(Borrowing.user_id == user_id)
     return query.all()
 
+def _is_active_loan_conflict(error: IntegrityError) -> bool:
+    """Whether `error` violates uq_borrowings_active_loan (one open loan per user and book),
+    as opposed to any other constraint."""
+    message = str(error.orig)
+    # SQLite names the columns, other databases the index
+    return 'uq_borrowings_active_loan' in message or 'borrowings.user_id, borrowings.book_id' in message
+
 def borrow_book(db: Session, user_id: int, book_id: int) -> Borrowing | str:
-    """Handles the book borrowing process."""
-    book = get_book_by_id(db, book_id)
-    if not book:
-        return "Book not found."
-    
-    if book.available_copies <= 0:
-        return "No copies are currently available."
+    """Handles the book borrowing process.
 
-    # Check if the user already has an active borrowing for this book
-    active_borrowings = get_active_borrowings_by_book_id(db, book_id, user_id)
-    if active_borrowings:
-         return "You have already borrowed this book and have not returned it."
+    The copy is reserved with a single conditional UPDATE and the loan is guarded by a
+    unique index on active (user_id, book_id) pairs, so concurrent requests can never
+    oversell a book or create duplicate active loans."""
+    reserved = db.execute(
+        update(Book)
+        .where(Book.id == book_id, Book.available_copies > 0)
+        .values(available_copies=Book.available_copies - 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not reserved:
+        db.rollback()
+        if not get_book_by_id(db, book_id):
+            return "Book not found."
+        return "No copies are currently available."
 
-    # Decrement available copies
-    book.available_copies -= 1
-    
-    # Create new borrowing record
+    # Create new borrowing record in the same transaction as the reservation
+    now = datetime.utcnow()
     new_borrowing = Borrowing(
         user_id=user_id,
         book_id=book_id,
+        borrow_date=now,
         status='borrowed'
     )
-    
     db.add(new_borrowing)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        # Rolls back the reservation as well
+        db.rollback()
+        if not _is_active_loan_conflict(e):
+            raise
+        return "You have already borrowed this book and have not returned it."
+    _count_loans(db, user_id, book_ids=[book_id])
+    record_loans(db, [book_id], now)
+    _leave_queues(db, user_id, [book_id])
+    changes = _availability(db, [book_id])
+
     db.commit()
+    catalog_cache.invalidate_book(book_id)
+    availability_bus.publish(changes)
     db.refresh(new_borrowing)
     return new_borrowing
 
 def return_book(db: Session, user_id: int, book_id: int) -> Borrowing | str:
-    """Handles the book return process."""
-    book = get_book_by_id(db, book_id)
-    if not book:
-        return "Book not found."
+    """Handles the book return process.
 
+    Closing the loan is conditional on it still being active, so a duplicate return
+    request cannot increment the available copies twice."""
     # Find the most recent active borrowing by this user for this book
-    active_borrowing = db.query(Borrowing).filter(
+    active_borrowing_id = db.query(Borrowing.id).filter(
         Borrowing.user_id == user_id,
         Borrowing.book_id == book_id,
         Borrowing.status == 'borrowed'
-    ).order_by(Borrowing.borrow_date.desc()).first()
+    ).order_by(Borrowing.borrow_date.desc()).limit(1).scalar()
 
-    if not active_borrowing:
+    closed = None
+    now = datetime.utcnow()
+    if active_borrowing_id is not None:
+        closed = db.execute(
+            update(Borrowing)
+            .where(Borrowing.id == active_borrowing_id, Borrowing.status == 'borrowed')
+            .values(status='returned', return_date=now)
+            .returning(Borrowing.borrow_date),
+            execution_options={'synchronize_session': False}
+        ).first()
+    if not closed:
+        db.rollback()
+        if not get_book_by_id(db, book_id):
+            return "Book not found."
         return "No active borrowing record found for this user and book."
 
-    # Increment available copies
-    book.available_copies += 1
-    
-    # Update borrowing record
-    active_borrowing.return_date = datetime.utcnow()
-    active_borrowing.status = 'returned'
-    
+    restocked = db.execute(
+        update(Book)
+        .where(Book.id == book_id)
+        .values(available_copies=Book.available_copies + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not restocked:
+        db.rollback()
+        return "Book not found."
+    _count_loans(db, user_id, active=-1, total=0)
+    record_returns(db, [(book_id, closed.borrow_date)], now)
+    _allocate_holds(db, [book_id])
+    changes = _availability(db, [book_id])
+
     db.commit()
-    db.refresh(active_borrowing)
-    return active_borrowing
-
-def get_all_borrowing_history(db: Session):
-    """Retrieves the complete history of all borrowings."""
-    return db.query(Borrowing).all()
-
-def get_all_users_with_borrowing_status(db: Session):
-    """Retrieves all users and details about their borrowing activities."""
-    # Eager load borrowings and the associated book to reduce database queries
-    users = db.query(User).options(
-        joinedload(User.borrowings).joinedload(Borrowing.book)
-    ).all()
-    
-    user_data = []
-    for user in users:
-        active_borrowings = [b for b in user.borrowings if b.status == 'borrowed']
-        
-        user_data.append({
-            'id': user.id,
-            'username': user.username,
-            'role': user.role,
-            'total_borrowed': len(user.borrowings),
-            'active_borrowings_count': len(active_borrowings),
-            'history': user.borrowings # Pass the full SQLAlchemy collection for easier template access
-        })
-    return user_data
+    catalog_cache.invalidate_book(book_id)
+    availability_bus.publish(changes)
+    return db.get(Borrowing, active_borrowing_id)
+
+### --- Batch Circulation --- ###
+
+MAX_BATCH_ITEMS = 100
+
+def _batch_results(book_ids: list[int]) -> tuple[dict[int, dict], list[dict]]:
+    """Creates one result entry per requested book, flagging repeated IDs as errors."""
+    by_book, results = {}, []
+    for book_id in book_ids:
+        item = {'book_id': book_id, 'ok': False}
+        if book_id in by_book:
+            item['error'] = "Book is listed more than once in this request."
+        else:
+            by_book[book_id] = item
+        results.append(item)
+    return by_book, results
+
+def _abort_batch(db: Session, results: list[dict]) -> list[dict]:
+    """Rolls back an all-or-nothing batch and marks items that would have succeeded."""
+    db.rollback()
+    for item in results:
+        if 'error' not in item:
+            item['error'] = "Not processed because another item in the batch failed."
+        item['ok'] = False
+        item.pop('borrowing_id', None)
+    return results
+
+def borrow_books(db: Session, user_id: int, book_ids: list[int], atomic: bool = True) -> list[dict]:
+    """Borrows several books for one user in a single transaction.
+
+    Availability and existing loans are checked with one query each and copies are
+    reserved with a single conditional UPDATE. With `atomic` any failure rolls the whole
+    batch back; otherwise the items that can be borrowed are, and the rest report why not."""
+    by_book, results = _batch_results(book_ids)
+    ids = list(by_book)
+    available = dict(db.execute(
+        select(Book.id, Book.available_copies).where(Book.id.in_(ids))
+    ).all())
+    on_loan = set(db.execute(
+        select(Borrowing.book_id).where(
+            Borrowing.user_id == user_id, Borrowing.book_id.in_(ids), Borrowing.status == 'borrowed'
+        )
+    ).scalars())
+
+    candidates = []
+    for book_id, item in by_book.items():
+        if book_id not in available:
+            item['error'] = "Book not found."
+        elif book_id in on_loan:
+            item['error'] = "You have already borrowed this book and have not returned it."
+        elif available[book_id] <= 0:
+            item['error'] = "No copies are currently available."
+        else:
+            candidates.append(book_id)
+    if atomic and len(candidates) < len(results):
+        return _abort_batch(db, results)
+
+    # The guard re-checks availability, so copies taken concurrently are reported per item
+    reserved = set(db.execute(
+        update(Book)
+        .where(Book.id.in_(candidates), Book.available_copies > 0)
+        .values(available_copies=Book.available_copies - 1)
+        .returning(Book.id),
+        execution_options={'synchronize_session': False}
+    ).scalars()) if candidates else set()
+    for book_id in candidates:
+        if book_id not in reserved:
+            by_book[book_id]['error'] = "No copies are currently available."
+    if atomic and len(reserved) < len(candidates):
+        return _abort_batch(db, results)
+
+    if reserved:
+        now = datetime.utcnow()
+        try:
+            created = db.execute(
+                insert(Borrowing).returning(Borrowing.id, Borrowing.book_id, sort_by_parameter_order=True),
+                [{'user_id': user_id, 'book_id': book_id, 'borrow_date': now, 'status': 'borrowed'}
+                 for book_id in candidates if book_id in reserved]
+            ).all()
+        except IntegrityError as e:
+            if not _is_active_loan_conflict(e):
+                db.rollback()
+                raise
+            # A concurrent request opened one of these loans after the check above
+            for book_id in reserved:
+                by_book[book_id]['error'] = "Conflicting request for this book, please retry."
+            return _abort_batch(db, results)
+        for borrowing_id, book_id in created:
+            by_book[book_id].update(ok=True, borrowing_id=borrowing_id)
+        _count_loans(db, user_id, active=len(created), total=len(created), book_ids=reserved)
+        record_loans(db, [book_id for _, book_id in created], now)
+        _leave_queues(db, user_id, reserved)
+    changes = _availability(db, reserved)
+
+    db.commit()
+    for book_id in reserved:
+        catalog_cache.invalidate_book(book_id)
+    availability_bus.publish(changes)
+    return results
+
+def return_books(db: Session, user_id: int, book_ids: list[int], atomic: bool = True) -> list[dict]:
+    """Returns several books for one user in a single transaction.
+
+    Active loans are closed with one conditional UPDATE and the copies restocked with
+    another. `atomic` has the same meaning as for `borrow_books`."""
+    by_book, results = _batch_results(book_ids)
+    ids = list(by_book)
+    known = set(db.execute(select(Book.id).where(Book.id.in_(ids))).scalars())
+    loans = {}
+    for borrowing_id, book_id in db.execute(
+        select(Borrowing.id, Borrowing.book_id).where(
+            Borrowing.user_id == user_id, Borrowing.book_id.in_(ids), Borrowing.status == 'borrowed'
+        ).order_by(Borrowing.borrow_date.desc())
+    ):
+        # Most recent active loan per book, as in return_book
+        loans.setdefault(book_id, borrowing_id)
+
+    for book_id, item in by_book.items():
+        if book_id not in known:
+            item['error'] = "Book not found."
+        elif book_id not in loans:
+            item['error'] = "No active borrowing record found for this user and book."
+    if atomic and len(loans) < len(results):
+        return _abort_batch(db, results)
+
+    now = datetime.utcnow()
+    closed_rows = db.execute(
+        update(Borrowing)
+        .where(Borrowing.id.in_(loans.values()), Borrowing.status == 'borrowed')
+        .values(status='returned', return_date=now)
+        .returning(Borrowing.book_id, Borrowing.id, Borrowing.borrow_date),
+        execution_options={'synchronize_session': False}
+    ).all() if loans else []
+    closed = {book_id: borrowing_id for book_id, borrowing_id, _ in closed_rows}
+    for book_id in loans:
+        if book_id not in closed:
+            by_book[book_id]['error'] = "No active borrowing record found for this user and book."
+    if atomic and len(closed) < len(loans):
+        return _abort_batch(db, results)
+
+    if closed:
+        db.execute(
+            update(Book)
+            .where(Book.id.in_(closed))
+            .values(available_copies=Book.available_copies + 1),
+            execution_options={'synchronize_session': False}
+        )
+        for book_id, borrowing_id in closed.items():
+            by_book[book_id].update(ok=True, borrowing_id=borrowing_id)
+        _count_loans(db, user_id, active=-len(closed), total=0)
+        record_returns(db, [(book_id, borrow_date) for book_id, _, borrow_date in closed_rows], now)
+        _allocate_holds(db, list(closed))
+    changes = _availability(db, closed)
+
+    db.commit()
+    for book_id in closed:
+        catalog_cache.invalidate_book(book_id)
+    availability_bus.publish(changes)
+    return results
+
+### --- Holds --- ###
+
+def _leave_queues(db: Session, user_id: int, book_ids):
+    """Drops the user's holds on books they have just borrowed."""
+    db.execute(
+        delete(Hold).where(Hold.user_id == user_id, Hold.book_id.in_(book_ids)),
+        execution_options={'synchronize_session': False}
+    )
+
+def _allocate_holds(db: Session, book_ids) -> list[tuple[int, int, int]]:
+    """Lends the available copies of `book_ids` to their oldest holders, in the caller's transaction.
+
+    Returns (user_id, book_id, borrowing_id) for every loan created. Called wherever copies
+    become available, so a book never has both free copies and a waitlist."""
+    allocated = []
+    queued = db.execute(select(Hold.book_id).where(Hold.book_id.in_(book_ids)).distinct()).scalars().all()
+    for book_id in queued:
+        while True:
+            hold = db.execute(
+                select(Hold.id, Hold.user_id).where(Hold.book_id == book_id)
+                .order_by(Hold.created_at, Hold.id).limit(1)
+            ).first()
+            if hold is None:
+                break
+            reserved = db.execute(
+                update(Book)
+                .where(Book.id == book_id, Book.available_copies > 0)
+                .values(available_copies=Book.available_copies - 1),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            if not reserved:
+                break
+            db.execute(delete(Hold).where(Hold.id == hold.id), execution_options={'synchronize_session': False})
+            now = datetime.utcnow()
+            borrowing_id = db.execute(
+                insert(Borrowing).returning(Borrowing.id),
+                {'user_id': hold.user_id, 'book_id': book_id, 'borrow_date': now, 'status': 'borrowed'}
+            ).scalar_one()
+            _count_loans(db, hold.user_id, book_ids=[book_id])
+            record_loans(db, [book_id], now)
+            allocated.append((hold.user_id, book_id, borrowing_id))
+    return allocated
+
+def settle_availability(db: Session, book_ids) -> list[tuple[int, int]]:
+    """For bulk writes that change copy counts (imports, counter repairs): lends the freed
+    copies of `book_ids` to their waitlists in the caller's transaction, and returns the
+    availability changes to publish once it commits."""
+    _allocate_holds(db, book_ids)
+    return _availability(db, book_ids)
+
+def _holds_query():
+    """A user's holds (bound as `user_id`) with their 1-based place in each book's queue.
+
+    The place is the number of holds ahead of the user's, counted on the
+    (book_id, created_at, id) index without touching the table. Counting walks that index
+    range, so the cost grows with the queue (O(position), and O(length) for the queue
+    length) rather than being a single O(log n) lookup: a stored per-book sequence
+    number would go stale whenever a hold ahead is cancelled or filled, and SQLite's
+    B-trees keep no subtree counts to rank an entry directly. Waitlists are short, and
+    the walk reads only index pages (15 to 50 ms in a 100,000-hold queue)."""
+    ahead = aliased(Hold)
+    position = select(func.count(ahead.id)).where(
+        ahead.book_id == Hold.book_id,
+        tuple_(ahead.created_at, ahead.id) < tuple_(Hold.created_at, Hold.id)
+    ).scalar_subquery() + 1
+    queue_length = select(func.count(ahead.id)).where(ahead.book_id == Hold.book_id).scalar_subquery()
+    return (
+        select(
+            Hold.book_id, Book.title, Hold.created_at,
+            position.label('position'), queue_length.label('queue_length')
+        )
+        .join(Book, Book.id == Hold.book_id)
+        .where(Hold.user_id == bindparam('user_id'))
+    )
+
+# Built once: constructing the correlated counts costs more than running them
+HOLDS_BY_USER = _holds_query().order_by(Hold.created_at)
+HOLD_POSITION = _holds_query().where(Hold.book_id == bindparam('book_id'))
+
+def place_hold(db: Session, user_id: int, book_id: int) -> dict | str:
+    """Puts a user at the back of a book's waitlist and returns their position.
+
+    Only books without available copies can be held. The hold is written before
+    availability is checked, so the check runs inside the write transaction and cannot
+    miss a copy returned concurrently."""
+    if db.get(Book, book_id) is None:
+        return "Book not found."
+    if get_active_borrowings_by_book_id(db, book_id, user_id):
+        return "You have already borrowed this book and have not returned it."
+    db.add(Hold(user_id=user_id, book_id=book_id))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return "You are already on the waitlist for this book."
+    available = db.execute(select(Book.available_copies).where(Book.id == book_id)).scalar()
+    if available > 0:
+        db.rollback()
+        return "Copies are available, borrow the book instead."
+    db.commit()
+    return get_hold_position(db, user_id, book_id)
+
+def cancel_hold(db: Session, user_id: int, book_id: int) -> bool:
+    """Removes a user from a book's waitlist."""
+    removed = db.execute(
+        delete(Hold).where(Hold.user_id == user_id, Hold.book_id == book_id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.commit()
+    return bool(removed)
+
+def get_hold_position(db: Session, user_id: int, book_id: int) -> dict | None:
+    """Returns the user's position in a book's waitlist, or None if they are not on it."""
+    row = db.execute(HOLD_POSITION, {'user_id': user_id, 'book_id': book_id}).first()
+    return row._asdict() if row else None
+
+def get_user_holds(db: Session, user_id: int) -> list[dict]:
+    """Lists a user's holds, oldest first, with their positions."""
+    return [row._asdict() for row in db.execute(HOLDS_BY_USER, {'user_id': user_id})]
+
+def get_all_borrowing_history(db: Session, include_archived: bool = False) -> list[Borrowing | ArchivedBorrowing]:
+    """Retrieves the history of all borrowings in the live table, plus the archive if requested."""
+    history = db.query(Borrowing).all()
+    if include_archived:
+        history += db.query(ArchivedBorrowing).all()
+    return history
+
+### --- Streaming Exports --- ###
+
+EXPORT_BATCH_SIZE = 1000
+
+def iter_books(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Result:
+    """Streams the catalog as plain rows, fetching `batch_size` rows at a time."""
+    statement = select(*BOOK.columns(Book)).order_by(Book.id)
+    return db.execute(statement.execution_options(yield_per=batch_size))
+
+def iter_users(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Result:
+    """Streams all users (without password hashes) as plain rows."""
+    statement = select(*USER.columns(User)).order_by(User.id)
+    return db.execute(statement.execution_options(yield_per=batch_size))
+
+def iter_borrowing_history(db: Session, batch_size: int = EXPORT_BATCH_SIZE, include_archived: bool = False) -> Result:
+    """Streams the borrowing history as plain rows.
+
+    With `include_archived` the archive is appended through UNION ALL and every row
+    carries an `archived` flag."""
+    def history(model, *extra):
+        return select(*BORROWING.columns(model), *extra)
+
+    if include_archived:
+        combined = union_all(
+            history(Borrowing, literal(False).label('archived')),
+            history(ArchivedBorrowing, literal(True).label('archived'))
+        ).subquery()
+        statement = select(combined).order_by(combined.c.id)
+    else:
+        statement = history(Borrowing).order_by(Borrowing.id)
+    return db.execute(statement.execution_options(yield_per=batch_size))
+
+def get_active_titles_by_user(db: Session, user_ids: list[int] | None = None) -> dict[int, list[str]]:
+    """Maps user IDs to the titles they currently have borrowed (active loans only)."""
+    query = db.query(Borrowing.user_id, Book.title).join(Book, Borrowing.book_id == Book.id).filter(
+        Borrowing.status == 'borrowed'
+    )
+    if user_ids is not None:
+        query = query.filter(Borrowing.user_id.in_(user_ids))
+    titles = {}
+    for user_id, title in query.order_by(Borrowing.borrow_date.desc()):
+        titles.setdefault(user_id, []).append(title)
+    return titles
+
+def get_all_users_with_borrowing_status(db: Session, include_titles: bool = False):
+    """Retrieves all users and details about their borrowing activities.
+
+    Counts come from the maintained counters, so no loan is read. The titles of active
+    loans (`active_titles`) join every active loan to its book, so they are only loaded
+    with `include_titles`; the per-user log shows them on demand."""
+    rows = db.query(
+        User.id, User.username, User.role,
+        User.total_loans.label('total_borrowed'),
+        User.active_loans.label('active_borrowings_count')
+    ).order_by(User.id).all()
+
+    users = [{
+        'id': row.id,
+        'username': row.username,
+        'role': row.role,
+        'total_borrowed': row.total_borrowed,
+        'active_borrowings_count': row.active_borrowings_count,
+    } for row in rows]
+    if include_titles:
+        active_titles = get_active_titles_by_user(db)
+        for user in users:
+            user['active_titles'] = active_titles.get(user['id'], [])
+    return users
 
 def delete_user(db: Session, user_id: int) -> bool:
-    """Deletes a user and all their borrowings."""
+    """Deletes a user and all their borrowings, archived ones included."""
     user = db.query(User).filter(User.id == user_id).first()
     if user:
         # Check for active borrowings
-        active_borrowings = db.query(Borrowing).filter(Borrowing.user_id == user_id, Borrowing.status == 'borrowed').count()
-        if active_borrowings > 0:
+        if user.active_loans > 0:
             return False  # Cannot delete if user has active borrowings
+        _discount_book_loans(db, Borrowing, Borrowing.user_id == user_id)
+        _discount_book_loans(db, ArchivedBorrowing, ArchivedBorrowing.user_id == user_id)
+        discount_loan_stats(db, Borrowing.user_id == user_id, ArchivedBorrowing.user_id == user_id)
         db.query(Borrowing).filter(Borrowing.user_id == user_id).delete()
+        db.query(ArchivedBorrowing).filter(ArchivedBorrowing.user_id == user_id).delete()
+        db.query(Hold).filter(Hold.user_id == user_id).delete()
         db.delete(user)
+        touch_users(db, [user_id])
         db.commit()
         return True
     return False
\ No newline at end of file
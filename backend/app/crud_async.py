@@ -0,0 +1,50 @@
+"""Async variants of the hot read paths in app.crud, used by the ASGI entry point.
+
+They build the same statements as their synchronous counterparts and share the catalog
+cache with them, so both serving modes return identical results and a write made by a
+Flask view invalidates what the async reads have cached.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud import (
+    BookRow, BOOK_ROW_COLUMNS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+    _books_page_statement, _books_page, HOLDS_BY_USER, HOLD_POSITION
+)
+from app.cache import catalog_cache, MISSING
+from app.models import Book
+
+async def get_book_row(db: AsyncSession, book_id: int) -> BookRow | None:
+    """Async `crud.get_book_row`."""
+    key = ('book', book_id)
+    cached = catalog_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    version = catalog_cache.version
+    row = (await db.execute(select(*BOOK_ROW_COLUMNS).where(Book.id == book_id))).first()
+    book = BookRow(*row) if row else None
+    catalog_cache.set(key, book, (book_id,), version)
+    return book
+
+async def get_books_page(db: AsyncSession, page_size: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                         before: str | None = None, genre: str | None = None, author: str | None = None) -> dict:
+    """Async `crud.get_books_page`; raises ValueError for a malformed cursor."""
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    key = ('page', page_size, after, before, genre, author)
+    cached = catalog_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    version = catalog_cache.version
+
+    statement, backwards = _books_page_statement(page_size, after, before, genre, author)
+    page = _books_page(await db.execute(statement), page_size, after, backwards)
+    catalog_cache.set(key, page, page['tags'], version)
+    return page
+
+async def get_hold_position(db: AsyncSession, user_id: int, book_id: int) -> dict | None:
+    """Async `crud.get_hold_position`."""
+    row = (await db.execute(HOLD_POSITION, {'user_id': user_id, 'book_id': book_id})).first()
+    return row._asdict() if row else None
+
+async def get_user_holds(db: AsyncSession, user_id: int) -> list[dict]:
+    """Async `crud.get_user_holds`."""
+    return [row._asdict() for row in await db.execute(HOLDS_BY_USER, {'user_id': user_id})]
@@ -0,0 +1,155 @@
+"""In-process event bus for changes in book availability, streamed to dashboards as
+server-sent events by /events/availability.
+
+The CRUD layer publishes `(book_id, available_copies)` after each write that changes
+availability. Every subscriber keeps only the latest pending value per book, so a burst
+of changes to one book is delivered as a single event. Events carry absolute counts, so
+a client that misses one is corrected by the next change of the same book.
+
+Like the catalog cache the bus is per process: with several worker processes a stream
+only sees the writes made by its own process.
+"""
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import NamedTuple
+from config import Config
+
+class AvailabilityEvent(NamedTuple):
+    seq: int
+    book_id: int
+    available_copies: int
+
+class StreamLimitReached(Exception):
+    """Raised when every stream slot is taken."""
+
+class Subscription:
+    """Pending events for one listener, coalesced per book."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # book_id -> latest AvailabilityEvent
+        # Set when events were lost (too many pending, or a resume point that is no
+        # longer in the backlog); the listener must then reload its view
+        self._resync = False
+        self._ready = threading.Condition()
+
+    def push(self, event: AvailabilityEvent):
+        with self._ready:
+            if self._resync:
+                return
+            self._pending.pop(event.book_id, None)
+            if len(self._pending) >= self.max_pending:
+                self._pending.clear()
+                self._resync = True
+            else:
+                self._pending[event.book_id] = event
+            self._ready.notify()
+
+    def request_resync(self):
+        with self._ready:
+            self._pending.clear()
+            self._resync = True
+            self._ready.notify()
+
+    def wait(self, timeout: float) -> tuple[list[AvailabilityEvent], bool]:
+        """Blocks until events are pending or `timeout` expires.
+
+        Returns the pending events in publication order and whether a resync is needed."""
+        with self._ready:
+            if not self._pending and not self._resync:
+                self._ready.wait(timeout)
+            events = sorted(self._pending.values())
+            resync = self._resync
+            self._pending.clear()
+            self._resync = False
+            return events, resync
+
+class AvailabilityBus:
+    """Fans availability changes out to the current subscribers.
+
+    The last `backlog` events are kept so that a reconnecting client can resume from the
+    ID of the last event it saw (the SSE `Last-Event-ID` header)."""
+
+    def __init__(self, max_subscribers: int, backlog: int, max_pending: int):
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.seq = 0
+        self.published = 0
+        self._backlog = deque(maxlen=backlog)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, changes):
+        """Announces `(book_id, available_copies)` pairs to every subscriber."""
+        with self._lock:
+            for book_id, available_copies in changes:
+                self.seq += 1
+                self.published += 1
+                event = AvailabilityEvent(self.seq, book_id, available_copies)
+                self._backlog.append(event)
+                for subscription in self._subscribers:
+                    subscription.push(event)
+
+    def subscribe(self, last_event_id: int | None = None) -> Subscription:
+        """Registers a listener, replaying the events after `last_event_id` when given."""
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise StreamLimitReached()
+            if last_event_id is not None:
+                oldest = self._backlog[0].seq if self._backlog else self.seq + 1
+                if last_event_id > self.seq or last_event_id + 1 < oldest:
+                    # From before a restart, or too long ago to replay
+                    subscription.request_resync()
+                else:
+                    for event in self._backlog:
+                        if event.seq > last_event_id:
+                            subscription.push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'seq': self.seq,
+                'published': self.published,
+            }
+
+def format_sse(event: str, data, event_id: int | None = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+def stream_events(bus: AvailabilityBus, subscription: Subscription, keepalive: float = Config.EVENTS_KEEPALIVE):
+    """Yields the subscription's events as SSE text until the client disconnects.
+
+    The caller unsubscribes when the response is closed (a generator that never
+    started would not run a `finally` block)."""
+    # Tells EventSource how long to wait before reconnecting (ms)
+    yield f"retry: {int(keepalive * 1000)}\n\n"
+    while True:
+        events, resync = subscription.wait(keepalive)
+        if resync:
+            yield format_sse('resync', {}, bus.seq)
+        for event in events:
+            yield format_sse('availability', {
+                'book_id': event.book_id, 'available_copies': event.available_copies
+            }, event.seq)
+        if not events and not resync:
+            # Comment line: keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
+
+availability_bus = AvailabilityBus(Config.EVENTS_MAX_SUBSCRIBERS, Config.EVENTS_BACKLOG, Config.EVENTS_MAX_PENDING)
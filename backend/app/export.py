@@ -0,0 +1,72 @@
+import csv
+import io
+from datetime import datetime
+from flask import Response
+from app.serialization import dumps
+from db.database import get_report_session
+
+# Supported export formats and their content types
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+
+# Rows are buffered into chunks of this size before being written to the client
+CHUNK_ROWS = 500
+
+def _to_json_value(value):
+    """Converts values that `json` cannot encode natively."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _encode_rows(rows, fields: list[str], fmt: str):
+    """Yields one encoded string per row in the requested format."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_to_json_value(value) for value in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    elif fmt == 'json':
+        separator = '['
+        for row in rows:
+            yield separator + dumps(dict(zip(fields, map(_to_json_value, row))), sort_keys=False).decode()
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+    else:
+        for row in rows:
+            yield dumps(dict(zip(fields, map(_to_json_value, row))), sort_keys=False).decode() + '\n'
+
+def generate_export(query, fmt: str, open_session=get_report_session):
+    """Runs `query(db)` on its own session (a reporting session by default) and yields
+    the encoded output in chunks.
+
+    Only one chunk of rows is held in memory at a time, whatever the table size."""
+    db = open_session()
+    try:
+        result = query(db)
+        fields = list(result.keys())
+        chunk = []
+        for piece in _encode_rows(result, fields, fmt):
+            chunk.append(piece)
+            if len(chunk) >= CHUNK_ROWS:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+    finally:
+        db.close()
+
+def export_response(query, fmt: str, filename: str) -> Response:
+    """Builds a streaming download response for `query` (see `generate_export`)."""
+    return Response(
+        generate_export(query, fmt),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+    )
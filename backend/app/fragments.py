@@ -0,0 +1,113 @@
+"""Cached HTML fragments for the catalog tables and the per-user activity blocks.
+
+Fragments are stored in the catalog cache. Catalog fragments are tagged with the books
+they show, so the per-book invalidation that drops catalog pages drops them too. User
+fragments are keyed on version stamps, which are bumped when a session that changed a
+user's loans or account commits; an old stamp simply stops being looked up.
+"""
+import threading
+from flask import render_template
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.cache import catalog_cache, MISSING
+from db.database import set_report_stamp, get_report_stamp
+from config import Config
+
+class UserStamps:
+    """Version stamps for fragments built from user activity.
+
+    Every user has a stamp of their own, `summary` changes with any user's, and `epoch`
+    changes on writes that can affect all users at once (book deletions and title
+    changes, archival, counter repairs)."""
+
+    def __init__(self):
+        self.epoch = 0
+        self.summary = 0
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def bump(self, user_ids):
+        with self._lock:
+            self.summary += 1
+            for user_id in user_ids:
+                self._users[user_id] = self._users.get(user_id, 0) + 1
+
+    def bump_all(self):
+        with self._lock:
+            self.epoch += 1
+
+    def summary_stamp(self) -> tuple[int, int]:
+        return (self.epoch, self.summary)
+
+    def user_stamp(self, user_id: int) -> tuple[int, int]:
+        return (self.epoch, self._users.get(user_id, 0))
+
+user_stamps = UserStamps()
+# Reporting sessions record the summary stamp of the data they read
+set_report_stamp(user_stamps.summary_stamp)
+
+# Marker in Session.info for "every user"
+ALL_USERS = object()
+
+def touch_users(db: Session, user_ids=ALL_USERS):
+    """Records that `db` changed these users' activity (all users by default).
+
+    The stamps are bumped only once the session commits, so a fragment rendered from
+    the old data can never be stored under the new stamp."""
+    touched = db.info.get('touched_users')
+    if user_ids is ALL_USERS or touched is ALL_USERS:
+        db.info['touched_users'] = ALL_USERS
+    else:
+        db.info['touched_users'] = (touched or set()) | set(user_ids)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_touched_users(session):
+    touched = session.info.pop('touched_users', None)
+    if touched is ALL_USERS:
+        user_stamps.bump_all()
+    elif touched:
+        user_stamps.bump(touched)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched_users(session):
+    session.info.pop('touched_users', None)
+
+def _cached(key: tuple, render, book_ids=(), version: int | None = None) -> Markup:
+    if not Config.FRAGMENT_CACHE_ENABLED:
+        return Markup(render())
+    html = catalog_cache.get(key)
+    if html is MISSING:
+        html = render()
+        catalog_cache.set(key, html, book_ids, version)
+    return Markup(html)
+
+def catalog_fragment(template: str, page: dict, page_args: dict, version: int, **context) -> Markup:
+    """Renders the rows of a catalog page, reusing the HTML while none of its books change.
+
+    `version` is the catalog cache version read before the page was loaded."""
+    key = ('page_fragment', template, tuple(sorted(page_args.items())))
+    return _cached(
+        key, lambda: render_template(template, books=page['books'], **context),
+        [book.id for book in page['books']], version
+    )
+
+def user_fragment(template: str, user_id: int | None, load, *key) -> Markup:
+    """Renders a block of user activity, reusing the HTML until the user's stamp (or, with
+    no `user_id`, the summary stamp) changes.
+
+    `load` returns the template context and is only called on a miss, after the stamp
+    has been read."""
+    stamp = user_stamps.summary_stamp() if user_id is None else user_stamps.user_stamp(user_id)
+    return _cached(('user_fragment', template, user_id, stamp) + key, lambda: render_template(template, **load()))
+
+def report_fragment(template: str, db: Session, load, *key) -> Markup:
+    """Like a summary `user_fragment`, for data read through reporting session `db`.
+
+    The HTML is keyed on the stamp of the data `db` reads (see `get_report_stamp`), which
+    can be older than the live one, and is not cached when that stamp is unknown."""
+    stamp = get_report_stamp(db)
+    render = lambda: render_template(template, **load())
+    if stamp is None:
+        return Markup(render())
+    return _cached(('user_fragment', template, None, stamp) + key, render)
@@ -0,0 +1,202 @@
+"""Bulk catalog import from CSV or JSONL.
+
+Rows are validated, de-duplicated on the natural key (title, author) and upserted in
+batches with executemany: new books are inserted, existing ones get their genre and
+copy counts updated (available copies shift by the change in total copies, as in
+`update_book`, and freed copies go to the waitlists). Each batch is committed on its
+own, so memory stays bounded and a failure only loses the batch in flight.
+
+Command line (from the backend folder):
+    python -m app.importer books.csv [--format csv|jsonl] [--batch-size 5000]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from sqlalchemy import insert, update, select, bindparam, func, tuple_
+from sqlalchemy.orm import Session
+from app.models import Book
+from app.cache import catalog_cache
+from app.crud import settle_availability
+from app.events import availability_bus
+from db.search_index import has_search_index, suspend_sync, resume_sync, index_books, unindex_books
+
+DEFAULT_BATCH_SIZE = 5000
+# The existing-book lookup binds two parameters per row, within SQLite's limit of 32766
+MAX_BATCH_SIZE = 32766 // 2
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+def iter_records(stream, fmt: str):
+    """Yields (line_number, record) pairs from a text stream; unparsable lines yield an Exception."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            yield line_number, record if isinstance(record, dict) else ValueError("Expected a JSON object.")
+    else:
+        raise ValueError(f"Unsupported format, use one of: {', '.join(IMPORT_FORMATS)}")
+
+def validate_record(record: dict) -> dict:
+    """Normalizes one input record into book column values; raises ValueError if invalid."""
+    title = str(record.get('title') or '').strip()
+    author = str(record.get('author') or '').strip()
+    genre = str(record.get('genre') or '').strip() or None
+    if not title:
+        raise ValueError("Missing title.")
+    if not author:
+        raise ValueError("Missing author.")
+    copies = record.get('copies', record.get('total_copies'))
+    try:
+        copies = int(copies)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid copies value: {copies!r}.")
+    if copies < 1:
+        raise ValueError("Copies must be at least 1.")
+    return {'title': title, 'author': author, 'genre': genre, 'copies': copies}
+
+def _flush_batch(db: Session, batch: dict, report: dict, search_index: bool):
+    """Upserts one batch keyed by (title, author) and commits it."""
+    conn = db.connection()
+    if search_index:
+        # Also takes the write lock, so IDs assigned below cannot interleave with other writers
+        suspend_sync(conn)
+
+    books = Book.__table__
+    keys = list(batch)
+    existing = dict(
+        ((title, author), book_id) for book_id, title, author in conn.execute(
+            select(books.c.id, books.c.title, books.c.author).where(tuple_(books.c.title, books.c.author).in_(keys))
+        )
+    )
+    new_rows = [
+        {'title': row['title'], 'author': row['author'], 'genre': row['genre'],
+         'total_copies': row['copies'], 'available_copies': row['copies']}
+        for key, row in batch.items() if key not in existing
+    ]
+    changed_rows = [
+        {'b_id': existing[key], 'b_genre': row['genre'], 'b_copies': row['copies']}
+        for key, row in batch.items() if key in existing
+    ]
+    changed_ids = [row['b_id'] for row in changed_rows]
+
+    if changed_rows:
+        if search_index:
+            unindex_books(conn, changed_ids)
+        # SET expressions see the row's old values
+        conn.execute(
+            update(books)
+            .where(books.c.id == bindparam('b_id'))
+            .values(
+                genre=bindparam('b_genre'),
+                total_copies=bindparam('b_copies'),
+                available_copies=func.max(0, books.c.available_copies + bindparam('b_copies') - books.c.total_copies)
+            ),
+            changed_rows
+        )
+    new_ids = []
+    if new_rows:
+        last_id = conn.execute(select(func.coalesce(func.max(books.c.id), 0))).scalar()
+        conn.execute(insert(books), new_rows)
+        new_ids = conn.execute(select(books.c.id).where(books.c.id > last_id)).scalars().all()
+    if search_index:
+        index_books(conn, changed_ids + new_ids)
+        resume_sync(conn)
+    # New books have no waitlist; updated ones may have gained or lost copies
+    changes = settle_availability(db, changed_ids) if changed_ids else []
+
+    db.commit()
+    availability_bus.publish(changes)
+    report['inserted'] += len(new_rows)
+    report['updated'] += len(changed_rows)
+
+def import_books(db: Session, records, batch_size: int = DEFAULT_BATCH_SIZE, progress=None) -> dict:
+    """Imports (line_number, record) pairs from `iter_records` and returns a report.
+
+    `progress(report)` is called after every committed batch. `batch_size` is capped
+    at MAX_BATCH_SIZE."""
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': [], 'elapsed': 0.0}
+    start = time.perf_counter()
+    search_index = has_search_index(db.connection())
+    batch = {}
+    try:
+        for line_number, record in records:
+            report['rows'] += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                row = validate_record(record)
+            except ValueError as e:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'line': line_number, 'error': str(e)})
+                continue
+
+            # Later rows for the same book win within a batch
+            batch[(row['title'], row['author'])] = row
+            if len(batch) >= batch_size:
+                _flush_batch(db, batch, report, search_index)
+                batch = {}
+                report['elapsed'] = time.perf_counter() - start
+                if progress:
+                    progress(report)
+        if batch:
+            _flush_batch(db, batch, report, search_index)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        # Whatever was committed is now visible in listings
+        catalog_cache.clear()
+
+    report['elapsed'] = round(time.perf_counter() - start, 3)
+    report['rows_per_second'] = round(report['rows'] / report['elapsed']) if report['elapsed'] else None
+    if progress:
+        progress(report)
+    return report
+
+def detect_format(filename: str | None, fmt: str | None = None) -> str:
+    """Picks the import format from an explicit value or the file extension."""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(filename or '')[1].lower()
+    return 'jsonl' if extension in ('.jsonl', '.ndjson', '.json') else 'csv'
+
+if __name__ == '__main__':
+    from db.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bulk import books from CSV or JSONL.")
+    parser.add_argument('path', help="input file, or - for stdin")
+    parser.add_argument('--format', choices=IMPORT_FORMATS)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = detect_format(args.path, args.format)
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if args.path == '-' \
+        else open(args.path, encoding='utf-8', newline='')
+    db = SessionLocal()
+    try:
+        report = import_books(
+            db, iter_records(stream, fmt), args.batch_size,
+            progress=lambda r: print(f"{r['rows']} rows: {r['inserted']} inserted, {r['updated']} updated, "
+                                     f"{r['failed']} failed ({r['elapsed']:.1f} s)", file=sys.stderr)
+        )
+    finally:
+        db.close()
+        stream.close()
+    for error in report['errors']:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(json.dumps({key: value for key, value in report.items() if key != 'errors'}))
@@ -0,0 +1,321 @@
+"""Background runner for long admin operations.
+
+Jobs are rows in the `jobs` table, so their status survives restarts; the work itself
+runs on a small thread pool outside the request workers. Handlers receive their own
+session, the job's params and a JobContext for progress reporting and cancellation.
+
+Every process serving the app runs its own pool. A running job records the process that
+claimed it and a heartbeat that process refreshes; other processes leave it alone until
+that process has exited (or, on another host, its heartbeat has expired), then requeue it.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.analytics import rebuild_loan_stats
+from app.archive import archive_borrowings
+from app.crud import delete_book, delete_user
+from app.importer import DEFAULT_BATCH_SIZE, iter_records, import_books
+from app.models import Job
+from config import Config
+from db.database import SessionLocal
+from db.reconcile import reconcile_counters
+
+logger = logging.getLogger('library.jobs')
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+    pass
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+### --- Handlers --- ###
+
+# kind -> handler(db, params, ctx) returning a JSON-serialisable result
+JOB_HANDLERS = {}
+
+def job_handler(kind: str):
+    """Registers a function as the handler for jobs of `kind`."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+@job_handler('delete_book')
+def _delete_book(db: Session, params: dict, ctx):
+    return {'deleted': delete_book(db, int(params['book_id']))}
+
+@job_handler('delete_user')
+def _delete_user(db: Session, params: dict, ctx):
+    return {'deleted': delete_user(db, int(params['user_id']))}
+
+@job_handler('archive_borrowings')
+def _archive_borrowings(db: Session, params: dict, ctx):
+    return archive_borrowings(
+        db,
+        older_than_days=int(params.get('older_than_days', Config.ARCHIVE_AFTER_DAYS)),
+        batch_size=int(params.get('batch_size', Config.ARCHIVE_BATCH_SIZE)),
+        progress=ctx.progress
+    )
+
+@job_handler('reconcile_counters')
+def _reconcile_counters(db: Session, params: dict, ctx):
+    return reconcile_counters(db, fix=bool(params.get('fix', True)))
+
+@job_handler('rebuild_loan_stats')
+def _rebuild_loan_stats(db: Session, params: dict, ctx):
+    return rebuild_loan_stats(db)
+
+@job_handler('import_books')
+def _import_books(db: Session, params: dict, ctx):
+    # The upload is kept until the import succeeds so that a retry can read it again
+    with open(params['path'], encoding='utf-8', newline='') as stream:
+        report = import_books(
+            db, iter_records(stream, params['format']),
+            batch_size=int(params.get('batch_size', DEFAULT_BATCH_SIZE)),
+            progress=ctx.progress
+        )
+    os.remove(params['path'])
+    return report
+
+def save_upload(stream, suffix: str) -> str:
+    """Copies an uploaded file into JOB_UPLOAD_DIR for a job to read later; returns its path."""
+    os.makedirs(Config.JOB_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(Config.JOB_UPLOAD_DIR, f"{uuid.uuid4().hex}.{suffix}")
+    with open(path, 'wb') as out:
+        while chunk := stream.read(64 * 1024):
+            out.write(chunk)
+    return path
+
+### --- Runner --- ###
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _process_owner() -> str:
+    # Read on every call: forked workers must not report their parent's pid
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _owner_alive(owner: str | None) -> bool | None:
+    """Whether the process recorded as `owner` is still running, or None when it runs on
+    another host and only its heartbeat can tell."""
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _set_status(job_id: int, *conditions, **values) -> bool:
+    """Conditionally updates one job in its own short transaction; True if the row changed."""
+    with SessionLocal() as db:
+        changed = db.execute(
+            update(Job).where(Job.id == job_id, *conditions).values(**values),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        db.commit()
+    return bool(changed)
+
+class JobContext:
+    """Passed to handlers: records progress and raises JobCancelled when asked to stop."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def cancelled(self) -> bool:
+        with SessionLocal() as db:
+            return bool(db.get(Job, self.job_id).cancel_requested)
+
+    def progress(self, data):
+        """Stores the latest progress report, then stops the job if cancellation was requested."""
+        _set_status(self.job_id, progress=json.dumps(data, default=str))
+        if self.cancelled():
+            raise JobCancelled()
+
+def _run_job(job_id: int):
+    # Claim the job; it may have been cancelled or picked up while queued
+    now = datetime.utcnow()
+    if not _set_status(job_id, Job.status == 'queued', status='running', attempts=Job.attempts + 1,
+                       started_at=now, owner=_process_owner(), heartbeat_at=now):
+        return
+    ctx = JobContext(job_id)
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        kind, params, attempts, max_attempts = job.kind, json.loads(job.params), job.attempts, job.max_attempts
+        try:
+            if job.cancel_requested:
+                raise JobCancelled()
+            result = JOB_HANDLERS[kind](db, params, ctx)
+        except JobCancelled:
+            db.rollback()
+            _set_status(job_id, status='cancelled', finished_at=datetime.utcnow())
+            return
+        except Exception as e:
+            db.rollback()
+            if attempts < max_attempts:
+                _set_status(job_id, status='queued', error=f"{type(e).__name__}: {e}")
+                delay = Config.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+                timer = threading.Timer(delay, _dispatch, args=(job_id,))
+                timer.daemon = True
+                timer.start()
+            else:
+                _set_status(job_id, status='failed', error=f"{type(e).__name__}: {e}", finished_at=datetime.utcnow())
+            return
+    _set_status(job_id, status='succeeded', error=None, result=json.dumps(result, default=str),
+                finished_at=datetime.utcnow())
+
+def _dispatch(job_id: int):
+    """Hands a queued job to the worker pool."""
+    start_job_runner().submit(_run_job, job_id)
+
+def _requeue_orphaned_jobs() -> list[int]:
+    """Requeues running jobs whose process has exited or stopped sending heartbeats;
+    returns their ids. Their handlers are batch-safe to rerun."""
+    expired = datetime.utcnow() - timedelta(seconds=Config.JOB_HEARTBEAT_TIMEOUT)
+    requeued = []
+    with SessionLocal() as db:
+        running = db.query(Job.id, Job.owner, Job.heartbeat_at).filter(Job.status == 'running').all()
+    for job_id, owner, heartbeat_at in running:
+        alive = _owner_alive(owner)
+        if alive is None:
+            # A job that holds the write lock for long keeps even its own heartbeat waiting,
+            # so the heartbeat only decides for processes that cannot be checked directly
+            alive = heartbeat_at is not None and heartbeat_at >= expired
+        if alive:
+            continue
+        # Only if nobody claimed or refreshed it since it was read
+        heartbeat = Job.heartbeat_at.is_(None) if heartbeat_at is None else Job.heartbeat_at == heartbeat_at
+        if _set_status(job_id, Job.status == 'running', heartbeat, status='queued'):
+            requeued.append(job_id)
+    return requeued
+
+def _heartbeat_loop():
+    # Keeps this process's running jobs alive, and picks up jobs other processes dropped
+    while True:
+        time.sleep(Config.JOB_HEARTBEAT_INTERVAL)
+        try:
+            with SessionLocal() as db:
+                db.execute(
+                    update(Job).where(Job.status == 'running', Job.owner == _process_owner())
+                    .values(heartbeat_at=datetime.utcnow()),
+                    execution_options={'synchronize_session': False}
+                )
+                db.commit()
+            for job_id in _requeue_orphaned_jobs():
+                _dispatch(job_id)
+        except Exception:
+            logger.exception("Job heartbeat failed")
+
+def start_job_runner() -> ThreadPoolExecutor:
+    """Starts the worker pool and its heartbeat once per process, and requeues jobs left
+    behind by processes that are gone."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+        _pool = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='job')
+    threading.Thread(target=_heartbeat_loop, name='job-heartbeat', daemon=True).start()
+    _requeue_orphaned_jobs()
+    with SessionLocal() as db:
+        pending = db.query(Job.id).filter(Job.status == 'queued').order_by(Job.id).all()
+    for (job_id,) in pending:
+        _pool.submit(_run_job, job_id)
+    return _pool
+
+### --- Job Management --- ###
+
+def submit_job(db: Session, kind: str, params: dict | None = None, created_by: int | None = None) -> Job:
+    """Queues a job and returns it. Raises ValueError for unknown kinds."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind, use one of: {', '.join(sorted(JOB_HANDLERS))}")
+    job = Job(
+        kind=kind, params=json.dumps(params or {}), status='queued',
+        max_attempts=Config.JOB_MAX_ATTEMPTS, created_by=created_by
+    )
+    db.add(job)
+    db.commit()
+    _dispatch(job.id)
+    return job
+
+def get_job(db: Session, job_id: int) -> Job | None:
+    """Retrieves a job by its ID."""
+    return db.get(Job, job_id)
+
+def list_jobs(db: Session, status: str | None = None, limit: int = 50) -> list[Job]:
+    """Retrieves the most recent jobs, optionally only those with `status`."""
+    query = db.query(Job)
+    if status:
+        query = query.filter(Job.status == status)
+    return query.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit).all()
+
+def cancel_job(db: Session, job_id: int) -> Job | str:
+    """Cancels a queued job immediately; a running job stops at its next progress report."""
+    job = db.get(Job, job_id)
+    if not job:
+        return "Job not found."
+    if job.status in FINISHED_STATUSES:
+        return "Job has already finished."
+    db.execute(
+        update(Job).where(Job.id == job_id, Job.status.not_in(FINISHED_STATUSES)).values(cancel_requested=True),
+        execution_options={'synchronize_session': False}
+    )
+    db.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='cancelled', finished_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    db.commit()
+    db.refresh(job)
+    return job
+
+def retry_job(db: Session, job_id: int) -> Job | str:
+    """Requeues a failed or cancelled job with a fresh set of attempts."""
+    job = db.get(Job, job_id)
+    if not job:
+        return "Job not found."
+    requeued = db.execute(
+        update(Job).where(Job.id == job_id, Job.status.in_(('failed', 'cancelled'))).values(
+            status='queued', attempts=0, cancel_requested=False, error=None,
+            result=None, progress=None, started_at=None, finished_at=None
+        ),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not requeued:
+        db.rollback()
+        return "Only failed or cancelled jobs can be retried."
+    db.commit()
+    db.refresh(job)
+    _dispatch(job_id)
+    return job
+
+def job_to_dict(job: Job) -> dict:
+    """JSON representation of a job for the API."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'params': json.loads(job.params),
+        'status': job.status,
+        'progress': json.loads(job.progress) if job.progress else None,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'owner': job.owner,
+        'heartbeat_at': job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
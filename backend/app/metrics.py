@@ -0,0 +1,193 @@
+"""Opt-in request and SQL instrumentation (LIBRARY_METRICS_ENABLED).
+
+Per route it records wall time, SQL statement count and time spent in the database,
+and flags N+1 patterns: the same relationship lazy-loaded many times in one request.
+Statements slower than LIBRARY_SLOW_QUERY_MS are logged with their parameters.
+Aggregates are served by /admin/metrics (HTML) and /admin/metrics/prometheus.
+"""
+import logging
+import threading
+import time
+from collections import Counter, deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from config import Config
+
+logger = logging.getLogger('library.metrics')
+slow_query_logger = logging.getLogger('library.sql.slow')
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SLOW_QUERIES = 50
+
+### --- Aggregates --- ###
+
+class RouteStats:
+    """Running totals for one route."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.wall_time = 0.0
+        self.max_wall_time = 0.0
+        self.statements = 0
+        self.db_time = 0.0
+        self.lazy_loads = 0
+        self.n_plus_one = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    def record(self, wall: float, status: int, statements: int, db_time: float, lazy_loads: int, n_plus_one: int):
+        self.requests += 1
+        self.errors += status >= 500
+        self.wall_time += wall
+        self.max_wall_time = max(self.max_wall_time, wall)
+        self.statements += statements
+        self.db_time += db_time
+        self.lazy_loads += lazy_loads
+        self.n_plus_one += n_plus_one
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if wall <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self) -> dict:
+        n = self.requests or 1
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.wall_time / n * 1000, 2),
+            'max_ms': round(self.max_wall_time * 1000, 2),
+            'avg_statements': round(self.statements / n, 2),
+            'avg_db_ms': round(self.db_time / n * 1000, 2),
+            'lazy_loads': self.lazy_loads,
+            'n_plus_one': self.n_plus_one,
+        }
+
+_lock = threading.Lock()
+_routes = {}  # route -> RouteStats
+_slow_queries = deque(maxlen=RECENT_SLOW_QUERIES)
+_background = {'statements': 0, 'db_time': 0.0}  # SQL run outside requests (jobs, CLI)
+
+def get_metrics() -> dict:
+    """Snapshot of the per-route aggregates and the most recent slow queries."""
+    with _lock:
+        return {
+            'enabled': Config.METRICS_ENABLED,
+            'slow_query_ms': Config.SLOW_QUERY_MS,
+            'routes': {route: stats.as_dict() for route, stats in sorted(_routes.items())},
+            'background': dict(_background),
+            'slow_queries': list(_slow_queries),
+        }
+
+def reset_metrics():
+    """Clears all aggregates."""
+    with _lock:
+        _routes.clear()
+        _slow_queries.clear()
+        _background.update(statements=0, db_time=0.0)
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(extra: dict[str, tuple[str, float]] | None = None) -> str:
+    """Renders the aggregates in the Prometheus text exposition format.
+
+    `extra` maps further metric names to (type, value), e.g. pool and cache figures."""
+    with _lock:
+        routes = {route: stats for route, stats in sorted(_routes.items())}
+        lines = [
+            '# HELP library_request_duration_seconds Request wall time per route.',
+            '# TYPE library_request_duration_seconds histogram',
+        ]
+        for route, stats in routes.items():
+            label = f'route="{_label(route)}"'
+            for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                lines.append(f'library_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'library_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.requests}')
+            lines.append(f'library_request_duration_seconds_sum{{{label}}} {stats.wall_time:.6f}')
+            lines.append(f'library_request_duration_seconds_count{{{label}}} {stats.requests}')
+        for name, attr, help_text in (
+            ('library_request_errors_total', 'errors', 'Requests answered with a 5xx status.'),
+            ('library_sql_statements_total', 'statements', 'SQL statements executed by requests.'),
+            ('library_sql_seconds_total', 'db_time', 'Time requests spent executing SQL.'),
+            ('library_lazy_loads_total', 'lazy_loads', 'ORM relationship lazy loads.'),
+            ('library_n_plus_one_total', 'n_plus_one', 'Requests that repeated a lazy load past the N+1 threshold.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for route, stats in routes.items():
+                lines.append(f'{name}{{route="{_label(route)}"}} {getattr(stats, attr)}')
+        lines += [
+            '# HELP library_background_sql_statements_total SQL statements executed outside requests.',
+            '# TYPE library_background_sql_statements_total counter',
+            f"library_background_sql_statements_total {_background['statements']}",
+        ]
+    for name, (kind, value) in (extra or {}).items():
+        lines += [f'# TYPE {name} {kind}', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+### --- Hooks --- ###
+
+def _request_state() -> dict | None:
+    if has_request_context():
+        return g.get('_metrics')
+    return None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context so that failed statements leave nothing behind
+    context._metrics_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    state = _request_state()
+    if state is not None:
+        state['statements'] += 1
+        state['db_time'] += elapsed
+    else:
+        with _lock:
+            _background['statements'] += 1
+            _background['db_time'] += elapsed
+    if elapsed * 1000 >= Config.SLOW_QUERY_MS:
+        route = request.url_rule.rule if has_request_context() and request.url_rule else None
+        slow_query_logger.warning("%.1f ms [%s] %s %r", elapsed * 1000, route, statement, parameters)
+        with _lock:
+            _slow_queries.appendleft({
+                'ms': round(elapsed * 1000, 2), 'route': route,
+                'statement': statement, 'parameters': repr(parameters)[:500],
+            })
+
+def _do_orm_execute(orm_execute_state):
+    state = _request_state()
+    if state is not None and orm_execute_state.is_select and orm_execute_state.lazy_loaded_from is not None:
+        state['lazy_loads'][str(orm_execute_state.loader_strategy_path[-1])] += 1
+
+def _before_request():
+    g._metrics = {'start': time.perf_counter(), 'statements': 0, 'db_time': 0.0, 'lazy_loads': Counter()}
+
+def _after_request(response):
+    state = g.pop('_metrics', None)
+    if state is None:
+        return response
+    wall = time.perf_counter() - state['start']
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    suspects = [(key, n) for key, n in state['lazy_loads'].items() if n >= Config.N_PLUS_ONE_THRESHOLD]
+    for key, n in suspects:
+        logger.warning("Possible N+1 on %s %s: %s lazy-loaded %d times", request.method, route, key, n)
+    with _lock:
+        stats = _routes.setdefault(route, RouteStats())
+        stats.record(wall, response.status_code, state['statements'], state['db_time'],
+                     sum(state['lazy_loads'].values()), len(suspects))
+    return response
+
+_engines = set()
+
+def init_metrics(app, engine, session_factory):
+    """Installs the request hooks on `app` and the SQL hooks on `engine`/`session_factory`
+    when LIBRARY_METRICS_ENABLED is set."""
+    if not Config.METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if engine not in _engines:
+        _engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(session_factory, 'do_orm_execute', _do_orm_execute)
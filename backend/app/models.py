@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Float, ForeignKey, Boolean, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db.database import Base
@@ -12,6 +12,11 @@ class User(Base):
     email = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     role = Column(String, default="user") # 'user' or 'admin'
+
+    # Denormalized loan counters, kept in step with `borrowings` by the CRUD layer
+    # (see db/reconcile.py to recompute them)
+    active_loans = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    total_loans = Column(Integer, nullable=False, default=0, server_default=text("0"))
     
     borrowings = relationship("Borrowing", back_populates="user")
 
@@ -28,9 +33,17 @@ class Book(Base):
     genre = Column(String, index=True)
     total_copies = Column(Integer, default=1)
     available_copies = Column(Integer, default=1)
+    # Lifetime number of loans, maintained like the User counters
+    total_loans = Column(Integer, nullable=False, default=0, server_default=text("0"))
     
     borrowings = relationship("Borrowing", back_populates="book")
 
+    # Serve filtered catalog pages in (title, id) order straight from the index
+    __table_args__ = (
+        Index("ix_books_genre_title", "genre", "title"),
+        Index("ix_books_author_title", "author", "title"),
+    )
+
     def __repr__(self):
         return f"<Book(title='{self.title}', author='{self.author}')>"
 
@@ -51,5 +64,145 @@ class Borrowing(Base):
     user = relationship("User", back_populates="borrowings")
     book = relationship("Book", back_populates="borrowings")
 
+    __table_args__ = (
+        # A user can hold at most one active loan per book; enforced by the database
+        # so that concurrent borrow requests cannot both succeed. Being partial, it also
+        # serves every active-loan lookup by user (return, account deletion checks)
+        Index(
+            "uq_borrowings_active_loan", "user_id", "book_id", unique=True,
+            sqlite_where=text("status = 'borrowed'"),
+            postgresql_where=text("status = 'borrowed'")
+        ),
+        # A user's history newest-first, and per-user status counts without touching the table
+        Index("ix_borrowings_user_history", "user_id", "borrow_date", "status"),
+        # Active loans of a book and history cleanup when a book is deleted
+        Index("ix_borrowings_book_status", "book_id", "status"),
+        # Finds returned loans old enough to be archived, oldest first
+        Index(
+            "ix_borrowings_returned_date", "return_date",
+            sqlite_where=text("status = 'returned'"),
+            postgresql_where=text("status = 'returned'")
+        ),
+    )
+
     def __repr__(self):
         return f"<Borrowing(id={self.id}, user_id={self.user_id}, book_id={self.book_id}, status='{self.status}')>"
+
+class Hold(Base):
+    """A user's place in the waitlist of a book that has no copies left.
+
+    Rows only exist while the user is waiting: when a copy comes back it is lent to the
+    oldest holder in the same transaction and the hold is removed (see app/crud.py)."""
+    __tablename__ = "holds"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    user = relationship("User")
+    book = relationship("Book")
+
+    __table_args__ = (
+        # Each book's FIFO queue in order: the next holder and queue positions are index range lookups
+        Index("ix_holds_book_queue", "book_id", "created_at", "id"),
+        # One place per user and book; also lists a user's holds
+        Index("uq_holds_user_book", "user_id", "book_id", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<Hold(id={self.id}, user_id={self.user_id}, book_id={self.book_id})>"
+
+class ArchivedBorrowing(Base):
+    """A returned borrowing moved out of the live `borrowings` table (see app/archive.py).
+
+    Rows keep their original ID. There are no foreign keys, so history survives the
+    deletion of its book; `book_title` is a snapshot taken when the row was archived."""
+    __tablename__ = "borrowings_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    book_id = Column(Integer, nullable=False)
+    book_title = Column(String)
+    borrow_date = Column(DateTime)
+    return_date = Column(DateTime)
+    status = Column(String, default='returned')
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    book = relationship(
+        "Book", primaryjoin="foreign(ArchivedBorrowing.book_id) == Book.id", viewonly=True
+    )
+
+    __table_args__ = (
+        Index("ix_borrowings_archive_user_history", "user_id", "borrow_date"),
+        Index("ix_borrowings_archive_book", "book_id"),
+    )
+
+    def __repr__(self):
+        return f"<ArchivedBorrowing(id={self.id}, user_id={self.user_id}, book_id={self.book_id})>"
+
+class LoanStatsDaily(Base):
+    """Circulation of one book on one (UTC) day, maintained by app/analytics.py.
+
+    `loans` counts loans opened that day; `returns` and `loan_seconds` count the loans
+    closed that day and their total duration. There is no foreign key, so, like the
+    archive, the figures outlive a deleted book."""
+    __tablename__ = "loan_stats_daily"
+
+    day = Column(Date, primary_key=True)
+    book_id = Column(Integer, primary_key=True)
+    loans = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    returns = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    loan_seconds = Column(Float, nullable=False, default=0, server_default=text("0"))
+
+    # Stored in primary key order, day first: a report reads one contiguous date range
+    # without index lookups
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<LoanStatsDaily(day={self.day}, book_id={self.book_id}, loans={self.loans})>"
+
+class LoanStatsTotal(Base):
+    """Circulation of all books on one (UTC) day: the sum of that day's LoanStatsDaily rows,
+    kept alongside them so daily totals read one row per day."""
+    __tablename__ = "loan_stats_totals"
+
+    day = Column(Date, primary_key=True)
+    loans = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    returns = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    loan_seconds = Column(Float, nullable=False, default=0, server_default=text("0"))
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f"<LoanStatsTotal(day={self.day}, loans={self.loans}, returns={self.returns})>"
+
+class Job(Base):
+    """A background admin operation run by the job runner (see app/jobs.py)."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    params = Column(Text, nullable=False, default="{}") # JSON
+    # Status: 'queued', 'running', 'succeeded', 'failed' or 'cancelled'
+    status = Column(String, nullable=False, default="queued")
+    progress = Column(Text) # JSON, as last reported by the job
+    result = Column(Text) # JSON
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=1)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    owner = Column(String) # "host:pid" of the process running it
+    heartbeat_at = Column(DateTime) # refreshed by that process while the job runs
+    created_by = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        # Recent jobs listing, optionally filtered by status
+        Index("ix_jobs_status_created", "status", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind='{self.kind}', status='{self.status}')>"
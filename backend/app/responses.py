@@ -0,0 +1,97 @@
+"""Conditional GET and compression for API and page responses.
+
+ETags are derived from the in-process change stamps that writes already bump (the catalog
+cache version and the user activity stamps), never from the response body, so a poll
+that matches is answered with 304 before any database work. The stamps are per process:
+every ETag also carries the process's identity, so a restart or another worker never
+matches a stale tag, and a time window of Config.ETAG_TTL seconds, which bounds how long
+a client can keep a copy that another worker process has since changed.
+"""
+import gzip
+import hashlib
+import os
+import time
+from functools import wraps
+from flask import request, make_response
+from werkzeug.http import parse_etags, parse_accept_header
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Identifies this process's stamps
+_INSTANCE = os.urandom(8).hex()
+
+# Content types worth compressing
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/csv', 'application/x-ndjson')
+
+def make_etag(*stamp) -> str:
+    """Builds the (weak) entity tag for a resource whose state is described by `stamp`."""
+    window = int(time.time() // Config.ETAG_TTL) if Config.ETAG_TTL else 0
+    return hashlib.blake2b(repr((_INSTANCE, window) + stamp).encode(), digest_size=12).hexdigest()
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison against an If-None-Match header, as RFC 9110 requires for GET."""
+    return bool(if_none_match) and parse_etags(if_none_match).contains_weak(etag)
+
+def conditional(stamp):
+    """Decorator: answers 304 Not Modified when the client already has the current version.
+
+    `stamp` receives the view's URL arguments and returns the change stamp of the
+    resource; it is read before the view runs, so a write that commits meanwhile can
+    only make the tag older than the data, never newer. A stamp of None (the version
+    is unknown) serves the view without a tag."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not Config.ETAG_ENABLED:
+                return f(*args, **kwargs)
+            version = stamp(*args, **kwargs)
+            if version is None:
+                return f(*args, **kwargs)
+            etag = make_etag(request.path, request.query_string, version)
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Cached copies must be revalidated, and only by the client that fetched them
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+def compress(body: bytes, accept_encoding: str | None) -> tuple[bytes, str] | None:
+    """Compresses `body` for a client sending `accept_encoding`.
+
+    Returns (body, content encoding), or None when the body is too small or the client
+    accepts no supported encoding."""
+    if len(body) < Config.COMPRESSION_MIN_SIZE or not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    if brotli is not None and accepted['br']:
+        return brotli.compress(body, quality=Config.COMPRESSION_LEVEL), 'br'
+    if accepted['gzip']:
+        return gzip.compress(body, compresslevel=Config.COMPRESSION_LEVEL, mtime=0), 'gzip'
+    return None
+
+def _compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    compressed = compress(response.get_data(), request.headers.get('Accept-Encoding'))
+    if compressed is not None:
+        body, encoding = compressed
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def init_compression(app):
+    """Compresses large JSON, HTML and CSV responses when LIBRARY_COMPRESSION_ENABLED is set."""
+    if Config.COMPRESSION_ENABLED:
+        app.after_request(_compress_response)
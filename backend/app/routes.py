@@ -1,12 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, Response
+from markupsafe import Markup
 from app.crud import (
-    authenticate_user, create_user, search_books, get_all_books, 
-    borrow_book, return_book, get_user_borrowings, 
-    create_book, update_book, delete_book, get_book_by_id,
-    get_all_users_with_borrowing_status # <-- Added new function
+    authenticate_user, create_user, search_books_page, get_books_page, 
+    borrow_book, return_book, get_user_history,
+    place_hold, cancel_hold, get_user_holds,
+    create_book, update_book, get_book_by_id, get_user_by_id,
+    get_all_users_with_borrowing_status, # <-- Added new function
+    DEFAULT_PAGE_SIZE
 )
-from app.utils import login_required, role_required
-from db.database import get_db
+from app.utils import login_required, role_required, get_page_args
+from app.security import HashingBusy, login_retry_after, record_login_result
+from app.metrics import get_metrics, render_prometheus
+from app.cache import catalog_cache
+from app.events import availability_bus, stream_events, StreamLimitReached
+from app.fragments import catalog_fragment, user_fragment, report_fragment
+from app.jobs import submit_job
+from config import Config
+from db.database import get_request_db, get_request_report_db, get_pool_metrics, get_report_metrics
 
 # Create blueprints for modular routing
 auth = Blueprint('auth', __name__, url_prefix='/')
@@ -23,42 +33,54 @@ def index():
 
     if request.method == 'POST':
         action = request.form.get('action')
-        db_generator = get_db()
-        db = next(db_generator)
+        db = get_request_db()
 
-        try:
-            if action == 'login':
-                username = request.form.get('username')
-                password = request.form.get('password')
+        if action == 'login':
+            username = request.form.get('username') or ''
+            password = request.form.get('password') or ''
+
+            # Refuse throttled clients before spending any hashing time on them
+            retry_after = login_retry_after(username, request.remote_addr or '')
+            if retry_after:
+                flash(f"Too many failed login attempts. Please try again in {retry_after} seconds.", "error")
+                return render_template('index.html'), 429
+
+            try:
                 user = authenticate_user(db, username, password)
-                
-                if user:
-                    session.clear()
-                    session['user_id'] = user.id
-                    session['username'] = user.username
-                    session['user_role'] = user.role
-                    flash(f"Welcome, {user.username}!", "success")
-                    return redirect(url_for('main.dashboard'))
-                else:
-                    flash("Invalid username or password.", "error")
+            except HashingBusy:
+                flash("The server is busy. Please try again in a moment.", "error")
+                return render_template('index.html'), 503
+            record_login_result(username, request.remote_addr or '', user is not None)
+            
+            if user:
+                session.clear()
+                session['user_id'] = user.id
+                session['username'] = user.username
+                session['user_role'] = user.role
+                flash(f"Welcome, {user.username}!", "success")
+                return redirect(url_for('main.dashboard'))
+            else:
+                flash("Invalid username or password.", "error")
+        
+        elif action == 'register':
+            username = request.form.get('reg_username')
+            email = request.form.get('reg_email')
+            password = request.form.get('reg_password')
             
-            elif action == 'register':
-                username = request.form.get('reg_username')
-                email = request.form.get('reg_email')
-                password = request.form.get('reg_password')
-                
-                if not (username and email and password):
-                    flash("Please fill in all registration fields.", "error")
-                    return render_template('index.html')
+            if not (username and email and password):
+                flash("Please fill in all registration fields.", "error")
+                return render_template('index.html')
 
+            try:
                 user = create_user(db, username, email, password)
-                
-                if user:
-                    flash("Registration successful. Please log in.", "success")
-                else:
-                    flash("Username or email already in use.", "error")
-        finally:
-            next(db_generator, None)
+            except HashingBusy:
+                flash("The server is busy. Please try again in a moment.", "error")
+                return render_template('index.html'), 503
+            
+            if user:
+                flash("Registration successful. Please log in.", "success")
+            else:
+                flash("Username or email already in use.", "error")
             
     return render_template('index.html')
 
@@ -72,29 +94,47 @@ def logout():
 
 ### --- MAIN LIBRARY ROUTES (User/Admin) --- ###
 
+def _get_catalog_page(db, page_args: dict) -> dict:
+    """Loads a catalog page, starting over from the first page if the cursor is invalid."""
+    try:
+        return get_books_page(db, **page_args)
+    except ValueError:
+        return get_books_page(db, page_args['page_size'], genre=page_args['genre'], author=page_args['author'])
+
 @main.route('/dashboard')
 @login_required
 def dashboard():
     """Main library dashboard: search, browse, view borrowings."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
     
-    try:
-        query = request.args.get('query')
-        if query:
-            books = search_books(db, query)
-        else:
-            books = get_all_books(db)
-        
-        user_borrowings = get_user_borrowings(db, session['user_id'])
-        
-    finally:
-        next(db_generator, None)
+    user_id = session['user_id']
+    query = request.args.get('query')
+    page_args = get_page_args(DEFAULT_PAGE_SIZE)
+    if query:
+        # Search results are not cached; their cursors are plain offsets
+        cursor = page_args['after'] or page_args['before'] or ''
+        page = search_books_page(db, query, page_args['page_size'], int(cursor) if cursor.isdigit() else 0)
+        book_rows = Markup(render_template('_catalog_rows.html', books=page['books']))
+    else:
+        version = catalog_cache.version
+        page = _get_catalog_page(db, page_args)
+        book_rows = catalog_fragment('_catalog_rows.html', page, page_args, version)
+    
+    my_borrowings = user_fragment('_my_borrowings.html', user_id, lambda: {
+        'borrowings': get_user_history(db, user_id)
+    })
+    user_holds = get_user_holds(db, user_id)
 
     return render_template(
         'dashboard.html', 
-        books=books, 
-        borrowings=user_borrowings, 
+        books=page['books'], 
+        book_rows=book_rows,
+        next_cursor=page['next_cursor'],
+        prev_cursor=page['prev_cursor'],
+        page_args=page_args,
+        search_query=query,
+        my_borrowings=my_borrowings, 
+        holds=user_holds,
         role=session.get('user_role')
     )
 
@@ -102,17 +142,13 @@ def dashboard():
 @login_required
 def borrow(book_id):
     """Handles book borrowing request."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
     
-    try:
-        result = borrow_book(db, session['user_id'], book_id)
-        if isinstance(result, str):
-            flash(f"Borrow failed: {result}", "error")
-        else:
-            flash(f"Successfully borrowed '{result.book.title}'.", "success")
-    finally:
-        next(db_generator, None)
+    result = borrow_book(db, session['user_id'], book_id)
+    if isinstance(result, str):
+        flash(f"Borrow failed: {result}", "error")
+    else:
+        flash(f"Successfully borrowed '{result.book.title}'.", "success")
         
     return redirect(url_for('main.dashboard'))
 
@@ -120,58 +156,156 @@ def borrow(book_id):
 @login_required
 def return_book_route(book_id):
     """Handles book return request."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
     
-    try:
-        result = return_book(db, session['user_id'], book_id)
-        if isinstance(result, str):
-            flash(f"Return failed: {result}", "error")
-        else:
-            flash(f"Successfully returned '{result.book.title}'.", "success")
-    finally:
-        next(db_generator, None)
+    result = return_book(db, session['user_id'], book_id)
+    if isinstance(result, str):
+        flash(f"Return failed: {result}", "error")
+    else:
+        flash(f"Successfully returned '{result.book.title}'.", "success")
         
     return redirect(url_for('main.dashboard'))
 
+@main.route('/hold/<int:book_id>')
+@login_required
+def hold(book_id):
+    """Joins the waitlist of a book with no copies left."""
+    db = get_request_db()
+
+    result = place_hold(db, session['user_id'], book_id)
+    if isinstance(result, str):
+        flash(f"Hold failed: {result}", "error")
+    else:
+        flash(f"You are number {result['position']} on the waitlist for '{result['title']}'. "
+              "The book will be lent to you automatically when a copy comes back.", "success")
+
+    return redirect(url_for('main.dashboard'))
+
+@main.route('/hold/<int:book_id>/cancel')
+@login_required
+def cancel_hold_route(book_id):
+    """Leaves a book's waitlist."""
+    db = get_request_db()
+
+    if cancel_hold(db, session['user_id'], book_id):
+        flash("You have left the waitlist.", "success")
+    else:
+        flash("You are not on the waitlist for this book.", "error")
+
+    return redirect(url_for('main.dashboard'))
+
+@main.route('/events/availability')
+@login_required
+def availability_events():
+    """Streams availability changes as server-sent events, so open dashboards update in place."""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    try:
+        subscription = availability_bus.subscribe(last_event_id)
+    except StreamLimitReached:
+        # EventSource retries on its own after the `retry` interval
+        return Response("Too many open streams, try again later.", status=503,
+                        headers={'Retry-After': str(Config.EVENTS_KEEPALIVE)})
+    # The generator runs after the request has ended, so it must not use the request's session
+    response = Response(stream_events(availability_bus, subscription), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # stop nginx from buffering the stream
+    })
+    response.call_on_close(lambda: availability_bus.unsubscribe(subscription))
+    return response
+
 ### --- ADMIN ROUTES --- ###
 
 @admin.route('/panel', methods=['GET'])
 @role_required('admin')
 def admin_panel():
     """Admin panel for managing books."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
     
-    try:
-        books = get_all_books(db)
-        user_logs = get_all_users_with_borrowing_status(db)
-    finally:
-        next(db_generator, None)
-    return render_template('admin_panel.html', books=books, user_logs=user_logs)
+    page_args = get_page_args(DEFAULT_PAGE_SIZE)
+    version = catalog_cache.version
+    page = _get_catalog_page(db, page_args)
+    return render_template(
+        'admin_panel.html',
+        book_rows=catalog_fragment('_admin_book_rows.html', page, page_args, version),
+        next_cursor=page['next_cursor'],
+        prev_cursor=page['prev_cursor'],
+        page_args=page_args,
+        user_summary=_user_summary()
+    )
+
+def _user_summary():
+    # Reporting read, cached under the stamp of the report data rather than the live one
+    db = get_request_report_db()
+    return report_fragment('_user_summary.html', db, lambda: {
+        'user_logs': get_all_users_with_borrowing_status(db)
+    })
 
 @admin.route('/logs', methods=['GET']) # <-- NEW ROUTE
+@admin.route('/logs/<int:user_id>', methods=['GET'])
 @role_required('admin')
-def admin_logs():
+def admin_logs(user_id=None):
     """Admin view for user borrowing logs and user management info."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
 
-    try:
-        # Fetch detailed user and borrowing data
-        user_logs = get_all_users_with_borrowing_status(db)
-    finally:
-        next(db_generator, None)
-    
-    return render_template('admin_logs.html', user_logs=user_logs)
+    selected_user = get_user_by_id(db, user_id) if user_id is not None else None
+    if user_id is not None and not selected_user:
+        flash("User not found.", "error")
+        return redirect(url_for('admin.admin_logs'))
+
+    # Full history is loaded only for the selected user, and archived history only when asked for
+    user_log = None
+    if selected_user:
+        include_archived = request.args.get('archived') == '1'
+        selected = {'id': selected_user.id, 'username': selected_user.username}
+        user_log = user_fragment('_user_log.html', user_id, lambda: {
+            'selected_user': selected,
+            'history': get_user_history(db, user_id, include_archived),
+            'include_archived': include_archived,
+        }, include_archived)
+
+    return render_template('admin_logs.html', user_log=user_log, user_summary=_user_summary())
 
 
+@admin.route('/metrics', methods=['GET'])
+@role_required('admin')
+def admin_metrics():
+    """Admin view of per-route timings, SQL counts and recent slow queries."""
+    return render_template('admin_metrics.html', metrics=get_metrics(), pool=get_pool_metrics(),
+                           cache=catalog_cache.stats())
+
+@admin.route('/metrics/prometheus', methods=['GET'])
+def admin_metrics_prometheus():
+    """Prometheus scrape target: an admin session or the configured bearer token."""
+    token = Config.METRICS_TOKEN
+    authorized = session.get('user_role') == 'admin' or (
+        token and request.headers.get('Authorization') == f'Bearer {token}'
+    )
+    if not authorized:
+        return Response("Forbidden\n", status=403, mimetype='text/plain')
+    pool = get_pool_metrics()
+    cache = catalog_cache.stats()
+    streams = availability_bus.stats()
+    extra = {
+        'library_db_pool_checked_out': ('gauge', pool['checked_out']),
+        'library_db_pool_overflow': ('gauge', pool['overflow']),
+        'library_db_pool_checkouts_total': ('counter', pool['checkouts']),
+        'library_catalog_cache_entries': ('gauge', cache['entries']),
+        'library_catalog_cache_hits_total': ('counter', cache['hits']),
+        'library_catalog_cache_misses_total': ('counter', cache['misses']),
+        'library_availability_streams': ('gauge', streams['subscribers']),
+        'library_availability_events_total': ('counter', streams['published']),
+    }
+    report = get_report_metrics()
+    if report.get('age') is not None:
+        extra['library_report_snapshot_age_seconds'] = ('gauge', report['age'])
+        extra['library_report_snapshot_refreshes_total'] = ('counter', report['refreshes'])
+    return Response(render_prometheus(extra), mimetype='text/plain; version=0.0.4')
+
 @admin.route('/book/add', methods=['POST'])
 @role_required('admin')
 def add_book():
     """Handles adding a new book."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
 
     try:
         title = request.form.get('title')
@@ -184,8 +318,6 @@ def add_book():
     
     except Exception as e:
         flash(f"Error adding book: {e}", "error")
-    finally:
-        next(db_generator, None)
 
     return redirect(url_for('admin.admin_panel'))
 
@@ -193,8 +325,7 @@ def add_book():
 @role_required('admin')
 def edit_book(book_id):
     """Handles editing an existing book."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
     
     try:
         title = request.form.get('title')
@@ -210,8 +341,6 @@ def edit_book(book_id):
             
     except Exception as e:
         flash(f"Error editing book: {e}", "error")
-    finally:
-        next(db_generator, None)
 
     return redirect(url_for('admin.admin_panel'))
 
@@ -219,18 +348,18 @@ def edit_book(book_id):
 @role_required('admin')
 def delete_book_route(book_id):
     """Handles deleting a book."""
-    db_generator = get_db()
-    db = next(db_generator)
+    db = get_request_db()
     
     try:
-        if delete_book(db, book_id):
-            flash("Book deleted successfully.", "success")
+        book = get_book_by_id(db, book_id)
+        if book:
+            # Deleting a book rewrites its loan history, so it runs on the job runner
+            job = submit_job(db, 'delete_book', {'book_id': book_id}, session.get('user_id'))
+            flash(f"Book '{book.title}' is being deleted (job #{job.id}).", "success")
         else:
             flash("Book not found for deletion.", "error")
             
     except Exception as e:
         flash(f"Error deleting book: {e}", "error")
-    finally:
-        next(db_generator, None)
 
     return redirect(url_for('admin.admin_panel'))
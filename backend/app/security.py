@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+
+class HashingBusy(Exception):
+    """Raised when the password hashing pool is saturated or too slow to answer in time."""
+    pass
+
+### --- Password Hashing --- ###
+
+# Hashing runs on a fixed-size pool so that login storms cannot occupy more CPUs than
+# configured; requests beyond the pending limit are refused instead of queueing forever.
+# This bounds CPU use only: the request thread still waits for its result, for at most
+# PASSWORD_HASH_TIMEOUT seconds.
+_hash_pool = ThreadPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_hash_slots = threading.BoundedSemaphore(Config.PASSWORD_HASH_MAX_PENDING)
+
+def _run_hashing(fn, *args):
+    """Runs `fn` on the hashing pool and waits for its result.
+
+    Raises HashingBusy if the pool is full or the result takes longer than PASSWORD_HASH_TIMEOUT."""
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingBusy("Too many password operations in progress.")
+    try:
+        future = _hash_pool.submit(fn, *args)
+    except Exception:
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    try:
+        return future.result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeout:
+        # Drops the job if it has not started yet; a running one finishes and frees its slot
+        future.cancel()
+        raise HashingBusy("Password operation timed out.")
+
+def hash_password(password: str) -> str:
+    """Hashes a password with the configured policy."""
+    return _run_hashing(generate_password_hash, password, Config.PASSWORD_HASH_METHOD)
+
+def verify_password(hashed_password: str, password: str) -> bool:
+    """Checks a password against a stored hash."""
+    return _run_hashing(check_password_hash, hashed_password, password)
+
+@lru_cache(maxsize=1)
+def _policy_prefix() -> str:
+    # werkzeug expands defaults (e.g. 'scrypt' -> 'scrypt:32768:8:1'), so derive the prefix from a real hash
+    return generate_password_hash('', method=Config.PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True if a stored hash was produced with a method other than the current policy."""
+    return hashed_password.split('$', 1)[0] != _policy_prefix()
+
+### --- Login Throttling --- ###
+
+class LoginThrottle:
+    """Counts failed logins per key in fixed windows, keeping at most `max_keys` keys (LRU)."""
+
+    def __init__(self, max_failures: int, window: int, max_keys: int):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> [failures, window_start]
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: str) -> int:
+        """Seconds until `key` may try again, or 0 if it is not throttled."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0
+            failures, window_start = entry
+            if now - window_start >= self.window:
+                del self._entries[key]
+                return 0
+            if failures < self.max_failures:
+                return 0
+            return int(window_start + self.window - now) + 1
+
+    def record_failure(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] >= self.window:
+                entry = self._entries[key] = [0, now]
+            entry[0] += 1
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+user_throttle = LoginThrottle(Config.LOGIN_MAX_FAILURES_PER_USER, Config.LOGIN_FAILURE_WINDOW, Config.LOGIN_THROTTLE_MAX_KEYS)
+ip_throttle = LoginThrottle(Config.LOGIN_MAX_FAILURES_PER_IP, Config.LOGIN_FAILURE_WINDOW, Config.LOGIN_THROTTLE_MAX_KEYS)
+
+def login_retry_after(username: str, ip: str) -> int:
+    """Seconds before a login for this username/IP may be attempted, 0 if allowed now."""
+    return max(user_throttle.retry_after(username.lower()), ip_throttle.retry_after(ip))
+
+def record_login_result(username: str, ip: str, success: bool):
+    """Updates the throttles after a password check."""
+    if success:
+        user_throttle.reset(username.lower())
+    else:
+        user_throttle.record_failure(username.lower())
+        ip_throttle.record_failure(ip)
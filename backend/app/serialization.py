@@ -0,0 +1,84 @@
+"""Field schemas for API payloads and the JSON encoder used for responses.
+
+Handlers select exactly a schema's columns as Core rows and dump those to plain dicts,
+instead of hydrating ORM objects (identity map, attribute instrumentation, relationship
+loading) only to read a few attributes. JSON is encoded with orjson when it is
+installed and with the standard library otherwise.
+"""
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: standard library encoder
+    orjson = None
+
+class Schema:
+    """The fields of one kind of record, in the order they are selected and sent.
+
+    `dates` are the fields holding datetimes, sent as ISO 8601 strings."""
+
+    def __init__(self, *fields: str, dates: tuple[str, ...] = ()):
+        self.fields = fields
+        self.dates = dates
+        self._date_fields = tuple(field for field in fields if field in dates)
+
+    def columns(self, model) -> tuple:
+        """The model's columns for these fields, to pass to `select()`."""
+        return tuple(getattr(model, field) for field in self.fields)
+
+    def extend(self, *fields: str) -> 'Schema':
+        """This schema plus computed `fields`, selected after the columns."""
+        return Schema(*self.fields, *fields, dates=self.dates)
+
+    def without(self, *fields: str) -> 'Schema':
+        return Schema(*(field for field in self.fields if field not in fields), dates=self.dates)
+
+    def dump(self, row) -> dict:
+        """Converts a row (any sequence in field order, e.g. a Core row) to a JSON-ready dict."""
+        item = dict(zip(self.fields, row))
+        for field in self._date_fields:
+            value = item[field]
+            if value is not None:
+                item[field] = value.isoformat()
+        return item
+
+    def dump_all(self, rows) -> list[dict]:
+        if not self._date_fields:
+            fields = self.fields
+            return [dict(zip(fields, row)) for row in rows]
+        return [self.dump(row) for row in rows]
+
+# Field order matches crud.BookRow
+BOOK = Schema('id', 'title', 'author', 'genre', 'total_copies', 'available_copies')
+# Never includes the password hash
+USER = Schema('id', 'username', 'email', 'role')
+BORROWING = Schema('id', 'user_id', 'book_id', 'borrow_date', 'return_date', 'status',
+                   dates=('borrow_date', 'return_date'))
+
+def dumps(obj, sort_keys: bool = True) -> bytes:
+    """Encodes `obj` as compact JSON. Values JSON has no type for are converted the way
+    Flask converts them (dates as HTTP dates, decimals as strings, ...)."""
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=option)
+    return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=sort_keys,
+                      separators=(',', ':')).encode()
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with `dumps` (keys sorted, like Flask's default).
+
+    Output is UTF-8 rather than ASCII with escapes; debug mode keeps Flask's indented output."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
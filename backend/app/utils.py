@@ -1,5 +1,5 @@
 from functools import wraps
-from flask import session, redirect, url_for, flash
+from flask import session, redirect, url_for, flash, request
 
 def login_required(f):
     """Decorator to check if a user is logged in."""
@@ -22,3 +22,20 @@ def role_required(required_role):
             return f(*args, **kwargs)
         return decorated_function
     return decorator
+
+def get_page_args(default_page_size: int, args=None) -> dict:
+    """Reads catalog pagination and filter arguments from the query string
+    (`args`, the current request's by default)."""
+    if args is None:
+        args = request.args
+    try:
+        page_size = int(args.get('page_size', default_page_size))
+    except ValueError:
+        page_size = default_page_size
+    return {
+        'page_size': page_size,
+        'after': args.get('after') or None,
+        'before': args.get('before') or None,
+        'genre': args.get('genre') or None,
+        'author': args.get('author') or None,
+    }
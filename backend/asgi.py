@@ -0,0 +1,22 @@
+"""ASGI entry point: serves the same app as main.py under an ASGI server.
+
+    uvicorn asgi:app --workers 1 --port 5000
+    python asgi.py            (uvicorn with LIBRARY_ASGI_WORKERS workers)
+
+See app/asgi.py for how requests are spread over the event loop and threads.
+"""
+import os
+from main import create_app
+from app.asgi import LibraryASGI
+from config import Config
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # Set the working directory to the backend folder for correct path resolution
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    print(f"Starting ASGI application with {Config.ASGI_WORKERS} worker(s)...")
+    uvicorn.run('asgi:app', host='127.0.0.1', port=5000, workers=Config.ASGI_WORKERS)
+else:
+    # Built in the worker processes only, not in the process that starts them
+    app = LibraryASGI(create_app())
@@ -0,0 +1 @@
+# Intentional blank file to mark 'benchmarks' as a Python package.
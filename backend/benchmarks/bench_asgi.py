@@ -0,0 +1,184 @@
+"""Compares requests per second of the threaded WSGI server (main.py) and the ASGI entry
+point (asgi.py under uvicorn) on the same generated library.
+
+Run from the backend folder:
+    python -m benchmarks.bench_asgi --concurrency 8,32,128 --duration 10
+
+Each server runs in its own process. For every scenario and concurrency level, that many
+client threads issue requests over keep-alive connections for `--duration` seconds:
+`api_reads` mixes the catalog page, single book and waitlist endpoints (served natively
+on the event loop in ASGI mode), `dashboard` renders the member dashboard (a Flask view
+in both modes). The clients share one Python process, so at high rates they can become
+the bottleneck; compare the servers at the same settings only.
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+SERVERS = {
+    'wsgi': [sys.executable, '-c',
+             "import sys; from werkzeug.serving import run_simple; from main import create_app; "
+             "run_simple('127.0.0.1', int(sys.argv[1]), create_app(), threaded=True)"],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--log-level', 'warning', '--port'],
+}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+def login(port: int, username: str, password: str) -> str:
+    """Logs in and returns the Cookie header for the session."""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/', urlencode({'action': 'login', 'username': username, 'password': password}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    cookie = SimpleCookie(response.getheader('Set-Cookie') or '')
+    if response.status != 302 or 'session' not in cookie:
+        raise RuntimeError(f"Login failed for {username}: HTTP {response.status}")
+    return f"session={cookie['session'].value}"
+
+def scenario_paths(scenario: str, dataset: dict, rng: random.Random):
+    """Yields (path, session) for `scenario` forever; session is 'admin' or 'member'."""
+    while True:
+        if scenario == 'dashboard':
+            yield '/dashboard', 'member'
+        else:
+            book_id = dataset['first_book_id'] + rng.randrange(dataset['books'])
+            yield rng.choice([
+                ('/api/books?page_size=50', 'admin'),
+                (f'/api/books/{book_id}', 'admin'),
+                ('/api/holds', 'member'),
+            ])
+
+def run_clients(port: int, scenario: str, dataset: dict, cookies: dict, concurrency: int,
+                duration: float, seed: int) -> dict:
+    from benchmarks.results import summarize
+
+    timings, errors = [], [0]
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def client(index: int):
+        paths = scenario_paths(scenario, dataset, random.Random(seed + index))
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            path, session = next(paths)
+            began = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookies[session]})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append((time.perf_counter() - began) * 1000)
+        conn.close()
+        with lock:
+            timings.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = summarize(timings, errors[0]) if timings else {'n': 0, 'errors': errors[0]}
+    # Throughput of the whole run, not per client (ops_per_s is per connection)
+    stats['requests_per_s'] = round(len(timings) / elapsed, 1)
+    return stats
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--borrowings", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", default="8,32,128", help="Comma-separated client thread counts")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per measurement")
+    parser.add_argument("--servers", default="wsgi,asgi")
+    parser.add_argument("--scenarios", default="api_reads,dashboard")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="library-bench-")
+    try:
+        return run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run(args, workdir: str) -> int:
+    os.environ['LIBRARY_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('LIBRARY_JOB_UPLOAD_DIR', os.path.join(workdir, 'uploads'))
+    from app.security import hash_password
+    from benchmarks.data import generate_library
+    from benchmarks.results import environment, write_results
+    from db.database import engine, SessionLocal
+    from db.init_db import init_db
+
+    with SessionLocal() as db:
+        init_db(db)
+    dataset = generate_library(engine, args.users, args.books, args.borrowings, seed=args.seed,
+                               password_hash=hash_password('password'))
+    engine.dispose()
+
+    benchmarks = {}
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'server':<6} {'scenario':<10} {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for server in args.servers.split(","):
+        port = free_port()
+        process = subprocess.Popen(SERVERS[server] + [str(port)], cwd=backend_dir,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            cookies = {'admin': login(port, 'admin', 'adminpass'), 'member': login(port, 'loaduser0', 'password')}
+            for scenario in args.scenarios.split(","):
+                for concurrency in (int(n) for n in args.concurrency.split(",")):
+                    stats = run_clients(port, scenario, dataset, cookies, concurrency, args.duration, args.seed)
+                    benchmarks[f"{server}/{scenario}/c{concurrency}"] = stats
+                    print(f"{server:<6} {scenario:<10} {concurrency:>7} {stats['requests_per_s']:>9.1f} "
+                          f"{stats.get('p50_ms', 0):>8.2f} {stats.get('p99_ms', 0):>8.2f} {stats['errors']:>6}")
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.output:
+        write_results(args.output, {
+            'environment': environment(),
+            'parameters': {key: getattr(args, key) for key in
+                           ('users', 'books', 'borrowings', 'seed', 'concurrency', 'duration')},
+            'benchmarks': benchmarks,
+        })
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
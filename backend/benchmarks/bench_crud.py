@@ -0,0 +1,282 @@
+"""Micro-benchmarks for the public functions of `app.crud`.
+
+Each benchmark runs one call per iteration on a fresh session state and is timed on its
+own. They run in registration order, so write benchmarks can depend on earlier ones
+(e.g. delete_book deletes the books created by create_book). Used by benchmarks.suite.
+"""
+import inspect
+import random
+import time
+from app import crud
+from app.cache import catalog_cache
+from benchmarks.results import summarize
+
+DEFAULT_ITERATIONS = 200
+
+class BenchContext:
+    """State shared by the benchmarks of one run."""
+
+    def __init__(self, db, dataset: dict, seed: int):
+        self.db = db
+        self.rng = random.Random(seed)
+        self.dataset = dataset
+        self.created_users = []
+        self.created_books = []
+        self.loans = []      # (user_id, book_id) borrowed by the borrow benchmarks
+        self.batches = []    # (user_id, [book_ids]) borrowed by borrow_books
+        self.holders = []    # user_ids queued by place_hold on `waitlisted_book`
+        self._waitlisted_book = None
+        self.counter = 0
+
+    def user_id(self) -> int:
+        return self.dataset['first_user_id'] + self.rng.randrange(self.dataset['users'])
+
+    def book_id(self) -> int:
+        return self.dataset['first_book_id'] + self.rng.randrange(self.dataset['books'])
+
+    def word(self) -> str:
+        return self.rng.choice(self.dataset['words'])
+
+    def waitlisted_book(self) -> int:
+        """A one-copy book kept on loan, so that every hold joins its queue."""
+        if self._waitlisted_book is None:
+            book = crud.create_book(self.db, self.unique('Bench Waitlist '), 'Bench Author', 'Poetry', 1)
+            crud.borrow_book(self.db, self.user_id(), book.id)
+            self._waitlisted_book = book.id
+        return self._waitlisted_book
+
+    def unique(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+# name -> (function(ctx), iterations or None for the default, crud functions covered)
+BENCHMARKS = {}
+
+def benchmark(name: str, iterations: int | None = None, covers: tuple[str, ...] = ()):
+    def register(fn):
+        BENCHMARKS[name] = (fn, iterations, covers or (name.split('[')[0],))
+        return fn
+    return register
+
+### --- Users --- ###
+
+@benchmark('create_user', iterations=5)
+def _create_user(ctx):
+    username = ctx.unique('benchuser')
+    user = crud.create_user(ctx.db, username, f"{username}@bench.local", 'password')
+    ctx.created_users.append(user.id)
+
+@benchmark('authenticate_user', iterations=5)
+def _authenticate_user(ctx):
+    crud.authenticate_user(ctx.db, 'loaduser0', 'password')
+
+@benchmark('get_user_by_id')
+def _get_user_by_id(ctx):
+    crud.get_user_by_id(ctx.db, ctx.user_id())
+
+### --- Book reads --- ###
+
+@benchmark('get_book_by_id')
+def _get_book_by_id(ctx):
+    crud.get_book_by_id(ctx.db, ctx.book_id())
+
+@benchmark('get_book_row[cold]')
+def _get_book_row_cold(ctx):
+    catalog_cache.clear()
+    crud.get_book_row(ctx.db, ctx.book_id())
+
+@benchmark('get_book_row[warm]')
+def _get_book_row_warm(ctx):
+    crud.get_book_row(ctx.db, ctx.dataset['first_book_id'])
+
+@benchmark('get_all_books', iterations=5)
+def _get_all_books(ctx):
+    crud.get_all_books(ctx.db)
+
+@benchmark('book_cursor', covers=('encode_book_cursor', 'decode_book_cursor'))
+def _book_cursor(ctx):
+    crud.decode_book_cursor(crud.encode_book_cursor(crud.BookRow(1, ctx.word(), 'a', None, 1, 1)))
+
+@benchmark('get_books_page[first]')
+def _get_books_page_first(ctx):
+    catalog_cache.clear()
+    crud.get_books_page(ctx.db)
+
+@benchmark('get_books_page[genre]')
+def _get_books_page_genre(ctx):
+    catalog_cache.clear()
+    crud.get_books_page(ctx.db, genre='Poetry')
+
+@benchmark('get_books_page[deep]')
+def _get_books_page_deep(ctx):
+    catalog_cache.clear()
+    row = crud.get_book_row(ctx.db, ctx.book_id())
+    crud.get_books_page(ctx.db, after=crud.encode_book_cursor(row))
+
+@benchmark('search_books[word]')
+def _search_books_word(ctx):
+    crud.search_books(ctx.db, ctx.word())
+
+@benchmark('search_books[prefix]')
+def _search_books_prefix(ctx):
+    crud.search_books(ctx.db, ctx.word()[:3])
+
+@benchmark('search_books_page[word]')
+def _search_books_page(ctx):
+    crud.search_books_page(ctx.db, ctx.word())
+
+### --- Borrowing --- ###
+
+@benchmark('get_user_borrowings')
+def _get_user_borrowings(ctx):
+    crud.get_user_borrowings(ctx.db, ctx.user_id())
+
+@benchmark('get_user_history')
+def _get_user_history(ctx):
+    crud.get_user_history(ctx.db, ctx.user_id(), include_archived=True)
+
+@benchmark('get_active_borrowings_by_book_id')
+def _get_active_borrowings_by_book_id(ctx):
+    crud.get_active_borrowings_by_book_id(ctx.db, ctx.book_id())
+
+@benchmark('borrow_book')
+def _borrow_book(ctx):
+    user_id, book_id = ctx.user_id(), ctx.book_id()
+    if not isinstance(crud.borrow_book(ctx.db, user_id, book_id), str):
+        ctx.loans.append((user_id, book_id))
+
+@benchmark('return_book')
+def _return_book(ctx):
+    if ctx.loans:
+        crud.return_book(ctx.db, *ctx.loans.pop())
+
+@benchmark('borrow_books[10]', iterations=50)
+def _borrow_books(ctx):
+    user_id = ctx.user_id()
+    results = crud.borrow_books(ctx.db, user_id, sorted({ctx.book_id() for _ in range(10)}), atomic=False)
+    ctx.batches.append((user_id, [item['book_id'] for item in results if item['ok']]))
+
+@benchmark('return_books[10]', iterations=50)
+def _return_books(ctx):
+    if ctx.batches:
+        user_id, book_ids = ctx.batches.pop()
+        if book_ids:
+            crud.return_books(ctx.db, user_id, book_ids)
+
+@benchmark('get_active_titles_by_user', iterations=20)
+def _get_active_titles_by_user(ctx):
+    crud.get_active_titles_by_user(ctx.db)
+
+@benchmark('get_all_users_with_borrowing_status', iterations=20)
+def _get_all_users_with_borrowing_status(ctx):
+    crud.get_all_users_with_borrowing_status(ctx.db)
+
+@benchmark('get_all_users_with_borrowing_status[titles]', iterations=20)
+def _get_all_users_with_borrowing_status_titles(ctx):
+    crud.get_all_users_with_borrowing_status(ctx.db, include_titles=True)
+
+@benchmark('get_all_borrowing_history', iterations=3)
+def _get_all_borrowing_history(ctx):
+    crud.get_all_borrowing_history(ctx.db)
+
+### --- Holds --- ###
+
+@benchmark('place_hold')
+def _place_hold(ctx):
+    user_id = ctx.user_id()
+    if not isinstance(crud.place_hold(ctx.db, user_id, ctx.waitlisted_book()), str):
+        ctx.holders.append(user_id)
+
+@benchmark('get_hold_position')
+def _get_hold_position(ctx):
+    if ctx.holders:
+        crud.get_hold_position(ctx.db, ctx.rng.choice(ctx.holders), ctx.waitlisted_book())
+
+@benchmark('get_user_holds')
+def _get_user_holds(ctx):
+    if ctx.holders:
+        crud.get_user_holds(ctx.db, ctx.rng.choice(ctx.holders))
+
+@benchmark('settle_availability[10]')
+def _settle_availability(ctx):
+    # As after an import batch; the runner rolls back any loans it hands out
+    crud.settle_availability(ctx.db, [ctx.waitlisted_book()] + [ctx.book_id() for _ in range(9)])
+
+@benchmark('cancel_hold')
+def _cancel_hold(ctx):
+    if ctx.holders:
+        crud.cancel_hold(ctx.db, ctx.holders.pop(), ctx.waitlisted_book())
+
+### --- Exports --- ###
+
+@benchmark('iter_books', iterations=5)
+def _iter_books(ctx):
+    for _ in crud.iter_books(ctx.db):
+        pass
+
+@benchmark('iter_users', iterations=5)
+def _iter_users(ctx):
+    for _ in crud.iter_users(ctx.db):
+        pass
+
+@benchmark('iter_borrowing_history', iterations=3)
+def _iter_borrowing_history(ctx):
+    for _ in crud.iter_borrowing_history(ctx.db):
+        pass
+
+### --- Book and user writes --- ###
+
+@benchmark('create_book', iterations=50)
+def _create_book(ctx):
+    book = crud.create_book(ctx.db, ctx.unique('Bench Book '), 'Bench Author', 'Poetry', 3)
+    ctx.created_books.append(book.id)
+
+@benchmark('update_book', iterations=50)
+def _update_book(ctx):
+    if ctx.created_books:
+        book_id = ctx.rng.choice(ctx.created_books)
+        crud.update_book(ctx.db, book_id, ctx.unique('Bench Book '), 'Bench Author', 'Poetry', 4)
+
+@benchmark('delete_book', iterations=50)
+def _delete_book(ctx):
+    if ctx.created_books:
+        crud.delete_book(ctx.db, ctx.created_books.pop())
+
+@benchmark('delete_user', iterations=5)
+def _delete_user(ctx):
+    if ctx.created_users:
+        crud.delete_user(ctx.db, ctx.created_users.pop())
+
+def uncovered_functions() -> list[str]:
+    """Public `app.crud` functions that no benchmark exercises."""
+    public = {
+        name for name, fn in inspect.getmembers(crud, inspect.isfunction)
+        if not name.startswith('_') and fn.__module__ == crud.__name__
+    }
+    covered = {name for _, _, covers in BENCHMARKS.values() for name in covers}
+    return sorted(public - covered)
+
+def run_crud_benchmarks(session_factory, dataset: dict, seed: int = 0, iterations: int = DEFAULT_ITERATIONS,
+                        only: str | None = None, progress=None) -> dict:
+    """Runs every registered benchmark (or those whose name contains `only`)."""
+    db = session_factory()
+    ctx = BenchContext(db, dataset, seed)
+    results = {}
+    try:
+        for name, (fn, fixed_iterations, _) in BENCHMARKS.items():
+            if only and only not in name:
+                continue
+            timings = []
+            for _ in range(min(fixed_iterations or iterations, iterations)):
+                start = time.perf_counter()
+                fn(ctx)
+                timings.append((time.perf_counter() - start) * 1000)
+                # Each call starts from an empty identity map, like a new request
+                db.rollback()
+                db.expunge_all()
+            results[f"crud.{name}"] = summarize(timings)
+            if progress:
+                progress(f"crud.{name}", results[f"crud.{name}"])
+    finally:
+        db.close()
+    return results
@@ -0,0 +1,75 @@
+"""Measures peak Python memory of the streaming export against the old list + jsonify approach.
+
+Run from the backend folder:
+    python -m benchmarks.bench_export --sizes 10000,100000,1000000
+
+Fails (exit status 1) unless the streaming export writes every row with a peak below
+--max-stream-mib at every size: its memory must not grow with the table.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from sqlalchemy import create_engine
+from db.database import Base, SessionLocal
+from app.crud import get_all_borrowing_history, iter_borrowing_history
+from app.export import generate_export
+from benchmarks.data import populate_history
+
+def old_export():
+    """Returns (characters, rows) written."""
+    db = SessionLocal()
+    try:
+        records = [
+            {'id': b.id, 'user_id': b.user_id, 'book_id': b.book_id, 'borrow_date': b.borrow_date.isoformat(),
+             'return_date': b.return_date.isoformat() if b.return_date else None, 'status': b.status}
+            for b in get_all_borrowing_history(db)
+        ]
+        return len(json.dumps(records)), len(records)
+    finally:
+        db.close()
+
+def streaming_export():
+    """Returns (characters, rows) written."""
+    chars = rows = 0
+    # On the benchmark database: the default reporting session reads the app's own
+    for chunk in generate_export(iter_borrowing_history, 'ndjson', SessionLocal):
+        chars += len(chunk)
+        rows += chunk.count('\n')
+    return chars, rows
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, size
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--max-stream-mib", type=float, default=8,
+                        help="Peak allowed for the streaming export, whatever the size")
+    args = parser.parse_args()
+    failures = 0
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind=engine)
+            populate_history(engine, users=100, books=100, borrowings=size)
+            SessionLocal.configure(bind=engine)
+            for label, fn in (("list", old_export), ("stream", streaming_export)):
+                elapsed, peak, (output, rows) = measure(fn)
+                bad = label == "stream" and (rows != size or peak > args.max_stream_mib)
+                failures += bad
+                print(f"{size:>9} {label:>7}  {elapsed:7.2f} s  peak={peak:8.1f} MiB  output={output / 2**20:7.1f} MiB"
+                      f"  rows={rows}{'  FAIL' if bad else ''}")
+            engine.dispose()
+    if failures:
+        print(f"\nstreaming export: {failures} size(s) missed rows or peaked above {args.max_stream_mib} MiB")
+    sys.exit(1 if failures else 0)
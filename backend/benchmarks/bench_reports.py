@@ -0,0 +1,108 @@
+"""Measures borrow/return latency while reporting queries run on the live database or on a snapshot.
+
+Run from the backend folder:
+    python -m benchmarks.bench_reports --seconds 10 --writers 4 --reporters 2
+
+Writers borrow and return books in a loop; reporters repeatedly build the user summary
+and read the full borrowing history (as the export does), on the live database, on a
+ReportSnapshot, or not at all ('none', the baseline). Each mode prints the writers'
+latency percentiles and throughput, the reports completed, and the size the WAL reached,
+since long reads on the live database keep checkpoints from resetting it.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from db.database import Base, configure_sqlite, ReportSnapshot
+from db.init_db import ensure_indexes
+from app.crud import borrow_book, return_book, get_all_users_with_borrowing_status, iter_borrowing_history
+from benchmarks.data import populate_history
+from benchmarks.results import summarize
+
+def writer(Session, users: int, books: int, stop: threading.Event, timings: list, seed: int):
+    rng = random.Random(seed)
+    db = Session()
+    try:
+        while not stop.is_set():
+            user_id, book_id = rng.randint(1, users), rng.randint(1, books)
+            start = time.perf_counter()
+            if not isinstance(borrow_book(db, user_id, book_id), str):
+                return_book(db, user_id, book_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        db.close()
+
+def reporter(open_session, stop: threading.Event, reports: list):
+    while not stop.is_set():
+        db = open_session()
+        try:
+            get_all_users_with_borrowing_status(db)
+            for _ in iter_borrowing_history(db):
+                pass
+        finally:
+            db.close()
+        reports.append(1)
+
+def run_mode(mode: str, engine, Session, snapshot, args) -> dict:
+    stop = threading.Event()
+    timings, reports = [], []
+    open_session = Session if mode == 'live' else snapshot.session
+    threads = [threading.Thread(target=writer, args=(Session, args.users, args.books, stop, timings, i))
+               for i in range(args.writers)]
+    if mode != 'none':
+        threads += [threading.Thread(target=reporter, args=(open_session, stop, reports))
+                    for _ in range(args.reporters)]
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    wal = engine.url.database + '-wal'
+    peak_wal = 0
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        if os.path.exists(wal):
+            peak_wal = max(peak_wal, os.path.getsize(wal))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {**summarize(timings), 'reports': len(reports), 'peak_wal_mib': peak_wal / 2**20}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--borrowings", type=int, default=200_000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--reporters", type=int, default=2)
+    parser.add_argument("--max-age", type=float, default=5, help="Snapshot staleness bound (seconds)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False},
+                               pool_size=args.writers + args.reporters)
+        configure_sqlite(engine, 'production')
+        Base.metadata.create_all(bind=engine)
+        ensure_indexes(engine)
+        populate_history(engine, args.users, args.books, args.borrowings, active_every=50)
+        Session = sessionmaker(bind=engine)
+        snapshot = ReportSnapshot(engine, path + '.report-snapshot', args.max_age)
+
+        print(f"{'reports on':>10} {'p50 ms':>8} {'p99 ms':>8} {'writes/s':>9} {'reports':>8} {'peak WAL':>9}")
+        for mode in ('none', 'live', 'snapshot'):
+            if mode == 'snapshot':
+                snapshot.refresh(force=True)  # otherwise the first reports read the live database
+            result = run_mode(mode, engine, Session, snapshot, args)
+            print(f"{mode:>10} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+                  f" {result['n'] / args.seconds:>9,.0f} {result['reports']:>8}"
+                  f" {result['peak_wal_mib']:>7.1f}MiB")
+        print(f"snapshot: {snapshot.stats()}")
+        snapshot.refresh()  # waits for a background refresh still running
+        snapshot.engine.dispose()
+        engine.dispose()
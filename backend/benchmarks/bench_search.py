@@ -0,0 +1,82 @@
+"""Compares full-text search against the old ILIKE scan at several catalog sizes.
+
+Run from the backend folder:
+    python -m benchmarks.bench_search --sizes 10000,100000,1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from db.database import Base
+from db.search_index import create_search_index
+from app.models import Book
+from app.crud import search_books, _search_books_like
+from benchmarks.data import GENRES, make_vocabulary
+
+def populate(engine, size: int, words: list[str], seed: int = 42):
+    """Inserts `size` synthetic books in batches."""
+    rng = random.Random(seed)
+    batch = []
+    with engine.begin() as conn:
+        for _ in range(size):
+            batch.append({
+                "title": " ".join(rng.choices(words, k=rng.randint(2, 5))).title(),
+                "author": f"{rng.choice(words).title()} {rng.choice(words).title()}",
+                "genre": rng.choice(GENRES),
+                "total_copies": 3,
+                "available_copies": 3,
+            })
+            if len(batch) == 10_000:
+                conn.execute(insert(Book), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Book), batch)
+
+def measure(fn, db, queries: list[str]):
+    """Runs every benchmark query and returns latencies in ms."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(db, query)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.expunge_all()
+    return timings
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run(size: int, repeats: int):
+    rng = random.Random(7)
+    words = make_vocabulary(rng)
+    # Mix of single words, two-word phrases, prefixes and a genre
+    queries = [rng.choice(words) for _ in range(repeats)]
+    queries += [f"{rng.choice(words)} {rng.choice(words)}" for _ in range(repeats)]
+    queries += [rng.choice(words)[:4] for _ in range(repeats)]
+    queries += ["Poetry"]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        create_search_index(engine)
+        populate(engine, size, words)
+        db = sessionmaker(bind=engine)()
+        try:
+            for label, fn in (("ilike", _search_books_like), ("fts5", search_books)):
+                timings = measure(fn, db, queries)
+                print(f"{size:>9} {label:>6}  p50={statistics.median(timings):9.2f} ms  "
+                      f"p99={percentile(timings, 99):9.2f} ms")
+        finally:
+            db.close()
+            engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+    for size in (int(s) for s in args.sizes.split(",")):
+        run(size, args.repeats)
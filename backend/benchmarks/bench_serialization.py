@@ -0,0 +1,93 @@
+"""Measures the per-row cost of building API payloads: hydrated ORM objects with hand-built
+dicts and stdlib json, against schema columns selected as Core rows and the fast encoder.
+
+Run from the backend folder:
+    python -m benchmarks.bench_serialization --rows 100,1000,10000
+
+For every size it times `GET /api/users/<id>/borrowings` for a user with that many loans,
+split into its stages, and the encoding of a list of that many catalog rows. The
+encoder in use (orjson or stdlib json) is printed first.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker, joinedload
+from db.database import Base
+from app.crud import get_user_borrowings, USER_BORROWING, BookRow, BOOK_ROW_COLUMNS
+from app.models import Borrowing
+from app.serialization import BOOK, dumps, orjson
+from benchmarks.data import populate_history
+
+def stdlib_dumps(obj) -> bytes:
+    """What Flask's default provider produces for jsonify."""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+def legacy_user_borrowings(db, user_id: int) -> list[dict]:
+    """The previous implementation: ORM objects with their books, then dicts by hand."""
+    borrowings = db.query(Borrowing).options(joinedload(Borrowing.book)).filter(
+        Borrowing.user_id == user_id
+    ).order_by(Borrowing.borrow_date.desc()).all()
+    return [
+        {'id': b.id, 'book_id': b.book_id, 'borrow_date': b.borrow_date.isoformat(),
+         'return_date': b.return_date.isoformat() if b.return_date else None, 'status': b.status}
+        for b in borrowings
+    ]
+
+def legacy_books(books) -> list[dict]:
+    return [{
+        'id': b.id, 'title': b.title, 'author': b.author, 'genre': b.genre,
+        'total_copies': b.total_copies, 'available_copies': b.available_copies
+    } for b in books]
+
+def median_us_per_row(fn, rows: int, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) / rows * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="100,1000,10000", help="Comma-separated list sizes")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib json'}")
+    print(f"{'rows':>7} {'payload':<12} {'ORM+dicts':>10} {'rows+dump':>10} {'stdlib':>8} {'fast':>8}"
+          f" {'old total':>10} {'new total':>10}   (us/row, median)")
+    for rows in (int(n) for n in args.rows.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind=engine)
+            # One user holding every loan; the catalog is as large as the list
+            populate_history(engine, users=1, books=rows, borrowings=rows)
+            db = sessionmaker(bind=engine)()
+
+            def orm_dicts():
+                db.expunge_all()
+                return legacy_user_borrowings(db, 1)
+
+            def rows_dump():
+                return USER_BORROWING.dump_all(get_user_borrowings(db, 1))
+
+            old_payload, new_payload = orm_dicts(), rows_dump()
+            assert old_payload == new_payload, "payloads differ"
+            book_rows = [BookRow(*row) for row in db.execute(select(*BOOK_ROW_COLUMNS))]
+            payloads = {
+                'borrowings': (orm_dicts, rows_dump, new_payload),
+                'books': (lambda: legacy_books(book_rows), lambda: BOOK.dump_all(book_rows), BOOK.dump_all(book_rows)),
+            }
+            for name, (old_build, new_build, payload) in payloads.items():
+                old = median_us_per_row(old_build, rows, args.repeat)
+                new = median_us_per_row(new_build, rows, args.repeat)
+                slow = median_us_per_row(lambda: stdlib_dumps(payload), rows, args.repeat)
+                fast = median_us_per_row(lambda: dumps(payload), rows, args.repeat)
+                print(f"{rows:>7} {name:<12} {old:>10.2f} {new:>10.2f} {slow:>8.2f} {fast:>8.2f}"
+                      f" {old + slow:>10.2f} {new + fast:>10.2f}")
+            db.close()
+            engine.dispose()
@@ -0,0 +1,93 @@
+"""Concurrent read/write throughput of each SQLite pragma profile.
+
+Run from the backend folder:
+    python -m benchmarks.bench_sqlite_profiles --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from db.database import Base, SQLITE_PRAGMA_PROFILES, configure_sqlite
+from db.init_db import ensure_indexes
+from app.crud import get_books_page, get_user_borrowings, borrow_book, return_book
+from benchmarks.data import populate_history
+
+def reader(Session, users: int, deadline: float, counts: Counter, lock: threading.Lock, seed: int):
+    rng, db = random.Random(seed), Session()
+    done = errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            get_books_page(db, page_size=50)
+            get_user_borrowings(db, rng.randint(1, users))
+            done += 1
+        except OperationalError:
+            db.rollback()
+            errors += 1
+        db.expunge_all()
+    db.close()
+    with lock:
+        counts['reads'] += done
+        counts['read errors'] += errors
+
+def writer(Session, users: int, books: int, deadline: float, counts: Counter, lock: threading.Lock, seed: int):
+    rng, db = random.Random(seed), Session()
+    done = errors = 0
+    while time.perf_counter() < deadline:
+        user_id, book_id = rng.randint(1, users), rng.randint(1, books)
+        try:
+            if isinstance(borrow_book(db, user_id, book_id), str):
+                return_book(db, user_id, book_id)
+            done += 1
+        except OperationalError:
+            # "database is locked"
+            db.rollback()
+            errors += 1
+    db.close()
+    with lock:
+        counts['writes'] += done
+        counts['write errors'] += errors
+
+def run(profile: str, args) -> Counter:
+    with tempfile.TemporaryDirectory() as tmp:
+        # timeout=0 disables the driver's own retry so that only the profile's busy_timeout applies
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                               connect_args={"check_same_thread": False, "timeout": 0},
+                               pool_size=args.readers + args.writers)
+        configure_sqlite(engine, profile)
+        Base.metadata.create_all(bind=engine)
+        ensure_indexes(engine)
+        populate_history(engine, args.users, args.books, args.borrowings)
+        Session = sessionmaker(bind=engine)
+
+        counts, lock = Counter(), threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=reader, args=(Session, args.users, deadline, counts, lock, i))
+                   for i in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(Session, args.users, args.books, deadline, counts, lock, i))
+                    for i in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--borrowings", type=int, default=100_000)
+    args = parser.parse_args()
+    for profile in SQLITE_PRAGMA_PROFILES:
+        counts = run(profile, args)
+        print(f"{profile:>10}: reads/s={counts['reads'] / args.seconds:8.1f}  writes/s={counts['writes'] / args.seconds:8.1f}  "
+              f"read errors={counts['read errors']}  write errors={counts['write errors']}")
@@ -0,0 +1,98 @@
+"""Compares circulation reports read from the daily rollups against the same reports
+computed from the raw history, as the history grows.
+
+Run from the backend folder:
+    python -m benchmarks.bench_stats --borrowings 100000,1000000 --days 30
+
+For every size it times the rollup backfill (`rebuild_loan_stats`), then each report over
+the last `--days` days of history, both ways. Both ways must return the same figures.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine, select, func, desc
+from sqlalchemy.orm import sessionmaker
+from db.database import Base, configure_sqlite
+from app.analytics import (
+    rebuild_loan_stats, stats_window, get_circulation_summary, get_daily_loans, get_top_books, get_genre_demand
+)
+from app.models import Book, Borrowing
+from benchmarks.data import populate_history
+
+def scan_summary(db, start, end):
+    """Loans opened and returned in the window, from `borrowings` directly."""
+    day = lambda column: func.date(column).between(start.isoformat(), end.isoformat())
+    loans = db.execute(select(func.count()).where(day(Borrowing.borrow_date))).scalar()
+    returns, seconds = db.execute(select(
+        func.count(), func.sum((func.julianday(Borrowing.return_date) - func.julianday(Borrowing.borrow_date)) * 86400)
+    ).where(day(Borrowing.return_date))).one()
+    return loans, returns
+
+def scan_top_books(db, start, end, limit=10):
+    loans = func.count().label('loans')
+    return db.execute(
+        select(Book.id, loans).join(Borrowing, Borrowing.book_id == Book.id)
+        .where(func.date(Borrowing.borrow_date).between(start.isoformat(), end.isoformat()))
+        .group_by(Book.id).order_by(desc(loans), Book.id).limit(limit)
+    ).all()
+
+def scan_genres(db, start, end):
+    loans = func.count().label('loans')
+    return db.execute(
+        select(Book.genre, loans).join(Borrowing, Borrowing.book_id == Book.id)
+        .where(func.date(Borrowing.borrow_date).between(start.isoformat(), end.isoformat()))
+        .group_by(Book.genre).order_by(desc(loans), Book.genre)
+    ).all()
+
+def median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--borrowings", default="100000,1000000", help="Comma-separated history sizes")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'history':>9} {'backfill':>9} {'report':<10} {'scan ms':>9} {'rollup ms':>10}")
+    for borrowings in (int(n) for n in args.borrowings.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            configure_sqlite(engine, 'production')
+            Base.metadata.create_all(bind=engine)
+            populate_history(engine, args.users, args.books, borrowings)
+            db = sessionmaker(bind=engine)()
+            backfill = rebuild_loan_stats(db)['elapsed']
+
+            # The window ends on the last day with loans opened in it
+            last = db.execute(select(func.max(Borrowing.borrow_date))).scalar().date()
+            start, end = stats_window(args.days, last)
+            summary = get_circulation_summary(db, start, end)
+            assert scan_summary(db, start, end) == (summary['loans'], summary['returns']), "summary differs"
+            assert [tuple(r) for r in scan_top_books(db, start, end)] == \
+                [(r['id'], r['loans']) for r in get_top_books(db, start, end)], "top books differ"
+            assert [tuple(r) for r in scan_genres(db, start, end)] == \
+                [(r['genre'], r['loans']) for r in get_genre_demand(db, start, end)], "genres differ"
+
+            reports = {
+                'summary': (scan_summary, get_circulation_summary),
+                'daily': (None, get_daily_loans),
+                'top-books': (scan_top_books, get_top_books),
+                'genres': (scan_genres, get_genre_demand),
+            }
+            for i, (name, (scan, rollup)) in enumerate(reports.items()):
+                scanned = f"{median_ms(lambda: scan(db, start, end), args.repeat):9.2f}" if scan else f"{'-':>9}"
+                rolled = median_ms(lambda: rollup(db, start, end), args.repeat)
+                label = (f"{borrowings:>9,} {backfill:>8.2f}s") if i == 0 else f"{'':>9} {'':>9}"
+                print(f"{label} {name:<10} {scanned} {rolled:>10.2f}")
+            db.close()
+            engine.dispose()
@@ -0,0 +1,96 @@
+"""Measures catalog and user table render times against catalog size: ORM objects vs plain
+rows vs cached fragments.
+
+Run from the backend folder:
+    python -m benchmarks.bench_templates --sizes 1000,10000,50000
+
+For every catalog size it renders the whole catalog as rows (ORM `Book` instances and
+`BookRow` tuples, the cost grows with the catalog), one page of 50 rows uncached and from
+the fragment cache (independent of catalog size), and the admin user summary.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+def median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated catalog sizes")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    workdir = tempfile.mkdtemp(prefix="library-bench-")
+    os.environ['LIBRARY_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    from flask import render_template
+    from sqlalchemy import text
+    from main import create_app
+    from db.database import engine, SessionLocal
+    from app import crud
+    from app.cache import catalog_cache
+    from app.fragments import catalog_fragment, user_fragment
+    from app.models import Book
+    from benchmarks.data import generate_library
+
+    app = create_app()
+    page_args = {'page_size': 50, 'after': None, 'before': None, 'genre': None, 'author': None}
+    print(f"{'books':>8} {'all/ORM':>10} {'all/rows':>10} {'page':>8} {'page/hit':>9} "
+          f"{'summary':>9} {'summary/hit':>12}   (median ms)")
+    for size in sizes:
+        with engine.begin() as conn:
+            for table in ('holds', 'borrowings', 'borrowings_archive', 'books', 'users'):
+                conn.execute(text(f"DELETE FROM {table}"))
+        generate_library(engine, users=args.users, books=size, borrowings=size * 2, seed=0)
+        db = SessionLocal()
+        with app.test_request_context():
+            def all_orm():
+                db.expunge_all()
+                render_template('_catalog_rows.html', books=db.query(Book).order_by(Book.title).all())
+
+            def all_rows():
+                render_template('_catalog_rows.html', books=[
+                    crud.BookRow(*row) for row in db.query(*crud.BOOK_ROW_COLUMNS).order_by(Book.title)
+                ])
+
+            def page(hit: bool):
+                if not hit:
+                    catalog_cache.clear()
+                version = catalog_cache.version
+                catalog_fragment('_catalog_rows.html', crud.get_books_page(db, 50), page_args, version)
+
+            def summary(hit: bool):
+                if not hit:
+                    catalog_cache.clear()
+                user_fragment('_user_summary.html', None, lambda: {
+                    'user_logs': crud.get_all_users_with_borrowing_status(db)
+                })
+
+            results = [
+                median_ms(all_orm, args.repeat),
+                median_ms(all_rows, args.repeat),
+                median_ms(lambda: page(False), args.repeat),
+                median_ms(lambda: page(True), args.repeat),
+                median_ms(lambda: summary(False), args.repeat),
+                median_ms(lambda: summary(True), args.repeat),
+            ]
+        db.close()
+        print(f"{size:>8} {results[0]:>10.2f} {results[1]:>10.2f} {results[2]:>8.2f} {results[3]:>9.3f} "
+              f"{results[4]:>9.2f} {results[5]:>12.3f}")
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
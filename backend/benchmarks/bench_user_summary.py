@@ -0,0 +1,65 @@
+"""Compares the counter-based user summary against the previous joinedload implementation.
+
+Run from the backend folder:
+    python -m benchmarks.bench_user_summary --users 2000 --borrowings 500000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, joinedload
+from db.database import Base
+from app.models import User, Borrowing
+from app.crud import get_all_users_with_borrowing_status
+from benchmarks.data import populate_history
+
+def legacy_users_with_borrowing_status(db):
+    """The previous implementation: loads every borrowing and its book for every user."""
+    users = db.query(User).options(
+        joinedload(User.borrowings).joinedload(Borrowing.book)
+    ).all()
+    user_data = []
+    for user in users:
+        active_borrowings = [b for b in user.borrowings if b.status == 'borrowed']
+        user_data.append({
+            'id': user.id,
+            'username': user.username,
+            'role': user.role,
+            'total_borrowed': len(user.borrowings),
+            'active_borrowings_count': len(active_borrowings),
+            'history': user.borrowings
+        })
+    return user_data
+
+def measure(fn, Session):
+    db = Session()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(db)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.close()
+    return elapsed, peak / 2**20, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--borrowings", type=int, default=500_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        populate_history(engine, args.users, args.books, args.borrowings, active_every=50)
+        Session = sessionmaker(bind=engine)
+        results = {}
+        for label, fn in (("joinedload", legacy_users_with_borrowing_status),
+                          ("counters", get_all_users_with_borrowing_status)):
+            elapsed, peak, results[label] = measure(fn, Session)
+            print(f"{label:>10}  {elapsed:7.2f} s  peak={peak:8.1f} MiB")
+        counts = lambda rows: [(r['total_borrowed'], r['active_borrowings_count']) for r in rows]
+        assert counts(results["joinedload"]) == counts(results["counters"]), "counts differ"
+        engine.dispose()
@@ -0,0 +1,88 @@
+"""Runs the hot borrowing, waitlist and statistics queries under EXPLAIN QUERY PLAN and fails if any
+of them scans `borrowings`, `holds` or the circulation rollups.
+
+Run from the backend folder:
+    python -m benchmarks.check_query_plans
+"""
+import sys
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from db.database import Base
+from db.init_db import ensure_indexes
+from app import crud
+from app.analytics import (
+    stats_window, get_circulation_summary, get_daily_loans, get_top_books, get_genre_demand
+)
+from app.archive import archive_borrowings
+from app.models import Borrowing
+from benchmarks.data import populate_history
+
+def capture_plans(engine) -> list[tuple[str, list[str]]]:
+    """Records the query plan of every statement executed on `engine`."""
+    plans = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            return
+        rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        plans.append((" ".join(statement.split()), [row[3] for row in rows]))
+
+    return plans
+
+SCANNED_TABLES = ("SCAN borrowings", "SCAN holds", "SCAN loan_stats_daily", "SCAN loan_stats_totals")
+
+def is_full_scan(step: str) -> bool:
+    # 'SCAN borrowings' reads every row; scanning the partial active-loan index is fine
+    return (step in SCANNED_TABLES or "AUTOMATIC" in step) and "uq_borrowings_active_loan" not in step
+
+def main() -> int:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    populate_history(engine, users=50, books=40, borrowings=5000, active_every=7)
+    plans = capture_plans(engine)
+    db = sessionmaker(bind=engine)()
+
+    # The hot paths: dashboard history, borrow/return, account and book deletion checks
+    crud.get_user_borrowings(db, 1)
+    crud.get_active_borrowings_by_book_id(db, 1)
+    crud.get_active_borrowings_by_book_id(db, 1, 1)
+    crud.borrow_book(db, 2, 3)
+    crud.return_book(db, 2, 3)
+    db.query(Borrowing).filter(Borrowing.user_id == 1, Borrowing.status == 'borrowed').count()
+    crud.get_all_users_with_borrowing_status(db, include_titles=True)
+    crud.delete_user(db, 50)
+    crud.delete_book(db, 40)
+    archive_borrowings(db, older_than_days=0, batch_size=500, pause_ms=0, max_batches=2)
+    crud.get_user_borrowings(db, 1, include_archived=True)
+    crud.get_user_history(db, 1, include_archived=True)
+    # Waitlist: joining, polling the position, and allocation on return
+    crud.borrow_book(db, 3, 1)
+    for user_id in range(4, 20):
+        crud.borrow_book(db, user_id, 1)
+        crud.place_hold(db, user_id, 1)
+    crud.get_hold_position(db, 10, 1)
+    crud.get_user_holds(db, 10)
+    crud.return_book(db, 3, 1)
+    crud.cancel_hold(db, 12, 1)
+    # Circulation reports read only their window of the rollups
+    window = stats_window(30)
+    for report in (get_circulation_summary, get_daily_loans, get_top_books, get_genre_demand):
+        report(db, *window)
+    db.close()
+
+    failures = 0
+    for statement, steps in plans:
+        if not any(table in statement for table in ("borrowings", "holds", "loan_stats")):
+            continue
+        bad = [step for step in steps if is_full_scan(step)]
+        failures += bool(bad)
+        print(f"{'FAIL' if bad else 'ok  '} {statement[:100]}")
+        for step in steps:
+            print(f"       {step}")
+    print(f"\n{failures} of the queries on borrowings, holds and rollups scan the table")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
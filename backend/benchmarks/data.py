@@ -0,0 +1,134 @@
+"""Synthetic data shared by the benchmarks."""
+import itertools
+import math
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, func
+from sqlalchemy.orm import Session
+from app.models import User, Book, Borrowing
+from db.reconcile import reconcile_counters
+
+BATCH_SIZE = 10_000
+
+SYLLABLES = ["ka", "lo", "mi", "ran", "te", "vor", "shi", "da", "quen", "bel", "tor", "ny", "ex", "ul"]
+GENRES = ["Computer Science", "Science Fiction", "Fantasy", "History", "Poetry", "AI Ethics"]
+# Relative frequency of each genre in generated catalogs
+GENRE_WEIGHTS = [30, 25, 20, 12, 5, 8]
+
+def make_vocabulary(rng: random.Random, size: int = 20_000) -> list[str]:
+    """Builds a vocabulary of pseudo-words so that search terms are selective, like real titles."""
+    return sorted({"".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size)})
+
+def zipf_weights(n: int, skew: float) -> list[float]:
+    """Cumulative Zipf weights for ranks 1..n: a few items get most of the traffic."""
+    return list(itertools.accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+
+def populate_history(engine, users: int, books: int, borrowings: int, active_every: int = 0):
+    """Inserts users, books and `borrowings` history rows spread evenly over them.
+
+    Every `active_every`-th borrowing is left active ('borrowed'); 0 means all are returned.
+    (user, book) pairs repeat with period lcm(users, books), so only the first cycle gets
+    active loans to respect the one-active-loan-per-pair index."""
+    start = datetime(2020, 1, 1)
+    period = math.lcm(users, books) if users and books else 0
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"username": f"user{i}", "email": f"user{i}@library.com", "hashed_password": "x", "role": "user"}
+            for i in range(users)
+        ])
+        conn.execute(insert(Book), [
+            {"title": f"Book {i}", "author": f"Author {i % 50}", "genre": f"Genre {i % 10}",
+             "total_copies": 5, "available_copies": 5}
+            for i in range(books)
+        ])
+        for offset in range(0, borrowings, BATCH_SIZE):
+            rows = []
+            for i in range(offset, min(borrowings, offset + BATCH_SIZE)):
+                active = active_every and i % active_every == 0 and i < period
+                rows.append({
+                    "user_id": i % users + 1, "book_id": i % books + 1,
+                    "borrow_date": start + timedelta(minutes=i),
+                    "return_date": None if active else start + timedelta(minutes=i, days=14),
+                    "status": "borrowed" if active else "returned",
+                })
+            conn.execute(insert(Borrowing), rows)
+    # The rows above bypass the CRUD layer, so derive the loan counters in one pass
+    db = Session(bind=engine)
+    try:
+        reconcile_counters(db)
+    finally:
+        db.close()
+
+def generate_library(engine, users: int, books: int, borrowings: int, seed: int = 0,
+                     skew: float = 1.1, active_ratio: float = 0.05, password_hash: str = "x") -> dict:
+    """Deterministically generates a catalog and loan history with realistic skew.
+
+    Book popularity and user activity follow Zipf distributions (`skew`), loans are spread
+    over the two years before a fixed date, and the most recent `active_ratio` of them stay
+    active as long as the book has copies left and the user does not already hold it.
+    The same arguments always produce the same database. Returns what was generated."""
+    rng = random.Random(seed)
+    words = make_vocabulary(rng, size=max(2_000, books // 5))
+    authors = [f"{rng.choice(words).title()} {rng.choice(words).title()}" for _ in range(max(1, books // 5))]
+    copies = [rng.choice((1, 1, 2, 2, 3, 3, 4, 5, 8, 10)) for _ in range(books)]
+    # Rank -> id maps shuffle popularity so that it is unrelated to insertion order
+    book_rank = list(range(books))
+    user_rank = list(range(users))
+    rng.shuffle(book_rank)
+    rng.shuffle(user_rank)
+    book_weights = zipf_weights(books, skew)
+    user_weights = zipf_weights(users, skew)
+
+    end = datetime(2025, 1, 1)
+    span = timedelta(days=730).total_seconds()
+    active_from = borrowings - int(borrowings * active_ratio)
+    on_loan = [0] * books
+    active_pairs = set()
+    active = 0
+
+    with engine.begin() as conn:
+        # IDs continue after any existing rows (e.g. the init_db seed data)
+        first_user = conn.execute(select(func.coalesce(func.max(User.id), 0))).scalar() + 1
+        first_book = conn.execute(select(func.coalesce(func.max(Book.id), 0))).scalar() + 1
+        conn.execute(insert(User), [
+            {"username": f"loaduser{i}", "email": f"loaduser{i}@library.com", "hashed_password": password_hash, "role": "user"}
+            for i in range(users)
+        ])
+        for offset in range(0, books, BATCH_SIZE):
+            conn.execute(insert(Book), [
+                {"title": " ".join(rng.choices(words, k=rng.randint(2, 5))).title(),
+                 "author": rng.choice(authors),
+                 "genre": rng.choices(GENRES, weights=GENRE_WEIGHTS)[0],
+                 "total_copies": copies[i], "available_copies": copies[i]}
+                for i in range(offset, min(books, offset + BATCH_SIZE))
+            ])
+        # Loans are generated in date order so that the active ones are the most recent
+        offsets = sorted(rng.random() * span for _ in range(borrowings))
+        for start in range(0, borrowings, BATCH_SIZE):
+            rows = []
+            for i in range(start, min(borrowings, start + BATCH_SIZE)):
+                user_index = user_rank[rng.choices(range(users), cum_weights=user_weights)[0]]
+                book_index = book_rank[rng.choices(range(books), cum_weights=book_weights)[0]]
+                user_id, book_id = first_user + user_index, first_book + book_index
+                borrow_date = end - timedelta(days=730) + timedelta(seconds=offsets[i])
+                is_active = (i >= active_from and on_loan[book_index] < copies[book_index]
+                             and (user_id, book_id) not in active_pairs)
+                if is_active:
+                    on_loan[book_index] += 1
+                    active_pairs.add((user_id, book_id))
+                    active += 1
+                rows.append({
+                    "user_id": user_id, "book_id": book_id, "borrow_date": borrow_date,
+                    "return_date": None if is_active else borrow_date + timedelta(days=rng.randint(1, 30)),
+                    "status": "borrowed" if is_active else "returned",
+                })
+            conn.execute(insert(Borrowing), rows)
+
+    # Derives available copies and the loan counters from the generated history
+    db = Session(bind=engine)
+    try:
+        reconcile_counters(db)
+    finally:
+        db.close()
+    return {"users": users, "books": books, "borrowings": borrowings, "active": active, "seed": seed,
+            "skew": skew, "first_user_id": first_user, "first_book_id": first_book, "words": words}
@@ -0,0 +1,119 @@
+"""End-to-end load driver: replays a weighted mix of page views and API calls through
+Flask test clients, one logged-in member and one admin client per thread.
+
+Used by benchmarks.suite; the app must already point at a populated database.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+from benchmarks.results import summarize
+
+# action -> relative weight in the traffic mix
+DEFAULT_MIX = {
+    'dashboard': 25,
+    'dashboard_search': 15,
+    'dashboard_page': 10,
+    'borrow_return': 20,
+    'api_books_page': 10,
+    'api_book': 10,
+    'api_borrow_return_batch': 5,
+    'api_users': 2,
+    'admin_panel': 3,
+}
+
+def _login(client, username: str, password: str):
+    response = client.post('/', data={'action': 'login', 'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f"Login failed for {username}: HTTP {response.status_code}")
+
+class LoadWorker:
+    """Issues requests for one simulated member (and an admin session for admin actions)."""
+
+    def __init__(self, app, dataset: dict, user_index: int, seed: int):
+        self.rng = random.Random(seed)
+        self.dataset = dataset
+        self.user_id = dataset['first_user_id'] + user_index
+        self.member = app.test_client()
+        self.admin = app.test_client()
+        _login(self.member, f"loaduser{user_index}", 'password')
+        _login(self.admin, 'admin', 'adminpass')
+
+    def book_id(self) -> int:
+        return self.dataset['first_book_id'] + self.rng.randrange(self.dataset['books'])
+
+    # Each action returns the responses it produced
+    def dashboard(self):
+        return [self.member.get('/dashboard')]
+
+    def dashboard_search(self):
+        return [self.member.get('/dashboard', query_string={'query': self.rng.choice(self.dataset['words'])})]
+
+    def dashboard_page(self):
+        return [self.member.get('/dashboard', query_string={'genre': 'Fantasy'})]
+
+    def borrow_return(self):
+        book_id = self.book_id()
+        return [self.member.get(f'/borrow/{book_id}'), self.member.get(f'/return/{book_id}')]
+
+    def api_books_page(self):
+        return [self.admin.get('/api/books', query_string={'page_size': 50, 'genre': 'History'})]
+
+    def api_book(self):
+        return [self.admin.get(f'/api/books/{self.book_id()}')]
+
+    def api_borrow_return_batch(self):
+        book_ids = sorted({self.book_id() for _ in range(10)})
+        body = {'user_id': self.user_id, 'book_ids': book_ids, 'atomic': False}
+        borrowed = self.admin.post('/api/borrow/batch', json=body)
+        ok = [item['book_id'] for item in borrowed.get_json()['results'] if item['ok']]
+        responses = [borrowed]
+        if ok:
+            responses.append(self.admin.post('/api/return/batch', json={'user_id': self.user_id, 'book_ids': ok}))
+        return responses
+
+    def api_users(self):
+        return [self.admin.get('/api/users')]
+
+    def admin_panel(self):
+        return [self.admin.get('/admin/panel')]
+
+def run_load(app, dataset: dict, requests: int = 2000, threads: int = 4, seed: int = 0,
+             mix: dict[str, int] | None = None) -> dict:
+    """Runs `requests` actions spread over `threads` workers and returns per-action statistics.
+
+    Responses with a status of 400 or above count as errors (business-rule refusals such as
+    "no copies available" redirect with a flash message and are not errors)."""
+    mix = mix or DEFAULT_MIX
+    actions, weights = zip(*mix.items())
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    workers = [LoadWorker(app, dataset, i % dataset['users'], seed + i) for i in range(threads)]
+
+    def drive(worker: LoadWorker, count: int):
+        local_timings, local_errors = defaultdict(list), defaultdict(int)
+        for action in worker.rng.choices(actions, weights=weights, k=count):
+            start = time.perf_counter()
+            responses = getattr(worker, action)()
+            local_timings[action].append((time.perf_counter() - start) * 1000)
+            local_errors[action] += sum(response.status_code >= 400 for response in responses)
+        with lock:
+            for action, values in local_timings.items():
+                timings[action].extend(values)
+                errors[action] += local_errors[action]
+
+    per_thread = [requests // threads + (i < requests % threads) for i in range(threads)]
+    start = time.perf_counter()
+    pool = [threading.Thread(target=drive, args=(worker, count)) for worker, count in zip(workers, per_thread)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {f"load.{action}": summarize(values, errors[action]) for action, values in sorted(timings.items())}
+    all_timings = [value for values in timings.values() for value in values]
+    results['load.total'] = summarize(all_timings, sum(errors.values()))
+    results['load.total']['throughput_per_s'] = round(len(all_timings) / elapsed, 1)
+    return results
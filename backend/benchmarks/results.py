@@ -0,0 +1,72 @@
+"""Timing statistics and the JSON result format shared by the benchmark suite."""
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(timings_ms: list[float], errors: int = 0) -> dict:
+    """Reduces a list of latencies (ms) to the figures stored in the results file."""
+    total = sum(timings_ms)
+    return {
+        'n': len(timings_ms),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(timings_ms), 3),
+        'p50_ms': round(percentile(timings_ms, 50), 3),
+        'p95_ms': round(percentile(timings_ms, 95), 3),
+        'p99_ms': round(percentile(timings_ms, 99), 3),
+        'max_ms': round(max(timings_ms), 3),
+        'ops_per_s': round(len(timings_ms) / total * 1000, 1) if total else None,
+    }
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment() -> dict:
+    """Where the results were produced, so that only comparable runs are compared."""
+    return {
+        'commit': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+def write_results(path: str, results: dict):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def compare_results(baseline: dict, current: dict, threshold: float, min_delta_ms: float = 0.5,
+                    metric: str = 'p50_ms') -> list[dict]:
+    """Compares every benchmark present in both runs on `metric`.
+
+    Returns one row per benchmark; `regression` is set when the current value is more
+    than `threshold` (e.g. 0.2 = 20%) above the baseline and slower by at least
+    `min_delta_ms`, which keeps sub-millisecond jitter from being reported."""
+    rows = []
+    for name, base in sorted(baseline['benchmarks'].items()):
+        cur = current['benchmarks'].get(name)
+        if cur is None or not base.get(metric):
+            continue
+        ratio = cur[metric] / base[metric]
+        rows.append({
+            'name': name, 'baseline': base[metric], 'current': cur[metric],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold and cur[metric] - base[metric] >= min_delta_ms,
+        })
+    return rows
+
+def print_comparison(rows: list[dict], metric: str, out=sys.stdout):
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f"{row['name']:<45} {row['baseline']:>10.3f} -> {row['current']:>10.3f} {metric}"
+              f"  x{row['ratio']:<6} {flag}", file=out)
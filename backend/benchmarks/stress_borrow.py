@@ -0,0 +1,97 @@
+"""Hammers borrow_book/return_book from many threads and checks that copies are never oversold.
+
+Run from the backend folder:
+    python -m benchmarks.stress_borrow --threads 32 --users 200 --copies 25
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from db.database import Base
+from db.init_db import ensure_indexes
+from app.models import Book, Borrowing
+from app.crud import borrow_book, return_book
+from benchmarks.data import populate_history
+
+def hammer(Session, calls: list[tuple], fn, outcomes: Counter, lock: threading.Lock, barrier: threading.Barrier):
+    """Runs `fn(db, user_id, book_id)` for every call on a private session."""
+    db = Session()
+    barrier.wait()
+    try:
+        for user_id, book_id in calls:
+            try:
+                result = fn(db, user_id, book_id)
+                outcome = result if isinstance(result, str) else "ok"
+            except OperationalError:
+                db.rollback()
+                outcome = "database locked"
+            with lock:
+                outcomes[outcome] += 1
+    finally:
+        db.close()
+
+def run_phase(Session, fn, calls: list[tuple], threads: int) -> Counter:
+    outcomes, lock = Counter(), threading.Lock()
+    barrier = threading.Barrier(threads)
+    workers = [
+        threading.Thread(target=hammer, args=(Session, calls[i::threads], fn, outcomes, lock, barrier))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    print(f"{fn.__name__:>12}: {len(calls)} calls in {elapsed:.2f} s ({len(calls) / elapsed:,.0f}/s) {dict(outcomes)}")
+    return outcomes
+
+def check(Session, copies: int, expected_active: int):
+    db = Session()
+    try:
+        available = db.query(Book.available_copies).filter(Book.id == 1).scalar()
+        active = db.query(func.count(Borrowing.id)).filter(Borrowing.book_id == 1, Borrowing.status == 'borrowed').scalar()
+        duplicates = db.query(Borrowing.user_id).filter(Borrowing.book_id == 1, Borrowing.status == 'borrowed') \
+            .group_by(Borrowing.user_id).having(func.count() > 1).count()
+    finally:
+        db.close()
+    print(f"{'':>12}  available={available} active_loans={active} duplicate_active_loans={duplicates}")
+    assert available >= 0, "available copies went negative"
+    assert active == expected_active, f"expected {expected_active} active loans, found {active}"
+    assert available + active == copies, "copies were lost or oversold"
+    assert duplicates == 0, "a user holds the same book twice"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--copies", type=int, default=25)
+    parser.add_argument("--attempts", type=int, default=5, help="borrow/return attempts per user")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                               connect_args={"check_same_thread": False, "timeout": 60})
+        Base.metadata.create_all(bind=engine)
+        ensure_indexes(engine)
+        populate_history(engine, users=args.users, books=1, borrowings=0)
+        with engine.begin() as conn:
+            conn.execute(Book.__table__.update().values(total_copies=args.copies, available_copies=args.copies))
+        Session = sessionmaker(bind=engine)
+
+        # Every user tries to borrow the same book several times at once
+        calls = [(user_id, 1) for _ in range(args.attempts) for user_id in range(1, args.users + 1)]
+        outcomes = run_phase(Session, borrow_book, calls, args.threads)
+        check(Session, args.copies, expected_active=min(args.copies, args.users))
+        assert outcomes["ok"] == min(args.copies, args.users)
+
+        # ...and then tries to return it several times at once
+        outcomes = run_phase(Session, return_book, calls, args.threads)
+        check(Session, args.copies, expected_active=0)
+        assert outcomes["ok"] == min(args.copies, args.users)
+        print("OK: no overselling, no duplicate loans, no double returns")
+        engine.dispose()
@@ -0,0 +1,104 @@
+"""Reproducible benchmark suite: generates a library, runs the app.crud micro-benchmarks
+and the end-to-end load driver, and writes JSON results that can be compared between commits.
+
+Run from the backend folder:
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json --threshold 0.2
+
+With --compare the exit status is 1 if any benchmark's p50 regressed by more than the
+threshold. Runs are only comparable with the same sizes, seed and machine.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--borrowings", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for book and user popularity")
+    parser.add_argument("--iterations", type=int, default=200, help="Iterations per micro-benchmark (upper bound)")
+    parser.add_argument("--requests", type=int, default=2_000, help="Actions issued by the load driver")
+    parser.add_argument("--threads", type=int, default=4, help="Concurrent load driver clients")
+    parser.add_argument("--only", help="Run only benchmarks whose name contains this text")
+    parser.add_argument("--skip-load", action="store_true", help="Run only the micro-benchmarks")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    # The app reads its settings at import time, so point it at a scratch database first
+    workdir = tempfile.mkdtemp(prefix="library-bench-")
+    try:
+        return run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run(args, workdir: str) -> int:
+    os.environ['LIBRARY_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('LIBRARY_JOB_UPLOAD_DIR', os.path.join(workdir, 'uploads'))
+
+    from main import create_app
+    from app.security import hash_password
+    from db.database import engine, SessionLocal
+    from benchmarks.data import generate_library
+    from benchmarks.bench_crud import run_crud_benchmarks, uncovered_functions
+    from benchmarks.load_driver import run_load
+    from benchmarks.results import environment, write_results, compare_results, print_comparison
+
+    def report(name, stats):
+        print(f"{name:<45} p50={stats['p50_ms']:9.3f} ms  p99={stats['p99_ms']:9.3f} ms  n={stats['n']}",
+              file=sys.stderr)
+
+    app = create_app()
+    start = time.perf_counter()
+    dataset = generate_library(engine, args.users, args.books, args.borrowings, seed=args.seed,
+                               skew=args.skew, password_hash=hash_password('password'))
+    print(f"Generated {args.users} users, {args.books} books, {args.borrowings} borrowings "
+          f"({dataset['active']} active) in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    benchmarks = run_crud_benchmarks(SessionLocal, dataset, seed=args.seed, iterations=args.iterations,
+                                     only=args.only, progress=report)
+    if not args.skip_load and not args.only:
+        load = run_load(app, dataset, requests=args.requests, threads=args.threads, seed=args.seed)
+        for name, stats in load.items():
+            report(name, stats)
+        benchmarks.update(load)
+
+    results = {
+        'environment': environment(),
+        'parameters': {key: getattr(args, key) for key in
+                       ('users', 'books', 'borrowings', 'seed', 'skew', 'iterations', 'requests', 'threads')},
+        'uncovered': uncovered_functions(),
+        'benchmarks': benchmarks,
+    }
+    if results['uncovered']:
+        print(f"No benchmark for: {', '.join(results['uncovered'])}", file=sys.stderr)
+    if args.output:
+        write_results(args.output, results)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != results['parameters']:
+            print("Warning: baseline was produced with different parameters", file=sys.stderr)
+        rows = compare_results(baseline, results, args.threshold, args.min_delta_ms)
+        print_comparison(rows, 'p50_ms', out=sys.stderr)
+        regressions = [row['name'] for row in rows if row['regression']]
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}",
+                  file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import os
+
+# Project root (one level above the backend folder), where the SQLite file lives by default
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+class Config:
+    """Application settings. Every value can be overridden with a LIBRARY_* environment variable."""
+    SECRET_KEY = os.environ.get('LIBRARY_SECRET_KEY', 'a-super-secret-key-for-session-management')
+
+    # Database connection
+    DATABASE_URL = os.environ.get('LIBRARY_DATABASE_URL', f"sqlite:///{BASE_DIR}/mini_library.db")
+
+    # Connection pool
+    DB_POOL_SIZE = _env_int('LIBRARY_DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = _env_int('LIBRARY_DB_MAX_OVERFLOW', 10)
+    DB_POOL_TIMEOUT = _env_int('LIBRARY_DB_POOL_TIMEOUT', 30)    # seconds to wait for a free connection
+    DB_POOL_RECYCLE = _env_int('LIBRARY_DB_POOL_RECYCLE', 1800)  # seconds before a connection is replaced
+    DB_POOL_PRE_PING = _env_bool('LIBRARY_DB_POOL_PRE_PING', True)
+
+    # SQLite pragma profile applied to every new connection: 'production' or 'default'
+    SQLITE_PROFILE = os.environ.get('LIBRARY_SQLITE_PROFILE', 'production')
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('LIBRARY_SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_MMAP_SIZE = _env_int('LIBRARY_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)  # bytes
+    SQLITE_CACHE_SIZE_KB = _env_int('LIBRARY_SQLITE_CACHE_SIZE_KB', 64 * 1024)
+
+    # Password hashing policy (any werkzeug method string, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:600000'). Stored hashes using another method are upgraded on login.
+    PASSWORD_HASH_METHOD = os.environ.get('LIBRARY_PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = _env_int('LIBRARY_PASSWORD_HASH_WORKERS', os.cpu_count() or 2)
+    PASSWORD_HASH_MAX_PENDING = _env_int('LIBRARY_PASSWORD_HASH_MAX_PENDING', 64)  # queued + running
+    PASSWORD_HASH_TIMEOUT = _env_int('LIBRARY_PASSWORD_HASH_TIMEOUT', 10)          # seconds
+
+    # Login throttling: failed attempts allowed per window before further attempts are refused
+    LOGIN_MAX_FAILURES_PER_USER = _env_int('LIBRARY_LOGIN_MAX_FAILURES_PER_USER', 5)
+    LOGIN_MAX_FAILURES_PER_IP = _env_int('LIBRARY_LOGIN_MAX_FAILURES_PER_IP', 50)
+    LOGIN_FAILURE_WINDOW = _env_int('LIBRARY_LOGIN_FAILURE_WINDOW', 300)            # seconds
+    LOGIN_THROTTLE_MAX_KEYS = _env_int('LIBRARY_LOGIN_THROTTLE_MAX_KEYS', 10_000)   # LRU capacity
+
+    # In-process catalog cache (book pages and single-book lookups)
+    CATALOG_CACHE_ENABLED = _env_bool('LIBRARY_CATALOG_CACHE_ENABLED', True)
+    CATALOG_CACHE_MAX_ENTRIES = _env_int('LIBRARY_CATALOG_CACHE_MAX_ENTRIES', 1024)
+    CATALOG_CACHE_TTL = _env_int('LIBRARY_CATALOG_CACHE_TTL', 60)  # seconds; bounds staleness across processes
+    # Rendered catalog rows and user activity blocks, stored in the catalog cache (see app/fragments.py)
+    FRAGMENT_CACHE_ENABLED = _env_bool('LIBRARY_FRAGMENT_CACHE_ENABLED', True)
+
+    # Returned loans older than this are moved to the borrowings archive, in batches of
+    # ARCHIVE_BATCH_SIZE with a short pause in between so other writers are not starved
+    ARCHIVE_AFTER_DAYS = _env_int('LIBRARY_ARCHIVE_AFTER_DAYS', 365)
+    ARCHIVE_BATCH_SIZE = _env_int('LIBRARY_ARCHIVE_BATCH_SIZE', 1000)
+    ARCHIVE_BATCH_PAUSE_MS = _env_int('LIBRARY_ARCHIVE_BATCH_PAUSE_MS', 50)
+
+    # Background job runner for long admin operations (/api/jobs)
+    JOB_WORKERS = _env_int('LIBRARY_JOB_WORKERS', 2)
+    JOB_MAX_ATTEMPTS = _env_int('LIBRARY_JOB_MAX_ATTEMPTS', 3)     # automatic retries of failing jobs
+    JOB_RETRY_DELAY = _env_int('LIBRARY_JOB_RETRY_DELAY', 5)       # seconds, doubled after every attempt
+    # Running jobs record their process and refresh a heartbeat; one whose process has
+    # exited (or, on another host, whose heartbeat is older than the timeout) is requeued
+    JOB_HEARTBEAT_INTERVAL = _env_int('LIBRARY_JOB_HEARTBEAT_INTERVAL', 10)  # seconds
+    JOB_HEARTBEAT_TIMEOUT = _env_int('LIBRARY_JOB_HEARTBEAT_TIMEOUT', 60)    # seconds
+    JOB_UPLOAD_DIR = os.environ.get('LIBRARY_JOB_UPLOAD_DIR', os.path.join(BASE_DIR, 'job_uploads'))
+
+    # Request/SQL instrumentation, served at /admin/metrics (off by default: it adds a
+    # little overhead to every statement)
+    METRICS_ENABLED = _env_bool('LIBRARY_METRICS_ENABLED', False)
+    SLOW_QUERY_MS = _env_int('LIBRARY_SLOW_QUERY_MS', 100)
+    N_PLUS_ONE_THRESHOLD = _env_int('LIBRARY_N_PLUS_ONE_THRESHOLD', 10)  # same lazy load repeated in one request
+    METRICS_TOKEN = os.environ.get('LIBRARY_METRICS_TOKEN')  # lets Prometheus scrape without a session
+
+    # Live availability stream (/events/availability). Each open stream holds a server
+    # thread, so the number of concurrent streams is capped
+    EVENTS_MAX_SUBSCRIBERS = _env_int('LIBRARY_EVENTS_MAX_SUBSCRIBERS', 100)
+    EVENTS_KEEPALIVE = _env_int('LIBRARY_EVENTS_KEEPALIVE', 15)          # seconds between keepalive comments
+    EVENTS_BACKLOG = _env_int('LIBRARY_EVENTS_BACKLOG', 1000)            # events kept for reconnecting clients
+    EVENTS_MAX_PENDING = _env_int('LIBRARY_EVENTS_MAX_PENDING', 500)     # books pending per stream before a resync
+
+    # ASGI serving mode (asgi.py). Flask views run on a pool of ASGI_THREADS threads per
+    # worker process; the hot catalog and waitlist reads are served natively on the event
+    # loop through an aiosqlite engine with its own pool of ASYNC_DB_POOL_SIZE connections
+    ASGI_WORKERS = _env_int('LIBRARY_ASGI_WORKERS', 1)
+    ASGI_THREADS = _env_int('LIBRARY_ASGI_THREADS', 32)
+    ASGI_ASYNC_READS = _env_bool('LIBRARY_ASGI_ASYNC_READS', True)
+    ASYNC_DB_POOL_SIZE = _env_int('LIBRARY_ASYNC_DB_POOL_SIZE', 5)
+
+    # Conditional GET: API reads carry an ETag built from the change stamps writes bump,
+    # and a matching If-None-Match is answered with 304. ETAG_TTL (seconds) bounds how
+    # long a client can revalidate against another worker process's stale stamp
+    ETAG_ENABLED = _env_bool('LIBRARY_ETAG_ENABLED', True)
+    ETAG_TTL = _env_int('LIBRARY_ETAG_TTL', 60)
+    # gzip (or brotli, when installed) for JSON/HTML/CSV responses of at least COMPRESSION_MIN_SIZE bytes
+    COMPRESSION_ENABLED = _env_bool('LIBRARY_COMPRESSION_ENABLED', True)
+    COMPRESSION_MIN_SIZE = _env_int('LIBRARY_COMPRESSION_MIN_SIZE', 1024)
+    COMPRESSION_LEVEL = _env_int('LIBRARY_COMPRESSION_LEVEL', 6)
+
+    # Reporting queries (user summaries, full history, exports) read from
+    # REPORT_DATABASE_URL when set, e.g. a replica. Otherwise, for an SQLite file, they
+    # read a copy made with the backup API and refreshed once it is older than
+    # REPORT_SNAPSHOT_MAX_AGE seconds. The copy goes to REPORT_SNAPSHOT_PATH, by default
+    # next to the database
+    REPORT_DATABASE_URL = os.environ.get('LIBRARY_REPORT_DATABASE_URL')
+    REPORT_SNAPSHOT_ENABLED = _env_bool('LIBRARY_REPORT_SNAPSHOT_ENABLED', True)
+    REPORT_SNAPSHOT_MAX_AGE = _env_int('LIBRARY_REPORT_SNAPSHOT_MAX_AGE', 60)
+    REPORT_SNAPSHOT_PATH = os.environ.get('LIBRARY_REPORT_SNAPSHOT_PATH')
+
+    # Circulation statistics (/api/stats): window used when ?days is not given, and the
+    # longest window a report may cover
+    STATS_DEFAULT_DAYS = _env_int('LIBRARY_STATS_DEFAULT_DAYS', 30)
+    STATS_MAX_DAYS = _env_int('LIBRARY_STATS_MAX_DAYS', 366)
@@ -1,16 +1,69 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import sqlite3
+import threading
+import time
+from flask import g
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from sqlalchemy.pool import QueuePool
+from config import Config
 
-# Define the path for the SQLite database file
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{BASE_DIR}/mini_library.db"
+# Database URL comes from configuration (LIBRARY_DATABASE_URL)
+SQLALCHEMY_DATABASE_URL = Config.DATABASE_URL
 
-# Create the SQLAlchemy engine
+# Create the SQLAlchemy engine with an explicitly sized connection pool
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False} # Needed for SQLite with Flask
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}, # Needed for SQLite with Flask
+    poolclass=QueuePool,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    pool_pre_ping=Config.DB_POOL_PRE_PING
 )
 
+### --- SQLite Tuning --- ###
+
+# Pragma profiles applied to every new SQLite connection.
+# 'production' enables WAL so readers never block on the writer, relaxes fsync to
+# once per checkpoint (still crash-safe in WAL mode) and waits on locks instead of
+# failing immediately with "database is locked".
+SQLITE_PRAGMA_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': Config.SQLITE_BUSY_TIMEOUT_MS,
+        'mmap_size': Config.SQLITE_MMAP_SIZE,
+        'cache_size': -Config.SQLITE_CACHE_SIZE_KB,  # negative values are KiB
+        'temp_store': 'MEMORY',
+    },
+}
+
+def configure_sqlite(target_engine, profile: str | dict):
+    """Applies a pragma profile (a name or a pragma dict) to every connection
+    `target_engine` opens (no-op for other databases)."""
+    if target_engine.dialect.name != 'sqlite':
+        return
+    if isinstance(profile, dict):
+        pragmas = profile
+    elif profile in SQLITE_PRAGMA_PROFILES:
+        pragmas = SQLITE_PRAGMA_PROFILES[profile]
+    else:
+        raise ValueError(f"Unknown SQLite profile '{profile}', use one of: {', '.join(SQLITE_PRAGMA_PROFILES)}")
+
+    @event.listens_for(target_engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+configure_sqlite(engine, Config.SQLITE_PROFILE)
+
 # Configure a SessionLocal class to create database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -28,4 +81,293 @@ def get_db():
     finally:
         db.close()
 
+### --- Request-scoped Sessions --- ###
+
+def get_request_db() -> Session:
+    """Returns the session of the current app context, opening it on first use.
+
+    The session is closed by `close_request_db` when the app context is torn down."""
+    if 'db' not in g:
+        g.db = SessionLocal()
+    return g.db
+
+def get_request_report_db() -> Session:
+    """Like `get_request_db`, for read-only reporting queries (see `get_report_session`)."""
+    if 'report_db' not in g:
+        g.report_db = get_report_session()
+    return g.report_db
+
+def close_request_db(exception=None):
+    """Closes the app context's sessions, rolling back if the request failed."""
+    db = g.pop('db', None)
+    if db is not None:
+        if exception is not None:
+            db.rollback()
+        db.close()
+    report_db = g.pop('report_db', None)
+    if report_db is not None:
+        report_db.close()
+
+def init_app(app):
+    """Registers session teardown on a Flask app."""
+    app.teardown_appcontext(close_request_db)
+
+### --- Read Routing (reporting) --- ###
+
+# Returns the change stamp of the live data that reports describe (registered by the app,
+# see app/fragments.py). Reporting sessions record the stamp their data corresponds to.
+_report_stamp = None
+
+def set_report_stamp(stamp):
+    global _report_stamp
+    _report_stamp = stamp
+
+def _live_stamp():
+    return _report_stamp() if _report_stamp is not None else None
+
+# Pragmas of the snapshot's connections: read-only, tuned for long scans
+_SNAPSHOT_PRAGMAS = {
+    'query_only': 'ON',
+    'mmap_size': Config.SQLITE_MMAP_SIZE,
+    'cache_size': -Config.SQLITE_CACHE_SIZE_KB,
+    'temp_store': 'MEMORY',
+}
+
+class ReportSnapshot:
+    """A read-only copy of the SQLite database for reporting queries.
+
+    The copy is taken with SQLite's online backup API in one step: under the WAL profile
+    this reads a consistent snapshot of the live database without blocking its writers.
+    It is written to a temporary file and swapped in atomically, so running reports keep
+    reading the previous copy. Once the copy is older than `max_age` seconds, the next
+    session starts a refresh on a background thread and still reads the current copy,
+    so no request waits for a copy. Until the first copy exists, sessions read the live
+    database; nothing is copied while no reports are run.
+
+    The live stamp is read just before each copy and kept with it, so data cached under
+    a snapshot's stamp is never older than the stamp says."""
+
+    def __init__(self, source_engine, path: str, max_age: float):
+        self.source_engine = source_engine
+        self.path = path
+        self.max_age = max_age
+        self.stamp = None  # live stamp read before the current copy was taken
+        self.refreshed_at = None  # time.monotonic() of the last copy
+        self.refreshes = 0
+        self.last_refresh_seconds = None
+        self._lock = threading.Lock()
+        self._refreshing = None  # background refresh thread, while one runs
+        self.engine = create_engine(
+            'sqlite://',
+            creator=lambda: sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False),
+            poolclass=QueuePool,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT
+        )
+        configure_sqlite(self.engine, _SNAPSHOT_PRAGMAS)
+        self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.live_sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=source_engine)
+
+    @property
+    def age(self) -> float | None:
+        return None if self.refreshed_at is None else time.monotonic() - self.refreshed_at
+
+    @property
+    def stale(self) -> bool:
+        return self.age is None or self.age >= self.max_age
+
+    def refresh(self, force: bool = False):
+        """Copies the live database unless another thread just did."""
+        with self._lock:
+            if not force and not self.stale:
+                return
+            start = time.perf_counter()
+            stamp = _live_stamp()
+            temporary = f"{self.path}.tmp"
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            target = sqlite3.connect(temporary)
+            try:
+                with self.source_engine.connect() as connection:
+                    connection.connection.driver_connection.backup(target)
+                # The copy inherits the WAL header; a read-only file must not need a -wal/-shm
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+            os.replace(temporary, self.path)
+            # New connections open the new file; checked-out ones finish on the old copy
+            self.engine.dispose()
+            self.stamp = stamp
+            self.refreshed_at = time.monotonic()
+            self.refreshes += 1
+            self.last_refresh_seconds = time.perf_counter() - start
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(target=self.refresh, name='report-snapshot', daemon=True)
+            self._refreshing.start()
+
+    def session(self) -> Session:
+        """A session on the current copy (on the live database before the first copy),
+        with the stamp of its data in `info['report_stamp']`."""
+        if self.stale:
+            self._refresh_in_background()
+        if self.refreshed_at is None:
+            db = self.live_sessionmaker()
+            db.info['report_stamp'] = _live_stamp()
+            return db
+        # Read before the session's first query, so the data can only be newer than the stamp
+        stamp = self.stamp
+        db = self.sessionmaker()
+        db.info['report_stamp'] = stamp
+        return db
+
+    def stats(self) -> dict:
+        age = self.age
+        return {
+            'path': self.path,
+            'max_age': self.max_age,
+            'age': None if age is None else round(age, 3),
+            'refreshing': self._refreshing is not None and self._refreshing.is_alive(),
+            'refreshes': self.refreshes,
+            'last_refresh_seconds': None if self.last_refresh_seconds is None else round(self.last_refresh_seconds, 4),
+        }
+
+_report_lock = threading.Lock()
+_report_route = None  # ('replica', sessionmaker) | ('snapshot', ReportSnapshot) | ('primary', None)
+
+def _get_report_route():
+    global _report_route
+    with _report_lock:
+        if _report_route is None:
+            database = engine.url.database
+            if Config.REPORT_DATABASE_URL:
+                replica = create_engine(
+                    Config.REPORT_DATABASE_URL,
+                    connect_args={"check_same_thread": False} if Config.REPORT_DATABASE_URL.startswith("sqlite") else {},
+                    poolclass=QueuePool,
+                    pool_size=Config.DB_POOL_SIZE,
+                    max_overflow=Config.DB_MAX_OVERFLOW,
+                    pool_timeout=Config.DB_POOL_TIMEOUT,
+                    pool_pre_ping=Config.DB_POOL_PRE_PING
+                )
+                configure_sqlite(replica, Config.SQLITE_PROFILE)
+                _report_route = ('replica', sessionmaker(autocommit=False, autoflush=False, bind=replica))
+            elif (Config.REPORT_SNAPSHOT_ENABLED and engine.dialect.name == 'sqlite'
+                    and database and database != ':memory:'):
+                path = Config.REPORT_SNAPSHOT_PATH or f"{database}.report-snapshot"
+                _report_route = ('snapshot', ReportSnapshot(engine, path, Config.REPORT_SNAPSHOT_MAX_AGE))
+            else:
+                _report_route = ('primary', None)
+        return _report_route
+
+def get_report_session() -> Session:
+    """Opens a session for read-only reporting queries (user summaries, full history,
+    exports), so they do not hold connections or locks of the live database.
+
+    Routes to LIBRARY_REPORT_DATABASE_URL when set (e.g. a replica), otherwise to a
+    snapshot of the SQLite file refreshed every LIBRARY_REPORT_SNAPSHOT_MAX_AGE seconds,
+    otherwise to the live database. Callers must not write through this session.
+    `get_report_stamp` tells which version of the data it reads."""
+    kind, target = _get_report_route()
+    if kind == 'snapshot':
+        return target.session()
+    if kind == 'replica':
+        # The replica's lag is unknown, so its data has no stamp
+        db = target()
+        db.info['report_stamp'] = None
+    else:
+        db = SessionLocal()
+        db.info['report_stamp'] = _live_stamp()
+    return db
+
+def get_report_stamp(db: Session):
+    """The live stamp (see `set_report_stamp`) that the data of reporting session `db`
+    is at least as new as, or None when it is unknown; cache its results under this
+    stamp rather than the live one."""
+    return db.info.get('report_stamp')
+
+def get_report_metrics() -> dict:
+    """Describes where reporting queries go and, for a snapshot, how old it is."""
+    kind, target = _get_report_route()
+    return {'route': kind, **(target.stats() if kind == 'snapshot' else {})}
+
+### --- Pool Metrics --- ###
+
+_pool_lock = threading.Lock()
+_pool_events = {'connects': 0, 'checkouts': 0, 'checkins': 0, 'invalidations': 0}
+
+def _count_pool_event(name: str):
+    def listener(*args):
+        with _pool_lock:
+            _pool_events[name] += 1
+    return listener
+
+event.listen(engine, 'connect', _count_pool_event('connects'))
+event.listen(engine, 'checkout', _count_pool_event('checkouts'))
+event.listen(engine, 'checkin', _count_pool_event('checkins'))
+event.listen(engine, 'invalidate', _count_pool_event('invalidations'))
+
+def get_pool_metrics() -> dict:
+    """Reports the current pool occupancy and lifetime connection event counters."""
+    pool = engine.pool
+    with _pool_lock:
+        events = dict(_pool_events)
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': pool.overflow(),
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'timeout': Config.DB_POOL_TIMEOUT,
+        'recycle': Config.DB_POOL_RECYCLE,
+        'pre_ping': Config.DB_POOL_PRE_PING,
+        **events
+    }
+
+### --- Async Engine (ASGI mode) --- ###
+
+_async_lock = threading.Lock()
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_sessionmaker():
+    """Returns the session factory of the async engine, creating the engine on first use.
+
+    The engine talks to the same database through aiosqlite (asyncpg etc. for other
+    databases is a matter of the URL) and gets the same pragma profile. Created lazily so
+    that the synchronous app does not need aiosqlite installed."""
+    global _async_engine, _async_sessionmaker
+    with _async_lock:
+        if _async_sessionmaker is None:
+            from sqlalchemy.engine import make_url
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            from sqlalchemy.pool import AsyncAdaptedQueuePool
+            url = make_url(SQLALCHEMY_DATABASE_URL)
+            if url.drivername in ('sqlite', 'sqlite+pysqlite'):
+                url = url.set(drivername='sqlite+aiosqlite')
+            _async_engine = create_async_engine(
+                url,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=Config.ASYNC_DB_POOL_SIZE,
+                max_overflow=0,
+                pool_timeout=Config.DB_POOL_TIMEOUT,
+                pool_recycle=Config.DB_POOL_RECYCLE,
+                pool_pre_ping=Config.DB_POOL_PRE_PING
+            )
+            configure_sqlite(_async_engine.sync_engine, Config.SQLITE_PROFILE)
+            _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+        return _async_sessionmaker
+
+async def dispose_async_engine():
+    """Closes the async engine's connections (on ASGI lifespan shutdown)."""
+    global _async_engine, _async_sessionmaker
+    with _async_lock:
+        async_engine, _async_engine, _async_sessionmaker = _async_engine, None, None
+    if async_engine is not None:
+        await async_engine.dispose()
+
 # Note: The actual tables are defined in app/models.py
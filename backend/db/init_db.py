@@ -1,14 +1,105 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from werkzeug.security import generate_password_hash
 from db.database import engine, Base, SessionLocal
-from app.models import User, Book, Borrowing
+from db.search_index import create_search_index
+from db.reconcile import reconcile_counters, close_duplicate_loans
+from app.analytics import rebuild_loan_stats
+from app.models import User, Book, Borrowing, LoanStatsDaily
+
+def _repair_active_loans(bind) -> str:
+    with Session(bind=bind) as db:
+        closed = close_duplicate_loans(db)
+        report = reconcile_counters(db)
+    return (f"closed {closed} duplicate active loans, reconciled {report['users_drifted']} users "
+            f"and {report['books_drifted']} books")
+
+# Unique indexes that legacy data can violate -> repair(bind) returning a report, run
+# before retrying the index once
+INDEX_REPAIRS = {
+    'uq_borrowings_active_loan': _repair_active_loans,
+}
+
+def ensure_indexes(bind=engine) -> list[str]:
+    """Creates indexes declared on the models that are missing from existing tables.
+
+    `create_all` only creates indexes together with new tables, so databases created by
+    older versions would otherwise never receive them. Returns the names of the created
+    indexes; statistics are refreshed afterwards so the planner starts using them.
+
+    Some indexes enforce rules the CRUD layer relies on (one active loan per user and
+    book), so a failure is not skipped: the data is repaired where INDEX_REPAIRS knows
+    how and the index retried, otherwise the error propagates and startup stops."""
+    inspector = inspect(bind)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=bind)
+            except IntegrityError:
+                if index.name not in INDEX_REPAIRS:
+                    raise
+                print(f"Legacy rows violate {index.name}: {INDEX_REPAIRS[index.name](bind)}")
+                index.create(bind=bind)
+            created.append(index.name)
+
+    if created and bind.dialect.name == 'sqlite':
+        with bind.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return created
+
+def ensure_columns(bind=engine) -> list[str]:
+    """Adds columns declared on the models that are missing from existing tables.
+
+    Only columns with a server default (or nullable ones) can be added this way, which
+    covers the counter columns. Returns the added columns as `table.column`."""
+    inspector = inspect(bind)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+            if column.server_default is not None:
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                ddl += f" DEFAULT {column.server_default.arg.text}"
+            with bind.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    return added
 
 def init_db(db: Session):
     """Initializes the database, creates tables, and seeds initial data."""
     
     # 1. Create all tables defined in Base (models)
     print("Creating database tables...")
+    had_loan_stats = inspect(engine).has_table(LoanStatsDaily.__tablename__)
     Base.metadata.create_all(bind=engine)
+    added = ensure_columns()
+    if added:
+        # New counter columns start at zero; fill them from the existing history
+        print(f"Added missing columns: {', '.join(added)}")
+        report = reconcile_counters(db)
+        print(f"Reconciled counters for {report['users_drifted']} users and {report['books_drifted']} books")
+    created = ensure_indexes()
+    if created:
+        print(f"Created missing indexes: {', '.join(created)}")
+    create_search_index(engine)
+    if not had_loan_stats:
+        # The rollups are new: backfill them from any existing history
+        report = rebuild_loan_stats(db)
+        if report['rows']:
+            print(f"Built {report['rows']} daily circulation rollups in {report['elapsed']} s")
 
     # 2. Check if the database has seed users
     if db.query(User).count() == 0:
@@ -0,0 +1,147 @@
+"""Recomputes the denormalized loan counters from `borrowings` and reports drift.
+
+The CRUD layer keeps the counters in step on every write; this is the safety net for
+data written around it (manual SQL, restores, older versions of the app).
+
+Run from the backend folder:
+    python -m db.reconcile            # report and fix
+    python -m db.reconcile --dry-run  # report only
+"""
+import argparse
+import json
+import sys
+from sqlalchemy import select, func, case, update, bindparam, union_all
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from app.models import User, Book, Borrowing, ArchivedBorrowing
+from app.analytics import record_returns
+from app.cache import catalog_cache
+from app.crud import settle_availability
+from app.events import availability_bus
+from app.fragments import touch_users
+
+MAX_REPORTED_DRIFT = 20
+# Book ids per hold allocation query, within SQLite's bound parameter limit
+SETTLE_CHUNK = 10000
+
+# Core tables for the executemany fixes (ORM bulk UPDATE expects primary key dicts)
+users_table = User.__table__
+books_table = Book.__table__
+borrowings_table = Borrowing.__table__
+
+def _loan_counts(key: str):
+    """Total and active loans grouped by `key` ('user_id' or 'book_id'), archive included."""
+    history = union_all(
+        select(getattr(Borrowing, key).label('key'), Borrowing.status),
+        select(getattr(ArchivedBorrowing, key).label('key'), ArchivedBorrowing.status)
+    ).subquery()
+    return select(
+        history.c.key,
+        func.count().label('total'),
+        func.sum(case((history.c.status == 'borrowed', 1), else_=0)).label('active')
+    ).group_by(history.c.key).subquery()
+
+def _user_drift(db: Session) -> list[dict]:
+    """Users whose stored counters differ from their borrowings."""
+    loans = _loan_counts('user_id')
+    active = func.coalesce(loans.c.active, 0)
+    total = func.coalesce(loans.c.total, 0)
+    rows = db.execute(
+        select(User.id, User.active_loans, User.total_loans, active, total)
+        .outerjoin(loans, loans.c.key == User.id)
+        .where((User.active_loans != active) | (User.total_loans != total))
+    )
+    return [{'id': row[0], 'active_loans': [row[1], row[3]], 'total_loans': [row[2], row[4]]} for row in rows]
+
+def _book_drift(db: Session) -> list[dict]:
+    """Books whose lifetime loans or available copies differ from their borrowings."""
+    loans = _loan_counts('book_id')
+    total = func.coalesce(loans.c.total, 0)
+    available = func.max(0, Book.total_copies - func.coalesce(loans.c.active, 0))
+    rows = db.execute(
+        select(Book.id, Book.total_loans, Book.available_copies, total, available)
+        .outerjoin(loans, loans.c.key == Book.id)
+        .where((Book.total_loans != total) | (Book.available_copies != available))
+    )
+    return [{'id': row[0], 'total_loans': [row[1], row[3]], 'available_copies': [row[2], row[4]]} for row in rows]
+
+def reconcile_counters(db: Session, fix: bool = True) -> dict:
+    """Compares every counter with a bulk recount and, unless `fix` is False, corrects the drifted rows.
+
+    Drift entries map each counter to [stored, actual]. Returns the number of drifted
+    users and books plus up to MAX_REPORTED_DRIFT examples of each."""
+    users = _user_drift(db)
+    books = _book_drift(db)
+    changes = []
+    if fix and (users or books):
+        conn = db.connection()
+        if users:
+            conn.execute(
+                update(users_table).where(users_table.c.id == bindparam('b_id')).values(
+                    active_loans=bindparam('b_active'), total_loans=bindparam('b_total')
+                ),
+                [{'b_id': u['id'], 'b_active': u['active_loans'][1], 'b_total': u['total_loans'][1]} for u in users]
+            )
+        if books:
+            conn.execute(
+                update(books_table).where(books_table.c.id == bindparam('b_id')).values(
+                    total_loans=bindparam('b_total'), available_copies=bindparam('b_available')
+                ),
+                [{'b_id': b['id'], 'b_total': b['total_loans'][1], 'b_available': b['available_copies'][1]} for b in books]
+            )
+            # Repaired copies may be free while a waitlist exists
+            book_ids = [b['id'] for b in books]
+            for i in range(0, len(book_ids), SETTLE_CHUNK):
+                changes += settle_availability(db, book_ids[i:i + SETTLE_CHUNK])
+        touch_users(db)
+        db.commit()
+        catalog_cache.clear()
+        availability_bus.publish(changes)
+    return {
+        'fixed': fix,
+        'users_drifted': len(users),
+        'books_drifted': len(books),
+        'users': users[:MAX_REPORTED_DRIFT],
+        'books': books[:MAX_REPORTED_DRIFT],
+    }
+
+def close_duplicate_loans(db: Session) -> int:
+    """Closes all but the oldest active loan of every (user, book) pair, so that the
+    uq_borrowings_active_loan index can be built over legacy data; returns how many.
+
+    Each duplicate is recorded as returned the moment it was opened (so the circulation
+    rollups count a zero-length loan). Counters must be reconciled afterwards."""
+    oldest = select(func.min(Borrowing.id)).where(Borrowing.status == 'borrowed') \
+        .group_by(Borrowing.user_id, Borrowing.book_id)
+    duplicates = db.execute(
+        select(Borrowing.id, Borrowing.book_id, Borrowing.borrow_date)
+        .where(Borrowing.status == 'borrowed', Borrowing.id.not_in(oldest))
+    ).all()
+    if not duplicates:
+        return 0
+    db.connection().execute(
+        update(borrowings_table).where(borrowings_table.c.id == bindparam('b_id')).values(
+            status='returned', return_date=bindparam('b_date')
+        ),
+        [{'b_id': loan_id, 'b_date': borrow_date} for loan_id, _, borrow_date in duplicates]
+    )
+    for _, book_id, borrow_date in duplicates:
+        if borrow_date is not None:
+            record_returns(db, [(book_id, borrow_date)], borrow_date)
+    touch_users(db)
+    db.commit()
+    catalog_cache.clear()
+    return len(duplicates)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = reconcile_counters(db, fix=not args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if args.dry_run and (report['users_drifted'] or report['books_drifted']) else 0)
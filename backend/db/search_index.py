@@ -0,0 +1,114 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+# FTS5 external-content index over the searchable columns of `books`.
+# The triggers keep it in sync with every INSERT/UPDATE/DELETE on the base table,
+# so callers never have to touch the index directly.
+FTS_TABLE = "books_fts"
+
+# While this table holds a row the triggers do nothing. Bulk writers insert a row inside
+# their own transaction, re-index the touched books set-based (much faster than one FTS
+# write per row) and delete the row before committing, so no other connection ever sees
+# the triggers suspended.
+SUSPEND_TABLE = "books_fts_suspended"
+
+_TRIGGER_GUARD = f"WHEN NOT EXISTS (SELECT 1 FROM {SUSPEND_TABLE})"
+
+_CREATE_STATEMENTS = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, genre,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"CREATE TABLE IF NOT EXISTS {SUSPEND_TABLE} (suspended INTEGER)",
+    # Triggers are re-created on every start so existing databases pick up changes to them
+    "DROP TRIGGER IF EXISTS books_fts_ai",
+    "DROP TRIGGER IF EXISTS books_fts_ad",
+    "DROP TRIGGER IF EXISTS books_fts_au",
+    f"""
+    CREATE TRIGGER books_fts_ai AFTER INSERT ON books {_TRIGGER_GUARD} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END
+    """,
+    f"""
+    CREATE TRIGGER books_fts_ad AFTER DELETE ON books {_TRIGGER_GUARD} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+    END
+    """,
+    # Only re-index when a searchable column changes; availability updates skip it.
+    f"""
+    CREATE TRIGGER books_fts_au AFTER UPDATE OF title, author, genre ON books {_TRIGGER_GUARD} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.genre);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, genre)
+        VALUES (new.id, new.title, new.author, new.genre);
+    END
+    """,
+]
+
+def create_search_index(engine: Engine) -> bool:
+    """Creates the full-text search index and its sync triggers if missing.
+
+    Returns False when the database does not support FTS5 (callers then fall back
+    to plain LIKE searches)."""
+    if engine.dialect.name != "sqlite":
+        return False
+
+    with engine.begin() as conn:
+        existed = has_search_index(conn)
+        try:
+            for statement in _CREATE_STATEMENTS:
+                conn.execute(text(statement))
+        except Exception as e:
+            print(f"Full-text search unavailable, falling back to LIKE search: {e}")
+            return False
+
+        # Populate the index from rows that were inserted before it existed
+        if not existed:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+def has_search_index(conn: Connection) -> bool:
+    """True if the full-text index exists in the connected database."""
+    if conn.dialect.name != "sqlite":
+        return False
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE}
+    ).first() is not None
+
+### --- Bulk Maintenance --- ###
+# For use inside a single write transaction: suspend_sync, unindex_books (old values),
+# write, index_books (new values), resume_sync, commit.
+
+def suspend_sync(conn: Connection):
+    """Disables the sync triggers for the rest of the current transaction (until `resume_sync`)."""
+    conn.execute(text(f"INSERT INTO {SUSPEND_TABLE} (suspended) VALUES (1)"))
+
+def resume_sync(conn: Connection):
+    conn.execute(text(f"DELETE FROM {SUSPEND_TABLE}"))
+
+def unindex_books(conn: Connection, book_ids: list[int]):
+    """Removes books from the index using their current column values (call before changing them)."""
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, genre) "
+        f"SELECT 'delete', id, title, author, genre FROM books "
+        f"WHERE id IN (SELECT value FROM json_each(:ids))"
+    ), {"ids": _json_ids(book_ids)})
+
+def index_books(conn: Connection, book_ids: list[int]):
+    """Adds books to the index using their current column values."""
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, author, genre) "
+        f"SELECT id, title, author, genre FROM books "
+        f"WHERE id IN (SELECT value FROM json_each(:ids))"
+    ), {"ids": _json_ids(book_ids)})
+
+def _json_ids(book_ids: list[int]) -> str:
+    # Passing IDs as one JSON array avoids SQLite's bound-parameter limit
+    return "[" + ",".join(str(int(book_id)) for book_id in book_ids) + "]"
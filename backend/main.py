@@ -2,15 +2,21 @@ import os
 from flask import Flask
 from app.routes import auth, main, admin
 from app.api import api
+from app.jobs import start_job_runner
+from app.metrics import init_metrics
+from app.responses import init_compression
+from app.serialization import FastJSONProvider
 from db.init_db import init_db
-from db.database import SessionLocal
+from db.database import engine, SessionLocal, init_app as init_db_sessions
+from config import Config
 
 def create_app():
     """Application factory function."""
     app = Flask(__name__, template_folder='templates')
     
     # Configuration
-    app.config['SECRET_KEY'] = 'a-super-secret-key-for-session-management'
+    app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
     
     # Ensure the database is initialized
     db = SessionLocal()
@@ -19,6 +25,18 @@ def create_app():
     finally:
         db.close()
 
+    # Close each request's database session when its app context ends
+    init_db_sessions(app)
+
+    # Opt-in request/SQL instrumentation (LIBRARY_METRICS_ENABLED)
+    init_metrics(app, engine, SessionLocal)
+
+    # Compress large JSON/HTML/CSV responses (LIBRARY_COMPRESSION_ENABLED)
+    init_compression(app)
+
+    # Long admin operations run on the background job runner (/api/jobs)
+    start_job_runner()
+
     # Register Blueprints
     app.register_blueprint(auth)
     app.register_blueprint(main)